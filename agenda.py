@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from config import SmartClockConfig
+from ics_calendar import AgendaIndex, Calendars, Occurrence
+from widgets import LabelList, bold_font
+
+# An early wake-up is kept this long after its time, so the alarm's tick sees it whatever the refresh timing
+WAKEUP_GRACE = timedelta(minutes=1)
+
+
+def format_occurrence(occurrence: Occurrence, now: datetime) -> str:
+    start = max(occurrence.start, datetime.combine(now.date(), datetime.min.time())) if occurrence.all_day \
+        else occurrence.start
+    if occurrence.start <= now < occurrence.end and not occurrence.all_day:
+        day = "Now"
+    elif start.date() == now.date():
+        day = "Today"
+    elif start.date() == now.date() + timedelta(days=1):
+        day = "Tomorrow"
+    else:
+        day = start.strftime("%a %d %b")
+    when = "all day" if occurrence.all_day else f"{occurrence.start:%H:%M}-{occurrence.end:%H:%M}"
+    text = f"{day} {when}  {occurrence.summary}"
+    return f"{text} ({occurrence.location})" if occurrence.location else text
+
+
+class AgendaManager():
+    """
+    Agenda screen: the next events of the local calendars (see ics_calendar.py). When `wakeup_lead`
+    is set, the alarm also rings that long before the first event of a day if it is earlier than
+    the day's alarm.
+    """
+    def __init__(self, config: SmartClockConfig, agendaHeaderLabel, agendaLayout, alarm_manager):
+        self.calendars = Calendars(config.get_agenda_files(), config.get_agenda_days())
+        self.configured = bool(config.get_agenda_files())
+        self.max_events = config.get_agenda_max_events()
+        self.wakeup_lead = timedelta(minutes=config.get_agenda_wakeup_lead())
+        self.alarm_manager = alarm_manager
+        self.agendaHeaderLabel = agendaHeaderLabel
+        self.event_labels = LabelList(agendaLayout, bold_font('Times', 15))
+        self.index = AgendaIndex([])
+
+    def fetch(self) -> AgendaIndex:
+        """Read the calendars that changed (runs on a refresh thread)"""
+        return self.calendars.refresh()
+
+    def render(self, index: AgendaIndex):
+        """Display the next events, and arm the early wake-up"""
+        self.index = index
+        now = datetime.now()
+        if not self.configured:
+            texts = ["No calendar configured"]
+        else:
+            texts = [format_occurrence(occurrence, now) for occurrence in index.upcoming(now, self.max_events)]
+        self.event_labels.set_texts(texts or ["No upcoming events"])
+
+        header = "Agenda"
+        early = self.early_wakeup(now)
+        self.alarm_manager.set_early_alarm(early[0] if early is not None else None)
+        if early is not None:
+            wakeup, first = early
+            header += f" - early alarm {wakeup:%a %H:%M} for {first.summary}"
+        if self.agendaHeaderLabel.text() != header:
+            self.agendaHeaderLabel.setText(header)
+
+    def early_wakeup(self, now: datetime) -> Optional[Tuple[datetime, Occurrence]]:
+        """The next wake-up earlier than the alarm of its day, and the event it is for"""
+        if not self.wakeup_lead:
+            return None
+        for day in (now.date(), now.date() + timedelta(days=1)):
+            first = self.index.first_timed(day)
+            alarm = self.alarm_manager.first_alarm(day)
+            if first is None or alarm is None:
+                continue
+            wakeup = first.start - self.wakeup_lead
+            if wakeup.date() == day and wakeup.time() < alarm and wakeup > now - WAKEUP_GRACE:
+                return wakeup, first
+        return None
@@ -1,66 +1,17 @@
-import numpy as np
-import pyaudio
+from time import monotonic
 from config import SmartClockConfig
-from datetime import datetime, time
+from datetime import date, datetime, time
+from typing import Optional
 
+# Seconds between attempts to open the audio output for a due alarm, doubled after each failure:
+# opening it blocks the UI thread while the device does not answer
+RETRY_DELAY = 2.0
+MAX_RETRY_DELAY = 30.0
 
-class Beeper():
-    def __init__(self, volume: int):
-        # Audio parameters
-        self.sample_rate = 44100
-        self.frequency = 440  # Hz (A4 note)
-        self.volume = volume / 100.0
-        self.alarm_running = False
-        self.p = pyaudio.PyAudio()
-        self.current_time = 0
-
-
-    def generate_samples(self, duration):
-        """Generate audio samples for a given duration"""
-        samples_per_period = int(self.sample_rate / self.frequency)
-        num_samples = int(self.sample_rate * duration)
-        
-        t = np.linspace(self.current_time, self.current_time + duration, num_samples)
-        samples = np.sin(2 * np.pi * self.frequency * t)
-        samples *= np.sin(2 * np.pi * 2 * t)
-
-        samples = samples * self.volume
-        self.current_time += duration
-        
-        # Convert to 32-bit float
-        return samples.astype(np.float32)
-    
-    def audio_callback(self, in_data, frame_count, time_info, status):
-        """Callback for PyAudio stream"""
-        samples = self.generate_samples(frame_count / self.sample_rate)
-        return (samples, pyaudio.paContinue)
-
-    def start_alarm(self):
-        self.alarm_running = True
-        
-        # Open PyAudio stream
-        self.stream = self.p.open(
-            format=pyaudio.paFloat32,
-            channels=1,
-            rate=self.sample_rate,
-            output=True,
-            stream_callback=self.audio_callback,
-            frames_per_buffer=1024
-        )
-        
-        self.stream.start_stream()
-    
-    def stop_alarm(self):
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-            self.stream = None
-        
-        self.alarm_running = False
 
 class AlarmManager():
 
-    def __init__(self, config: SmartClockConfig):
+    def __init__(self, config: SmartClockConfig, get_audio):
         self.enabled = config.get_alarms_enabled()
         self.week_day_alarms = []
         for time in config.get_weekday_alarms():
@@ -69,8 +20,15 @@ class AlarmManager():
         for time in config.get_weekend_alarms():
             self.week_end_alarms.append(datetime.strptime(time, "%H:%M").time())
         self.alarm_ringing = False
-        self.beeper = Beeper(config.get_alarms_volume())
+        # an alarm is due but the audio output could not be opened, tried again at retry_at
+        self.alarm_pending = False
+        self.retry_delay = RETRY_DELAY
+        self.retry_at = 0.0
+        # the audio engine is created on first use (or after the first frame), numpy and PyAudio are slow to load
+        self.get_audio = get_audio
         self.last_alarm_check = datetime.now().time() 
+        # wake-up earlier than the alarm of its day, asked by the agenda for an early first event
+        self.early_alarm: Optional[datetime] = None
 
     def update_UI(self, weekday_widget, weekend_widget, enabled_widget):
         for time in self.week_day_alarms:
@@ -86,33 +44,52 @@ class AlarmManager():
             self.last_alarm_check = time(0, 0, 0)
         
         current_day = current_datetime.date()
-        started = False
+        started = self.alarm_pending and monotonic() >= self.retry_at and self.start_alarm()
         if current_day.weekday() < 5:
             list_to_check = self.week_day_alarms
         else:
             list_to_check = self.week_end_alarms
         for alarm_time in list_to_check:
-            if self.last_alarm_check < alarm_time <= current_time:
+            if not started and not self.alarm_pending and self.last_alarm_check < alarm_time <= current_time:
                 started = self.start_alarm()
                 break
+        early = self.early_alarm
+        if not started and not self.alarm_pending and early is not None and early.date() == current_day \
+                and self.last_alarm_check < early.time() <= current_time:
+            started = self.start_alarm()
         
         self.last_alarm_check = current_time
         return started
 
+    def first_alarm(self, day: date) -> Optional[time]:
+        """Time of the first alarm of `day`, None if it has none"""
+        return min(self.week_day_alarms if day.weekday() < 5 else self.week_end_alarms, default=None)
+
+    def set_early_alarm(self, when: Optional[datetime]):
+        self.early_alarm = when
+
     def update_enabled(self, enabled):
         self.enabled = enabled
+        if not enabled:
+            self.alarm_pending = False
 
     def stop_alarm(self):
+        self.alarm_pending = False
+        self.retry_delay = RETRY_DELAY
         if self.alarm_ringing:
             self.alarm_ringing = False
-            self.beeper.stop_alarm()
+            self.get_audio().stop_alarm()
 
     def start_alarm(self):
         if not self.alarm_ringing and self.enabled:
-            self.alarm_ringing = True
-            self.beeper.start_alarm()
+            audio = self.get_audio()
+            if audio is None or not audio.start_alarm():
+                if self.alarm_pending:
+                    self.retry_delay = min(self.retry_delay * 2, MAX_RETRY_DELAY)
+                self.alarm_pending = True
+                self.retry_at = monotonic() + self.retry_delay
+                return False
+            self.alarm_ringing, self.alarm_pending = True, False
+            self.retry_delay = RETRY_DELAY
             return True
         return False
-
-        
-
@@ -3,8 +3,9 @@ from typing import List, Dict
 from config import NewsSource
 
 class ApiNewsFetcher:
-    def __init__(self, config: NewsSource, page_size: int):
+    def __init__(self, config: NewsSource, page_size: int, timeout: tuple[float, float]):
         """Initialize NewsFetcher with your API key from NewsAPI.org"""
+        self.timeout = timeout
         self.api_key = config.api_key
         self.url = config.url
         self.params = dict(config.params)
@@ -24,7 +25,7 @@ class ApiNewsFetcher:
             page_size: Number of results to return (max 100)
         """
         
-        response = requests.get(self.url, headers=self.headers, params=self.params)
+        response = requests.get(self.url, headers=self.headers, params=self.params, timeout=self.timeout)
         response.raise_for_status()
         
         return response.json()["articles"]
\ No newline at end of file
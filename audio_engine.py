@@ -0,0 +1,132 @@
+"""
+The clock's only audio output: one PyAudio stream opened when the clock starts and kept open,
+playing the mix of the alarm tone and the radio (see mixer.py). The radio's VLC player hands
+its decoded samples over through `audio_set_callbacks` instead of opening a device of its own,
+so alarm and radio never compete for the sound card, and the radio is turned down while the
+alarm rings.
+"""
+import logging
+import time
+import ctypes
+import numpy as np
+import pyaudio
+from config import SmartClockConfig
+from mixer import Mixer, SAMPLE_RATE, CHANNELS
+
+log = logging.getLogger(__name__)
+
+# Share of a buffer's duration the callback may take, beyond it the output risks a gap
+CALLBACK_BUDGET = 0.5
+PCM_SCALE = np.float32(1 / 32768)
+
+
+class AudioEngine:
+    def __init__(self, config: SmartClockConfig):
+        self.frames_per_buffer = config.get_audio_buffer_frames()
+        self.mixer = Mixer(config.get_alarms_volume(), config.get_audio_volume(), config.get_audio_duck_volume())
+        self.budget = CALLBACK_BUDGET * self.frames_per_buffer / SAMPLE_RATE
+        self.callbacks = 0
+        self.late_callbacks = 0
+        # gaps reported by PortAudio: the callback did not deliver in time
+        self.underruns = 0
+        self.max_callback_time = 0.0
+        # the ctypes callbacks given to VLC must outlive the player
+        self.vlc_callbacks = None
+        self.p = pyaudio.PyAudio()
+        self.stream = None
+        self.open()
+
+    def open(self) -> bool:
+        """Open the output stream, or open it again if it stopped, False if the device is unavailable"""
+        if self.stream is not None and self.stream.is_active():
+            return True
+        self._close_stream()
+        try:
+            self.stream = self.p.open(
+                format=pyaudio.paFloat32,
+                channels=CHANNELS,
+                rate=SAMPLE_RATE,
+                output=True,
+                stream_callback=self._callback,
+                frames_per_buffer=self.frames_per_buffer
+            )
+        except Exception as e:
+            log.error("Could not open the audio output: %s", e)
+            return False
+        return True
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """Callback for PyAudio stream"""
+        start = time.perf_counter()
+        if status & pyaudio.paOutputUnderflow:
+            self.underruns += 1
+        samples = self.mixer.mix(frame_count).tobytes()
+        elapsed = time.perf_counter() - start
+        self.callbacks += 1
+        if elapsed > self.budget:
+            self.late_callbacks += 1
+        self.max_callback_time = max(self.max_callback_time, elapsed)
+        return (samples, pyaudio.paContinue)
+
+    def start_alarm(self) -> bool:
+        """Ring the alarm, False if the output cannot be opened"""
+        # the device may have gone away since the clock started (USB speaker, sound server restart)
+        if not self.open():
+            return False
+        self.mixer.tone.reset()
+        self.mixer.alarm_on = True
+        return True
+
+    def stop_alarm(self):
+        self.mixer.alarm_on = False
+
+    def set_master_volume(self, volume: int):
+        """Set the volume of everything (0-100)"""
+        self.mixer.master_volume = volume / 100.0
+
+    def get_master_volume(self) -> int:
+        return round(self.mixer.master_volume * 100)
+
+    def attach(self, player):
+        """Play a VLC media player through the engine, the radio volume is then applied by the mixer"""
+        import vlc
+
+        def play(data, samples, count, pts):
+            pcm = np.ctypeslib.as_array(ctypes.cast(samples, ctypes.POINTER(ctypes.c_int16)), shape=(count * CHANNELS,))
+            self.mixer.radio.write((pcm * PCM_SCALE).reshape(-1, CHANNELS))
+
+        def flush(data, pts):
+            self.mixer.radio.clear()
+
+        self.vlc_callbacks = (vlc.CallbackDecorators.AudioPlayCb(play), vlc.CallbackDecorators.AudioFlushCb(flush))
+        player.audio_set_callbacks(self.vlc_callbacks[0], None, None, self.vlc_callbacks[1], None, None)
+        player.audio_set_format("S16N", SAMPLE_RATE, CHANNELS)
+
+    def stats(self):
+        return {
+            "master_volume": self.get_master_volume(),
+            "alarm": self.mixer.alarm_on,
+            "radio": self.mixer.radio_on,
+            "stream_active": self.stream is not None and self.stream.is_active(),
+            "callbacks": self.callbacks,
+            "late_callbacks": self.late_callbacks,
+            "max_callback_ms": round(self.max_callback_time * 1000, 3),
+            "budget_ms": round(self.budget * 1000, 3),
+            "underruns": self.underruns,
+            "radio_underruns": self.mixer.radio_underruns,
+            "radio_dropped_frames": self.mixer.radio.dropped,
+        }
+
+    def _close_stream(self):
+        if self.stream is not None:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception as e:
+                log.warning("Could not close the audio output: %s", e)
+            self.stream = None
+
+    def close(self):
+        """Release PortAudio"""
+        self._close_stream()
+        self.p.terminate()
@@ -0,0 +1,29 @@
+import numpy as np
+
+
+class Beeper():
+    """Alarm tone: a 440 Hz sine, beeping four times a second"""
+    def __init__(self, volume: int, sample_rate: int = 44100):
+        # Audio parameters
+        self.sample_rate = sample_rate
+        self.frequency = 440  # Hz (A4 note)
+        self.volume = volume / 100.0
+        # samples generated since the alarm started, the tone repeats every second
+        self.position = 0
+        self.indices = np.arange(0, dtype=np.float64)
+
+    def reset(self):
+        """Start the tone from its beginning"""
+        self.position = 0
+
+    def generate_samples(self, frame_count: int) -> np.ndarray:
+        """Next `frame_count` samples of the tone (mono, 32-bit float)"""
+        if len(self.indices) < frame_count:
+            self.indices = np.arange(frame_count, dtype=np.float64)
+        t = (self.position + self.indices[:frame_count]) / self.sample_rate
+        samples = np.sin(2 * np.pi * self.frequency * t)
+        samples *= np.sin(2 * np.pi * 2 * t)
+        samples *= self.volume
+        # a whole number of periods of both sines fit in a second: wrapping keeps t small and exact
+        self.position = (self.position + frame_count) % self.sample_rate
+        return samples.astype(np.float32)
@@ -0,0 +1,434 @@
+"""
+Headless benchmarks for the clock's hot paths.
+
+Runs against the recorded fixtures in benchmarks/fixtures (no network, no display):
+
+    python3 benchmarks/run.py --output results.json
+    python3 benchmarks/run.py --baseline results.json --threshold 0.2
+
+With --baseline, the run fails (exit code 1) when the median of any benchmark is more
+than `threshold` slower than in the baseline file.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+from typing import Callable, Dict, List
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fixture_data import fixture_path, recorded_network
+
+
+def measure(fn: Callable, repeat: int, warmup: int = 3) -> Dict:
+    """Time `fn` `repeat` times, returns statistics in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return summarize(timings)
+
+
+def summarize(timings: List[float]) -> Dict:
+    ordered = sorted(timings)
+    return {
+        "runs": len(ordered),
+        "min_ms": ordered[0],
+        "median_ms": statistics.median(ordered),
+        "mean_ms": statistics.fmean(ordered),
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max_ms": ordered[-1],
+    }
+
+
+def load_config():
+    from config import SmartClockConfig
+    return SmartClockConfig(fixture_path("config.toml"))
+
+
+def flush_deleted_widgets():
+    from PyQt5.QtCore import QCoreApplication, QEvent
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+
+
+def bench_tick(repeat: int) -> Dict:
+    """Clock update of a window with every subsystem created (radio status included), as once started"""
+    import main
+    with recorded_network():
+        main.SmartClockConfig = lambda path: load_config()
+        window = main.SmartClock()
+        # created after the first frame by the event loop, which does not run here (no remote control server)
+        for name in window.subsystem_factories:
+            if name != "server":
+                try:
+                    window._get_subsystem(name)
+                except main.SubsystemUnavailable:
+                    # left out, as by the clock (e.g. no audio device)
+                    pass
+    return measure(window._update_components, repeat)
+
+
+def bench_trains(repeat: int) -> Dict:
+    from PyQt5 import QtWidgets
+    from trains import TrainManager
+    with recorded_network():
+        container = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout(container)
+        manager = TrainManager(load_config(), QtWidgets.QLabel(), layout)
+
+        def run():
+            manager.update_train_status()
+            flush_deleted_widgets()
+
+        return measure(run, repeat)
+
+
+def bench_train_history(repeat: int) -> Dict:
+    """Usual delay of a service after a year of departures (150 services a day)"""
+    import random
+    from train_history import DepartureHistory, MAX_DELAY
+    history = DepartureHistory(":memory:")
+    rng = random.Random(42)
+    start = time.time() - 365 * 86400
+    departed = []
+    for day in range(365):
+        for minute in range(5 * 60, 24 * 60, 7):
+            std = f"{minute // 60:02d}:{minute % 60:02d}"
+            departed.append((f"{day}-{minute}", start + day * 86400 + minute * 60, f"CLJ {std} London Waterloo",
+                             min(int(rng.expovariate(0.3)), MAX_DELAY)))
+    with history.lock, history.db:
+        history._count(departed)
+    # 07:41 is one of the services above, the lookup finds its delays
+    assert history.usual_delay("CLJ", "07:41", "London Waterloo", 5) is not None
+    return measure(lambda: history.usual_delay("CLJ", "07:41", "London Waterloo", 5), repeat)
+
+
+def bench_journeys(repeat: int) -> Dict:
+    """Boards and connections of three saved journeys (one with a change)"""
+    from journeys import JourneyPlanner
+    from fixture_data import FixtureTrainGetter
+    config = load_config()
+    config.config["trains"]["journeys"] = [
+        {"name": "Office", "legs": [{"from": "WIM", "to": "CLJ"}, {"from": "CLJ", "to": "WAT", "min_connection": 4}]},
+        {"name": "Direct", "legs": [{"from": "CLJ", "to": "WAT"}]},
+        {"name": "Shopping", "legs": [{"from": "WIM", "to": "WAT"}]},
+    ]
+    planner = JourneyPlanner(config, FixtureTrainGetter(config))
+    return measure(planner.fetch, repeat)
+
+
+def bench_rss(repeat: int) -> Dict:
+    from rss_news_reader import RssNewsFetcher
+    config = load_config()
+    source = next(s for s in config.get_news_sources() if s.type == "rss")
+    fetcher = RssNewsFetcher(source, config.get_network_timeouts())
+    with recorded_network():
+        return measure(fetcher.get_top_headlines, repeat)
+
+
+def bench_news_archive(repeat: int) -> Dict:
+    """Recording 20 headlines (5 new) and a search, in an archive of a month of headlines"""
+    import random
+    from news_archive import HeadlineArchive
+    archive = HeadlineArchive(":memory:", 30)
+    rng = random.Random(42)
+    words = ["storm", "minister", "energy", "prices", "court", "school", "election", "police", "climate", "tech"]
+
+    def headline(n):
+        return {"title": " ".join(rng.choice(words) for _ in range(8)) + f" {n}", "url": f"https://news.example/{n}"}
+
+    for n in range(0, 30 * 24 * 20, 20):
+        archive.record("BBC News", [headline(n + i) for i in range(20)])
+    batch = [headline(n) for n in range(30 * 24 * 20 - 15, 30 * 24 * 20 + 5)]
+
+    def run():
+        archive.record("BBC News", batch)
+        archive.search("storm pri", 30)
+
+    return measure(run, repeat)
+
+
+def bench_station_search(repeat: int) -> Dict:
+    """A prefix, a substring and a misspelt search, and a page of the list, in a catalogue of 5000 stations"""
+    import random
+    from station_catalogue import StationCatalogue, parse_m3u
+    catalogue = StationCatalogue(":memory:")
+    rng = random.Random(42)
+    words = ["radio", "jazz", "classic", "rock", "news", "talk", "country", "hits", "smooth", "dance", "soul", "chill"]
+    lines = ["#EXTM3U"]
+    for n in range(5000):
+        name = " ".join(rng.choice(words).title() for _ in range(3))
+        lines += [f'#EXTINF:-1 group-title="{rng.choice(words)}" tvg-country="UK" bitrate="128",{name} {n}',
+                  f"http://stream.example/{n}"]
+    with catalogue.lock, catalogue.db:
+        catalogue._upsert(parse_m3u("\n".join(lines)), "bench.m3u")
+
+    def run():
+        catalogue.search("jaz", 50)
+        catalogue.search("rock 12", 50)
+        catalogue.search("smoth chil", 50)
+        catalogue.page("1m", 100)
+
+    return measure(run, repeat)
+
+
+def write_calendar(path: str):
+    """A year of a busy family calendar: 2000 single events and 200 recurring ones (with exceptions)"""
+    import random
+    from datetime import datetime, timedelta
+    rng = random.Random(42)
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=180)
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0"]
+    for n in range(2000):
+        begin = start + timedelta(days=rng.randrange(365), minutes=rng.randrange(6 * 60, 21 * 60, 15))
+        lines += ["BEGIN:VEVENT", f"UID:single-{n}", f"SUMMARY:Event {n}",
+                  f"DTSTART;TZID=Europe/London:{begin:%Y%m%dT%H%M%S}", "DURATION:PT1H", "END:VEVENT"]
+    for n in range(200):
+        begin = start + timedelta(days=rng.randrange(30), minutes=rng.randrange(6 * 60, 21 * 60, 15))
+        rule = rng.choice(["FREQ=DAILY", "FREQ=WEEKLY;BYDAY=MO,WE,FR", "FREQ=WEEKLY", "FREQ=MONTHLY;BYMONTHDAY=1,15"])
+        exdate = begin + timedelta(days=7 * rng.randrange(1, 20))
+        lines += ["BEGIN:VEVENT", f"UID:recurring-{n}", f"SUMMARY:Recurring {n}",
+                  f"DTSTART;TZID=Europe/London:{begin:%Y%m%dT%H%M%S}", "DURATION:PT30M", f"RRULE:{rule}",
+                  f"EXDATE;TZID=Europe/London:{exdate:%Y%m%dT%H%M%S}", "END:VEVENT"]
+    lines.append("END:VCALENDAR")
+    with open(path, "w") as f:
+        f.write("\r\n".join(lines))
+
+
+def bench_agenda_parse(repeat: int) -> Dict:
+    """Parsing and expansion of a big calendar over two weeks, as when the file changed (refresh thread)"""
+    import tempfile
+    from ics_calendar import Calendars
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "family.ics")
+        write_calendar(path)
+        return measure(lambda: Calendars([path], 14).refresh(), repeat)
+
+
+def bench_agenda(repeat: int) -> Dict:
+    """Refresh of an unchanged big calendar and the next events, what the agenda costs every minute"""
+    import tempfile
+    from datetime import datetime
+    from ics_calendar import Calendars
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "family.ics")
+        write_calendar(path)
+        calendars = Calendars([path], 14)
+        calendars.refresh()
+
+        def run():
+            now = datetime.now()
+            index = calendars.refresh(now)
+            index.upcoming(now, 8)
+            index.first_timed(now.date())
+
+        return measure(run, repeat)
+
+
+def bench_weather(repeat: int) -> Dict:
+    from weather_widget import WeatherWidget
+    widget = WeatherWidget(load_config())
+    with recorded_network():
+        return measure(widget.fetch_weather, repeat)
+
+
+def bench_forecast(repeat: int) -> Dict:
+    """Parsing of the 40 forecasts into arrays, hourly strip and daily summary"""
+    from weather_widget import WeatherFetcher, Forecast
+    with recorded_network():
+        weather = WeatherFetcher(load_config()).fetch()
+
+    def run():
+        forecast = Forecast(weather)
+        forecast.hourly(10)
+        forecast.days(5)
+
+    return measure(run, repeat)
+
+
+def bench_snapshot_hydrate(repeat: int) -> Dict:
+    """Opening the snapshots of trains, news and weather and reading them back, as at start-up"""
+    import tempfile
+    from snapshots import SnapshotStore
+    from fixture_data import FixtureTrainGetter
+    from rss_news_reader import RssNewsFetcher
+    from weather_widget import WeatherFetcher
+    config = load_config()
+    source = next(s for s in config.get_news_sources() if s.type == "rss")
+    with recorded_network():
+        results = {
+            "trains": FixtureTrainGetter(config).get_board("CLJ"),
+            "news": [source.name, RssNewsFetcher(source, config.get_network_timeouts()).get_top_headlines()],
+            "weather": WeatherFetcher(config).fetch(),
+        }
+    with tempfile.TemporaryDirectory() as directory:
+        config.config["snapshots"] = {"file": os.path.join(directory, "snapshots.bin")}
+        store = SnapshotStore(config)
+        for name, data in results.items():
+            store.save(name, data)
+        store.close()
+
+        def run():
+            store = SnapshotStore(config)
+            for name in results:
+                store.get(name)
+            store.close()
+
+        return measure(run, repeat)
+
+
+def bench_beeper(repeat: int) -> Dict:
+    from beeper import Beeper
+    beeper = Beeper(50)
+    # one PortAudio callback worth of samples
+    return measure(lambda: beeper.generate_samples(1024), repeat)
+
+
+def bench_audio_mix(repeat: int) -> Dict:
+    """One output buffer with the alarm ringing over the radio (ducking ramp included)"""
+    import numpy as np
+    from mixer import Mixer, CHANNELS
+    mixer = Mixer(50, 100, 20)
+    mixer.start_radio()
+    mixer.alarm_on = True
+    pcm = np.random.default_rng(0).uniform(-0.5, 0.5, (1024, CHANNELS)).astype(np.float32)
+
+    def run():
+        mixer.radio.write(pcm)
+        mixer.mix(1024)
+
+    return measure(run, repeat)
+
+
+def bench_first_frame(repeat: int) -> Dict:
+    """Time-to-first-frame of main(), each run in a fresh interpreter"""
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--first-frame-child"],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout
+        timings.append(json.loads(output.strip().splitlines()[-1])["first_frame_ms"])
+    return summarize(timings)
+
+
+def first_frame_child():
+    """Runs main() until the main window paints for the first time, then prints the elapsed time"""
+    start = time.perf_counter()
+    import main
+    from PyQt5 import QtWidgets
+
+    class FirstFrameClock(main.SmartClock):
+        painted = False
+
+        def paintEvent(self, event):
+            super().paintEvent(event)
+            if not self.painted:
+                self.painted = True
+                print(json.dumps({"first_frame_ms": (time.perf_counter() - start) * 1000.0}), flush=True)
+                QtWidgets.QApplication.instance().quit()
+
+    main.SmartClock = FirstFrameClock
+    main.SmartClockConfig = lambda path: load_config()
+    import server
+    server.start_server = lambda window: None
+    with recorded_network():
+        try:
+            main.main()
+        except SystemExit:
+            pass
+
+
+BENCHMARKS = {
+    "tick": (bench_tick, 1000),
+    "trains_update": (bench_trains, 50),
+    "train_history_stats": (bench_train_history, 1000),
+    "journeys": (bench_journeys, 100),
+    "rss_parse": (bench_rss, 200),
+    "news_archive": (bench_news_archive, 200),
+    "station_search": (bench_station_search, 200),
+    "agenda": (bench_agenda, 1000),
+    "agenda_parse": (bench_agenda_parse, 10),
+    "weather_fetch": (bench_weather, 50),
+    "forecast_summary": (bench_forecast, 500),
+    "snapshot_hydrate": (bench_snapshot_hydrate, 500),
+    "beeper_callback": (bench_beeper, 2000),
+    "audio_mix": (bench_audio_mix, 2000),
+    "main_first_frame": (bench_first_frame, 3),
+}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """List of benchmarks whose median regressed by more than `threshold` (0.2 = 20%)"""
+    regressions = []
+    for name, stats in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        ratio = stats["median_ms"] / previous["median_ms"] if previous["median_ms"] > 0 else 1.0
+        if ratio > 1.0 + threshold:
+            regressions.append(f"{name}: {previous['median_ms']:.3f}ms -> {stats['median_ms']:.3f}ms (+{(ratio - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless JbClock benchmarks")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed median slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the number of runs")
+    parser.add_argument("--first-frame-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.chdir(REPO_DIR)
+    if args.first_frame_child:
+        first_frame_child()
+        return
+
+    from PyQt5 import QtWidgets
+    app = QtWidgets.QApplication(sys.argv)
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        bench, repeat = BENCHMARKS[name]
+        results[name] = bench(max(1, int(repeat * args.scale)))
+        print(f"{name:20s} median {results[name]['median_ms']:9.3f}ms  p95 {results[name]['p95_ms']:9.3f}ms", flush=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "node": platform.node(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Soak test: runs the clock headless for a long time against the provider simulator, with the
+refresh timers accelerated, and samples its memory to catch leaks before a clock that runs
+for weeks does:
+
+    python3 benchmarks/soak.py --duration 3600 --output soak.json
+
+Every `interval` seconds it records the resident set size, the Python heap (tracemalloc)
+and the number of Qt widgets and objects. The run fails (exit code 1) when, after the
+warmup, any of them grew by more than its threshold between the first and last quarter
+of the samples.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from typing import Dict, List
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import tomli
+import tomli_w
+from fixture_data import FIXTURES_DIR, fixture_path
+
+# Subsystems the soak does not create: audio needs a sound card and does not refresh,
+# the remote control server would take the clock's port
+SKIPPED_SUBSYSTEMS = ("audio", "radio", "server")
+
+# name of the sample -> command line option of its threshold
+METRICS = {
+    "rss_mb": "max_rss_growth_mb",
+    "heap_mb": "max_heap_growth_mb",
+    "widgets": "max_widget_growth",
+    "qobjects": "max_object_growth",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_config(directory: str, port: int) -> str:
+    """Fixture configuration pointed at the simulator, without rate limits in the way"""
+    with open(fixture_path("config.toml"), "rb") as f:
+        config = tomli.load(f)
+    config["simulator"] = {"enabled": True, "url": f"http://127.0.0.1:{port}"}
+    config["news"]["thumbnail_cache"] = os.path.join(directory, "thumbnails")
+    config["agenda"] = {"files": [fixture_path("calendar.ics")]}
+    config["logging"] = {"file": os.path.join(directory, "clock.log")}
+    config["snapshots"] = {"file": os.path.join(directory, "snapshots.bin")}
+    config["watchdog"] = {"enabled": True, "state_file": os.path.join(directory, "clock_state.json")}
+    config["scheduler"] = {
+        "jitter": 0,
+        "rate_limits": {provider: {"per_minute": 100000, "burst": 100}
+                        for provider in ("trains", "newsapi", "rss", "weather")},
+    }
+    path = os.path.join(directory, "config.toml")
+    with open(path, "wb") as f:
+        tomli_w.dump(config, f)
+    return path
+
+
+def start_simulator(config_path: str, port: int) -> subprocess.Popen:
+    simulator = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, "simulator.py"), "--config", config_path,
+         "--port", str(port), "--fixtures", FIXTURES_DIR],
+        cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return simulator
+        except OSError:
+            time.sleep(0.1)
+    simulator.kill()
+    raise RuntimeError("simulator did not start")
+
+
+def rss_mb() -> float:
+    """Current resident set size of the process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        import resource
+        # peak rather than current outside Linux, still good enough to see a leak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def sample(app, window, start: float) -> Dict:
+    from PyQt5.QtCore import QObject
+    return {
+        "t": round(time.monotonic() - start, 1),
+        "rss_mb": rss_mb(),
+        "heap_mb": tracemalloc.get_traced_memory()[0] / 2 ** 20,
+        "widgets": len(app.allWidgets()),
+        "qobjects": len(window.findChildren(QObject)),
+    }
+
+
+def growth(samples: List[Dict], metric: str) -> float:
+    """Mean of the last quarter of the samples minus mean of the first quarter"""
+    quarter = max(1, len(samples) // 4)
+    first = sum(s[metric] for s in samples[:quarter]) / quarter
+    last = sum(s[metric] for s in samples[-quarter:]) / quarter
+    return last - first
+
+
+def run(args) -> Dict:
+    from PyQt5 import QtWidgets
+    from PyQt5.QtCore import QTimer
+    import main
+
+    tracemalloc.start()
+    app = QtWidgets.QApplication(sys.argv[:1])
+    window = main.SmartClock()
+    window.pending_subsystems = [name for name in window.pending_subsystems if name not in SKIPPED_SUBSYSTEMS]
+    for name in ("trains", "news", "weather", "agenda"):
+        window._get_subsystem(name)
+    for job in window.scheduler.jobs.values():
+        job.interval = args.refresh
+    window.show()
+
+    # Walk through the screens like a user would, so every render path is exercised
+    actions = [window._set_trains, window._set_news, window._next_news_source,
+               window._set_weather, window._next_news_source, window._set_agenda, window._set_clock]
+    step = [0]
+
+    def next_action():
+        actions[step[0] % len(actions)]()
+        step[0] += 1
+
+    screen_timer = QTimer()
+    screen_timer.timeout.connect(next_action)
+    screen_timer.start(int(args.screen_interval * 1000))
+
+    start = time.monotonic()
+    samples = []
+
+    def take_sample():
+        samples.append(sample(app, window, start))
+        if args.verbose:
+            print(json.dumps(samples[-1]), flush=True)
+        if time.monotonic() - start >= args.duration:
+            app.quit()
+
+    sample_timer = QTimer()
+    sample_timer.timeout.connect(take_sample)
+    sample_timer.start(int(args.interval * 1000))
+    app.exec_()
+    window.scheduler.shutdown()
+
+    measured = [s for s in samples if s["t"] >= args.warmup]
+    report = {"duration": args.duration, "samples": samples, "growth": {}, "failures": []}
+    if len(measured) < 2:
+        report["failures"].append("not enough samples after warmup, increase --duration")
+        return report
+    for metric, option in METRICS.items():
+        grown = growth(measured, metric)
+        report["growth"][metric] = grown
+        if grown > getattr(args, option):
+            report["failures"].append(f"{metric} grew by {grown:.2f} (limit {getattr(args, option)})")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless JbClock soak test")
+    parser.add_argument("--duration", type=float, default=600, help="seconds to run")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between two samples")
+    parser.add_argument("--warmup", type=float, default=60, help="seconds ignored before measuring growth")
+    parser.add_argument("--refresh", type=float, default=1, help="seconds between two refreshes of each provider")
+    parser.add_argument("--screen-interval", type=float, default=2, help="seconds between two screen changes")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=20)
+    parser.add_argument("--max-heap-growth-mb", type=float, default=5)
+    parser.add_argument("--max-widget-growth", type=float, default=10)
+    parser.add_argument("--max-object-growth", type=float, default=50)
+    parser.add_argument("--output", help="write the samples and the verdict as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="print every sample")
+    args = parser.parse_args()
+
+    os.chdir(REPO_DIR)
+    with tempfile.TemporaryDirectory() as directory:
+        port = free_port()
+        config_path = write_config(directory, port)
+        import main as clock
+        from config import SmartClockConfig
+        clock.SmartClockConfig = lambda path: SmartClockConfig(config_path)
+        simulator = start_simulator(config_path, port)
+        try:
+            report = run(args)
+        finally:
+            simulator.terminate()
+            simulator.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    for metric, grown in report["growth"].items():
+        print(f"{metric:10s} {grown:+10.2f}")
+    for failure in report["failures"]:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if report["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+
+class LruCache:
+    """
+    Thread safe cache holding at most `maxsize` entries, the least recently used is evicted first.
+    With `ttl` (seconds), entries older than that are treated as missing.
+    """
+    def __init__(self, maxsize: int, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and self.clock() - stored_at >= self.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            if self._expired(entry[1]):
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        with self.lock:
+            self.entries[key] = (value, self.clock())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Copy of the (key, value) pairs that have not expired, least recently used first"""
+        with self.lock:
+            return [(key, value) for key, (value, stored_at) in self.entries.items() if not self._expired(stored_at)]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Membership test, without refreshing the entry's recency"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and not self._expired(entry[1])
+
+    def __len__(self) -> int:
+        return len(self.entries)
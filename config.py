@@ -3,6 +3,28 @@ import tomli_w
 from typing import List, Dict, Union, Optional
 from dataclasses import dataclass
 from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit
+
+TRAIN_WSDL = 'http://lite.realtime.nationalrail.co.uk/OpenLDBWS/wsdl.aspx?ver=2021-11-01'
+WEATHER_URL = 'http://api.openweathermap.org/data/2.5'
+
+# Requests allowed per provider: (requests, per seconds, burst)
+DEFAULT_RATE_LIMITS = {
+    "trains": (300, 3600, 10),
+    "newsapi": (100, 86400, 5),
+    "rss": (60, 3600, 5),
+    "weather": (30, 60, 5),
+}
+RATE_LIMIT_PERIODS = {"per_minute": 60, "per_hour": 3600, "per_day": 86400}
+
+# Minutes needed to change trains when a journey leg does not say
+DEFAULT_MIN_CONNECTION = 5
+
+# Seconds a hub serves a snapshot before fetching it again
+DEFAULT_HUB_TTL = {"trains": 60, "news": 600, "weather": 600}
+
+# Minutes the last data of a provider is shown after a restart, until it is refreshed
+DEFAULT_SNAPSHOT_MAX_AGE = {"trains": 120, "journeys": 120, "news": 1440, "weather": 720}
 
 @dataclass
 class RadioStream:
@@ -17,6 +39,17 @@ class NewsSource:
     api_key: Optional[str] = None
     params: Optional[Dict] = None
 
+@dataclass
+class JourneyLeg:
+    origin: str
+    destination: str
+    min_connection: int = DEFAULT_MIN_CONNECTION
+
+@dataclass
+class Journey:
+    name: str
+    legs: List[JourneyLeg]
+
 class SmartClockConfig:
     def __init__(self, config_path: str):
         """Initialize the configuration manager with the path to the TOML file."""
@@ -130,6 +163,19 @@ class SmartClockConfig:
         """Set the alarm volume."""
         self.config["alarms"]["volume"] = int
 
+    # Audio Methods
+    def get_audio_volume(self) -> int:
+        """Get the master volume (0-100) applied to everything the clock plays."""
+        return self.config.get("audio", {}).get("volume", 100)
+
+    def get_audio_duck_volume(self) -> int:
+        """Get the radio volume (percent of its own) while the alarm rings."""
+        return self.config.get("audio", {}).get("duck_volume", 20)
+
+    def get_audio_buffer_frames(self) -> int:
+        """Get the number of frames of each buffer of the audio output."""
+        return self.config.get("audio", {}).get("buffer_frames", 1024)
+
     # Radio Methods
     def get_radio_volume(self) -> int:
         """Get the default radio volume."""
@@ -145,6 +191,14 @@ class SmartClockConfig:
         """Get list of radio streams."""
         return [RadioStream(**stream) for stream in self.config["radio"]["streams"]]
 
+    def get_radio_catalogue_file(self) -> str:
+        """Get the SQLite file of the station catalogue."""
+        return self.config["radio"].get("catalogue_file", "radio_stations.db")
+
+    def get_radio_playlists(self) -> List[str]:
+        """Get the M3U/PLS playlists (glob patterns) imported into the station catalogue."""
+        return self.config["radio"].get("playlists", [])
+
     def add_radio_stream(self, name: str, uri: str) -> None:
         """Add a new radio stream."""
         self.config["radio"]["streams"].append({"name": name, "uri": uri})
@@ -159,7 +213,10 @@ class SmartClockConfig:
     # News Methods
     def get_news_sources(self) -> List[NewsSource]:
         """Get list of news sources."""
-        return [NewsSource(**source) for source in self.config["news"]["sources"]]
+        sources = [NewsSource(**source) for source in self.config["news"]["sources"]]
+        for source in sources:
+            source.url = self._simulated(source.url)
+        return sources
 
     def add_news_source(self, source: NewsSource) -> None:
         """Add a new news source."""
@@ -191,6 +248,30 @@ class SmartClockConfig:
             raise ValueError("Update interval must be at least 1 minute")
         self.config["news"]["update_interval"] = interval
 
+    def get_thumbnails_enabled(self) -> bool:
+        """Get whether headlines are shown with their thumbnail."""
+        return self.config["news"].get("thumbnails", True)
+
+    def get_thumbnail_cache_dir(self) -> str:
+        """Get the directory where thumbnails are cached."""
+        return self.config["news"].get("thumbnail_cache", "thumbnails")
+
+    def get_thumbnail_cache_size(self) -> int:
+        """Get the maximum size (MB) of the thumbnail cache."""
+        return self.config["news"].get("thumbnail_cache_mb", 20)
+
+    def get_thumbnail_url(self, url: str) -> str:
+        """Get the URL a news thumbnail is downloaded from."""
+        return self._simulated(url)
+
+    def get_news_archive_file(self) -> Optional[str]:
+        """Get the SQLite file the headlines are archived in ("" disables the archive)."""
+        return self.config["news"].get("archive_file", "news_archive.db")
+
+    def get_news_archive_days(self) -> float:
+        """Get how many days a headline is kept after it was last seen."""
+        return self.config["news"].get("archive_days", 30)
+
     def get_max_stories(self) -> int:
         """Get maximum number of news stories."""
         return self.config["news"]["max_stories"]
@@ -222,6 +303,38 @@ class SmartClockConfig:
         """Set transport API key."""
         self.config["trains"]["api_key"] = api_key
 
+    def get_train_history_file(self) -> Optional[str]:
+        """Get the departure history database, None if the history is disabled."""
+        return self.config["trains"].get("history_file", "train_history.db") or None
+
+    def get_train_history_min_samples(self) -> int:
+        """Get the number of departures needed before showing a service's usual delay."""
+        return self.config["trains"].get("history_min_samples", 5)
+
+    def get_train_details_ttl(self) -> float:
+        """Get how long (seconds) the calling points of a service are cached."""
+        return self.config["trains"].get("details_ttl", 120)
+
+    def get_train_details_prefetch(self) -> int:
+        """Get the number of departures whose details are fetched with the board."""
+        return self.config["trains"].get("details_prefetch", 3)
+
+    def get_train_journeys(self) -> List[Journey]:
+        """Get the saved journeys, each a list of legs between two stations (CRS codes)."""
+        return [Journey(journey["name"], [JourneyLeg(leg["from"], leg["to"], leg.get("min_connection", DEFAULT_MIN_CONNECTION))
+                                          for leg in journey["legs"]])
+                for journey in self.config["trains"].get("journeys", [])]
+
+    def get_train_journey_budget(self) -> float:
+        """Get the time (seconds) allowed to fetch the boards of every journey."""
+        return self.config["trains"].get("journey_budget", 20.0)
+
+    def get_train_wsdl(self) -> str:
+        """Get the OpenLDBWS WSDL location."""
+        if self.get_simulator_enabled():
+            return self._simulated("/OpenLDBWS/wsdl.aspx")
+        return self.config["trains"].get("wsdl", TRAIN_WSDL)
+
     def get_weather_location(self) -> str:
         """Get weather location."""
         return self.config["weather"]["location"]
@@ -238,6 +351,150 @@ class SmartClockConfig:
         """Set weather API key."""
         self.config["weather"]["api_key"] = api_key
 
+    def get_weather_url(self) -> str:
+        """Get the base URL of the OpenWeatherMap API."""
+        return self._simulated(self.config["weather"].get("url", WEATHER_URL))
+
+    # Agenda Methods
+    def get_agenda_files(self) -> List[str]:
+        """Get the iCalendar files (glob patterns) shown on the agenda screen."""
+        return self.config.get("agenda", {}).get("files", [])
+
+    def get_agenda_days(self) -> int:
+        """Get how many days ahead the agenda looks."""
+        return self.config.get("agenda", {}).get("days", 14)
+
+    def get_agenda_max_events(self) -> int:
+        """Get the number of events shown on the agenda screen."""
+        return self.config.get("agenda", {}).get("max_events", 8)
+
+    def get_agenda_wakeup_lead(self) -> int:
+        """Get the minutes before the first event of a day the alarm rings, when earlier than its alarm (0 disables)."""
+        return self.config.get("agenda", {}).get("wakeup_lead", 0)
+
+    # Refresh scheduler Methods
+    def get_refresh_jitter(self) -> float:
+        """Get the random variation applied to refresh intervals (0.1 = +/-10%)."""
+        return self.config.get("scheduler", {}).get("jitter", 0.1)
+
+    def get_refresh_workers(self) -> int:
+        """Get the number of threads fetching provider data."""
+        return self.config.get("scheduler", {}).get("workers", 2)
+
+    def get_rate_limit(self, provider: str) -> tuple[float, int]:
+        """Get the allowed request rate (per second) and burst size of a provider."""
+        requests, period, burst = DEFAULT_RATE_LIMITS.get(provider, (60, 60, 5))
+        settings = self.config.get("scheduler", {}).get("rate_limits", {}).get(provider, {})
+        for name, seconds in RATE_LIMIT_PERIODS.items():
+            if name in settings:
+                requests, period = settings[name], seconds
+        return requests / period, settings.get("burst", burst)
+
+    # Network Methods
+    def get_network_timeouts(self) -> tuple[float, float]:
+        """Get the connect and read timeouts (seconds) of every outbound call."""
+        network = self.config.get("network", {})
+        return network.get("connect_timeout", 5.0), network.get("read_timeout", 15.0)
+
+    def get_breaker_settings(self) -> tuple[int, float]:
+        """Get the failures before a provider's circuit breaker opens, and seconds before it is retried."""
+        network = self.config.get("network", {})
+        return network.get("breaker_failures", 3), network.get("breaker_reset", 300.0)
+
+    # Logging Methods
+    def get_log_file(self) -> str:
+        """Get the log file, rotated when it gets too big ("" logs to stderr)."""
+        return self.config.get("logging", {}).get("file", "clock.log")
+
+    def get_log_max_size(self) -> int:
+        """Get the size (KB) at which the log file is rotated."""
+        return self.config.get("logging", {}).get("max_kb", 1024)
+
+    def get_log_backups(self) -> int:
+        """Get the number of rotated log files kept."""
+        return self.config.get("logging", {}).get("backups", 5)
+
+    def get_log_level(self) -> str:
+        """Get the minimum level of the records logged (DEBUG, INFO, WARNING, ERROR)."""
+        return self.config.get("logging", {}).get("level", "INFO").upper()
+
+    def get_log_buffer_size(self) -> int:
+        """Get the number of recent records kept in memory for /api/logs."""
+        return self.config.get("logging", {}).get("buffer", 1000)
+
+    # Watchdog Methods
+    def get_watchdog_enabled(self) -> bool:
+        """Check if the UI thread is watched for stalls."""
+        return self.config.get("watchdog", {}).get("enabled", True)
+
+    def get_watchdog_stall_seconds(self) -> float:
+        """Get the seconds without heartbeat after which the UI thread is reported stalled."""
+        return self.config.get("watchdog", {}).get("stall_seconds", 5)
+
+    def get_watchdog_restart_seconds(self) -> float:
+        """Get the seconds without heartbeat after which the clock is restarted."""
+        return self.config.get("watchdog", {}).get("restart_seconds", 60)
+
+    def get_state_file(self) -> str:
+        """Get the file the clock saves its state to, to resume from after a restart."""
+        return self.config.get("watchdog", {}).get("state_file", "clock_state.json")
+
+    # Snapshot Methods
+    def get_snapshot_file(self) -> str:
+        """Get the file keeping the last data of each provider across restarts ("" to disable)."""
+        return self.config.get("snapshots", {}).get("file", "snapshots.bin")
+
+    def get_snapshot_max_age(self, name: str) -> float:
+        """Get the minutes the last data of a provider is shown after a restart."""
+        return self.config.get("snapshots", {}).get("max_age", {}).get(name, DEFAULT_SNAPSHOT_MAX_AGE.get(name, 60))
+
+    # Hub Methods
+    def get_hub_mode(self) -> str:
+        """Get the LAN aggregator mode: "off", "server" (fetch for the fleet) or "client" (read from a hub)."""
+        return self.config.get("hub", {}).get("mode", "off")
+
+    def get_hub_url(self) -> str:
+        """Get the URL of the hub (client mode)."""
+        return self.config.get("hub", {}).get("url", "http://127.0.0.1:5000")
+
+    def get_hub_ttl(self, kind: str) -> float:
+        """Get how long (seconds) the hub serves trains, news or weather before fetching them again."""
+        return self.config.get("hub", {}).get("ttl", {}).get(kind, DEFAULT_HUB_TTL.get(kind, 60))
+
+    def get_hub_retry(self) -> float:
+        """Get the seconds a client waits before trying an unreachable hub again."""
+        return self.config.get("hub", {}).get("retry", 120)
+
+    # Simulator Methods
+    def get_simulator_enabled(self) -> bool:
+        """Check if every provider should be pointed at the local simulator."""
+        return self.config.get("simulator", {}).get("enabled", False)
+
+    def get_simulator_url(self) -> str:
+        """Get the base URL of the local simulator."""
+        return self.config.get("simulator", {}).get("url", "http://127.0.0.1:8089")
+
+    def get_simulator_fixtures_dir(self) -> Optional[str]:
+        """Get the directory the simulator serves its responses from (None for the bundled fixtures)."""
+        return self.config.get("simulator", {}).get("fixtures_dir")
+
+    def get_simulator_faults(self, provider: str) -> Dict:
+        """Get the fault injection settings for a provider (trains, news or weather)."""
+        faults = dict(self.config.get("simulator", {}).get("faults", {}))
+        override = faults.pop(provider, {})
+        for name in ("trains", "news", "weather"):
+            faults.pop(name, None)
+        faults.update(override)
+        return faults
+
+    def _simulated(self, url: str) -> str:
+        """Redirect a provider URL to the local simulator when it is enabled, keeping path and query."""
+        if not self.get_simulator_enabled():
+            return url
+        simulator = urlsplit(self.get_simulator_url())
+        parts = urlsplit(url)
+        return urlunsplit((simulator.scheme, simulator.netloc, parts.path, parts.query, parts.fragment))
+
     @staticmethod
     def _validate_time_list(times: List[str]) -> None:
         """Validate a list of time strings in HH:MM format."""
@@ -0,0 +1,258 @@
+"""
+LAN aggregator: one clock (mode "server") fetches trains, news and weather from the upstream
+providers once for the whole fleet, and serves the normalised data as JSON under /hub/<kind>
+on its remote control server. The other clocks (mode "client") read from it and fall back to
+the upstream providers when it cannot be reached.
+
+Responses carry an ETag: a client sending If-None-Match gets a 304 when nothing changed, and
+with `wait=N` the request is held for up to N seconds until the data changes (long poll),
+which is how clients are pushed updates.
+"""
+import logging
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+import requests
+from flask import Blueprint, Response, jsonify, request
+from config import SmartClockConfig
+from resilience import CircuitBreaker
+from cache import LruCache
+
+log = logging.getLogger(__name__)
+
+KINDS = ("trains", "news", "weather")
+MAX_WAIT = 60
+# Bound on the (kind, key) pairs kept in memory, on the hub and on each client
+MAX_SNAPSHOTS = 256
+
+
+class Snapshot:
+    """Normalised data of one (kind, key), serialised once for every client"""
+    def __init__(self, data: Any):
+        self.data = data
+        self.body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+        self.fetched_at = time.time()
+        self.last_access = time.monotonic()
+
+
+class HubCache:
+    """
+    Snapshots served by the hub. A snapshot older than the kind's ttl is fetched again, once
+    whatever the number of clients asking. Snapshots nobody asked for during `idle` seconds
+    are dropped, the others are refreshed in the background so long polls see the changes.
+    At most `max_snapshots` are kept, the least recently used is dropped first.
+
+    Each fetch takes a token of its provider with `acquire` (the clock's own scheduler), so the
+    hub and its own screens share the quotas. `providers` gives the provider of a kind's key
+    when it is not the kind itself (news sources are "newsapi" or "rss").
+    """
+    def __init__(self, config: SmartClockConfig, fetchers: Dict[str, Callable[[str], Any]],
+                 acquire: Callable[[str], bool], providers: Optional[Dict[str, Callable[[str], str]]] = None,
+                 idle: float = 900, max_snapshots: int = MAX_SNAPSHOTS):
+        self.fetchers = fetchers
+        self.acquire = acquire
+        self.providers = providers or {}
+        self.ttl = {kind: config.get_hub_ttl(kind) for kind in fetchers}
+        self.idle = idle
+        self.snapshots = LruCache(max_snapshots)
+        self.fetch_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self.changed = threading.Condition()
+        failures, reset = config.get_breaker_settings()
+        self.breakers = {kind: CircuitBreaker(f"hub {kind}", failures, reset) for kind in fetchers}
+
+    def get_provider(self, kind: str, key: str) -> str:
+        return self.providers[kind](key) if kind in self.providers else kind
+
+    def _is_fresh(self, kind: str, snapshot: Optional[Snapshot]) -> bool:
+        return snapshot is not None and time.time() - snapshot.fetched_at < self.ttl[kind]
+
+    def get(self, kind: str, key: str) -> Snapshot:
+        """Snapshot for (kind, key), fetched if missing or too old; stale data is served if the fetch fails"""
+        snapshot = self.snapshots.get((kind, key))
+        if not self._is_fresh(kind, snapshot):
+            snapshot = self.refresh(kind, key)
+        snapshot.last_access = time.monotonic()
+        return snapshot
+
+    def refresh(self, kind: str, key: str) -> Snapshot:
+        with self.changed:
+            lock = self.fetch_locks.setdefault((kind, key), threading.Lock())
+        with lock:
+            snapshot = self.snapshots.get((kind, key))
+            # another request may have fetched it while we were waiting for the lock
+            if self._is_fresh(kind, snapshot):
+                return snapshot
+            breaker = self.breakers[kind]
+            if not breaker.allow() or not self.acquire(self.get_provider(kind, key)):
+                if snapshot is None:
+                    raise RuntimeError(f"{kind} provider unavailable")
+                return snapshot
+            breaker.on_call()
+            try:
+                fresh = Snapshot(self.fetchers[kind](key))
+            except Exception as e:
+                breaker.record_failure()
+                log.warning("Hub could not fetch %s %s: %s", kind, key, e)
+                if snapshot is None:
+                    raise
+                return snapshot
+            breaker.record_success()
+            if snapshot is not None:
+                fresh.last_access = snapshot.last_access
+            with self.changed:
+                self.snapshots.put((kind, key), fresh)
+                if snapshot is None or snapshot.etag != fresh.etag:
+                    self.changed.notify_all()
+            return fresh
+
+    def wait_for_change(self, kind: str, key: str, etag: str, timeout: float) -> Snapshot:
+        """Block until the snapshot's ETag differs from `etag`, or `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while True:
+                snapshot = self.snapshots.get((kind, key))
+                remaining = deadline - time.monotonic()
+                if snapshot is None or snapshot.etag != etag or remaining <= 0:
+                    return snapshot
+                self.changed.wait(remaining)
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for (kind, key), snapshot in self.snapshots.items():
+                if now - snapshot.last_access > self.idle:
+                    with self.changed:
+                        self.snapshots.pop((kind, key))
+                        self.fetch_locks.pop((kind, key), None)
+                elif not self._is_fresh(kind, snapshot):
+                    try:
+                        self.refresh(kind, key)
+                    except Exception:
+                        pass
+            with self.changed:
+                # locks of snapshots evicted from the cache
+                for pair, lock in list(self.fetch_locks.items()):
+                    if pair not in self.snapshots and not lock.locked():
+                        del self.fetch_locks[pair]
+
+    def start(self):
+        threading.Thread(target=self._refresh_loop, name="hub-refresh", daemon=True).start()
+
+
+def create_fetchers(config: SmartClockConfig) -> Tuple[Dict[str, Callable[[str], Any]],
+                                                      Dict[str, Callable[[str], str]]]:
+    """Upstream fetchers used by the hub, each takes the key sent by the clients, and the providers they call"""
+    from trains import TrainGetter
+    from news import NewsFetcher
+    from weather_widget import WeatherFetcher
+    news = NewsFetcher(config)
+    fetchers = {
+        "trains": TrainGetter(config).get_board,
+        "news": news.get_headlines,
+        "weather": WeatherFetcher(config).fetch,
+    }
+    return fetchers, {"news": news.get_type}
+
+
+def create_blueprint(cache: HubCache) -> Blueprint:
+    hub = Blueprint("hub", __name__)
+
+    @hub.route("/hub/<kind>")
+    def snapshot(kind):
+        if kind not in cache.fetchers:
+            return jsonify({"error": f"unknown kind {kind}"}), 404
+        key = request.args.get("key", "")
+        etag = request.headers.get("If-None-Match")
+        # a bad or negative wait answers at once
+        wait = max(0.0, min(request.args.get("wait", 0.0, type=float), MAX_WAIT))
+        try:
+            snapshot = cache.get(kind, key)
+        except KeyError as e:
+            return jsonify({"error": str(e)}), 404
+        except Exception as e:
+            return jsonify({"error": str(e)}), 502
+        if wait > 0 and etag == snapshot.etag:
+            snapshot = cache.wait_for_change(kind, key, etag, wait) or snapshot
+        headers = {"ETag": snapshot.etag, "X-Fetched-At": str(snapshot.fetched_at)}
+        if etag == snapshot.etag:
+            return Response(status=304, headers=headers)
+        return Response(snapshot.body, content_type="application/json", headers=headers)
+
+    return hub
+
+
+class HubClient:
+    """
+    Reads normalised data from the hub. `get` returns None when the hub cannot be reached,
+    the caller then fetches from the upstream provider; the hub is tried again after
+    `retry` seconds. Data the hub could not refresh for twice its ttl is stale, see `stale_since`.
+    """
+    def __init__(self, config: SmartClockConfig):
+        self.url = config.get_hub_url().rstrip("/")
+        self.retry = config.get_hub_retry()
+        self.stale_after = {kind: 2 * config.get_hub_ttl(kind) for kind in KINDS}
+        self.timeout = config.get_network_timeouts()
+        self.cache = LruCache(MAX_SNAPSHOTS)
+        self.down_until = 0.0
+        self.lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def _request(self, kind: str, key: str, wait: float = 0) -> bool:
+        """Conditional GET of a snapshot, returns True if it changed"""
+        with self.lock:
+            etag, data, _ = self.cache.get((kind, key), (None, None, None))
+        headers = {"If-None-Match": etag} if etag else {}
+        params = {"key": key, "wait": wait} if wait else {"key": key}
+        timeout = (self.timeout[0], self.timeout[1] + wait)
+        response = requests.get(f"{self.url}/hub/{kind}", params=params, headers=headers, timeout=timeout)
+        # when the hub fetched the data from the provider
+        fetched_at = float(response.headers.get("X-Fetched-At", time.time()))
+        if response.status_code == 304:
+            with self.lock:
+                self.cache.put((kind, key), (etag, data, fetched_at))
+            return False
+        response.raise_for_status()
+        with self.lock:
+            self.cache.put((kind, key), (response.headers.get("ETag"), response.json(), fetched_at))
+        return True
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        if not self.is_available():
+            return None
+        try:
+            self._request(kind, key)
+        except (requests.RequestException, ValueError) as e:
+            log.warning("Hub unavailable (%s), fetching %s directly for %ss", e, kind, self.retry)
+            self.down_until = time.monotonic() + self.retry
+            return None
+        with self.lock:
+            return self.cache.get((kind, key), (None, None, None))[1]
+
+    def stale_since(self, kind: str, key: str) -> Optional[float]:
+        """When the hub fetched the data of (kind, key) if that is too long ago (it could not refresh it), else None"""
+        with self.lock:
+            fetched_at = self.cache.get((kind, key), (None, None, None))[2]
+        if fetched_at is None or time.time() - fetched_at <= self.stale_after.get(kind, 0):
+            return None
+        return fetched_at
+
+    def watch(self, kind: str, key: Callable[[], str], on_change: Callable[[], None]):
+        """Long poll the hub in the background, calling `on_change` when the data of `key()` changes"""
+        def run():
+            while True:
+                if not self.is_available():
+                    time.sleep(self.retry)
+                    continue
+                try:
+                    if self._request(kind, key(), wait=MAX_WAIT - 5):
+                        on_change()
+                except (requests.RequestException, ValueError):
+                    time.sleep(self.retry)
+
+        threading.Thread(target=run, name=f"hub-watch-{kind}", daemon=True).start()
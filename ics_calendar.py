@@ -0,0 +1,343 @@
+"""
+Agenda of local iCalendar (.ics) files, e.g. family calendars synced onto the clock.
+
+Parsing a large calendar and expanding its recurring events takes far longer than a tick, so
+`Calendars.refresh` (run on a refresh thread) only parses again the files whose modification time
+or size changed, and expands the recurrences of a file for a rolling window of days reaching a
+week further than shown, so they are expanded again when the file changes or once a week. The occurrences of every file are
+merged into an `AgendaIndex` sorted by start time, which answers "next N events" with a bisection.
+
+Times are shown in the clock's local time: events with a TZID or in UTC are converted, floating
+times and all-day events are taken as they are.
+"""
+import os
+import re
+import glob
+import heapq
+import bisect
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from dateutil import tz
+from dateutil.rrule import rruleset, rrulestr
+
+log = logging.getLogger(__name__)
+
+DURATION = re.compile(r"([-+])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+ESCAPED = re.compile(r"\\([\\;,nN])")
+UNTIL = re.compile(r"UNTIL=(\d{8}(?:T\d{6})?)(Z?)", re.IGNORECASE)
+# More than any UTC offset: single events this far out of the window (in their own time) are skipped unconverted
+OFFSET_MARGIN = timedelta(days=1)
+# Occurrences are expanded this far beyond the window, so that the window rolls for a week without expanding again
+EXPANSION_AHEAD = timedelta(days=7)
+
+
+@dataclass
+class CalendarEvent:
+    """A VEVENT as written in the file: a single event, a recurring one or the override of one occurrence"""
+    uid: str
+    summary: str
+    start: datetime
+    duration: timedelta
+    all_day: bool = False
+    location: str = ""
+    rrule: Optional[str] = None
+    rdates: List[datetime] = field(default_factory=list)
+    exdates: List[datetime] = field(default_factory=list)
+    recurrence_id: Optional[datetime] = None
+    cancelled: bool = False
+
+
+@dataclass(order=True)
+class Occurrence:
+    """One occurrence of an event, in local time"""
+    start: datetime
+    end: datetime
+    summary: str
+    location: str = ""
+    all_day: bool = False
+    calendar: str = ""
+
+
+def unfold(text: str) -> List[str]:
+    """Content lines, with the lines continued on the next ones (starting with a space or tab) joined"""
+    lines: List[str] = []
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        elif line:
+            lines.append(line)
+    return lines
+
+
+def split_property(line: str) -> Tuple[str, Dict[str, str], str]:
+    """Name, parameters and value of a content line (parameter values may quote colons)"""
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            break
+    else:
+        return line.upper(), {}, ""
+    name, *params = line[:i].split(";")
+    parameters = {}
+    for param in params:
+        key, _, value = param.partition("=")
+        parameters[key.upper()] = value.strip('"')
+    return name.upper(), parameters, line[i + 1:]
+
+
+def unescape(text: str) -> str:
+    return ESCAPED.sub(lambda match: "\n" if match[1] in "nN" else match[1], text)
+
+
+def parse_datetime(value: str, parameters: Dict[str, str]) -> Tuple[datetime, bool]:
+    """A DATE or DATE-TIME value, and whether it is a date"""
+    value = value.strip()
+    # much faster than strptime, with thousands of events
+    day = datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    if parameters.get("VALUE") == "DATE" or len(value) == 8:
+        return day, True
+    if value[8:9] != "T":
+        raise ValueError(f"bad date-time {value}")
+    moment = day.replace(hour=int(value[9:11]), minute=int(value[11:13]), second=int(value[13:15]))
+    if value.endswith("Z"):
+        return moment.replace(tzinfo=tz.UTC), False
+    zone = tz.gettz(parameters["TZID"]) if "TZID" in parameters else None
+    return (moment.replace(tzinfo=zone) if zone is not None else moment), False
+
+
+def parse_duration(value: str) -> timedelta:
+    match = DURATION.match(value.strip())
+    if match is None:
+        raise ValueError(f"bad duration {value}")
+    weeks, days, hours, minutes, seconds = (int(part or 0) for part in match.groups()[1:])
+    duration = timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+    return -duration if match[1] == "-" else duration
+
+
+def parse_ics(text: str) -> List[CalendarEvent]:
+    """Events of an iCalendar file, the events that cannot be read are skipped"""
+    events = []
+    properties: Optional[List[Tuple[str, Dict[str, str], str]]] = None
+    for line in unfold(text):
+        upper = line.upper()
+        if upper == "BEGIN:VEVENT":
+            properties = []
+        elif upper == "END:VEVENT" and properties is not None:
+            try:
+                events.append(_event(properties))
+            except (KeyError, ValueError) as e:
+                log.debug("Skipping an event: %s", e)
+            properties = None
+        elif properties is not None:
+            properties.append(split_property(line))
+    return events
+
+
+def _event(properties: List[Tuple[str, Dict[str, str], str]]) -> CalendarEvent:
+    values: Dict[str, Tuple[Dict[str, str], str]] = {}
+    rdates, exdates = [], []
+    for name, parameters, value in properties:
+        if name in ("RDATE", "EXDATE"):
+            dates = rdates if name == "RDATE" else exdates
+            # a list of dates, periods of RDATE are not supported
+            dates.extend(parse_datetime(part, parameters)[0] for part in value.split(",") if "/" not in part)
+        elif name not in values:
+            values[name] = (parameters, value)
+    start, all_day = parse_datetime(values["DTSTART"][1], values["DTSTART"][0])
+    if "DTEND" in values:
+        duration = parse_datetime(values["DTEND"][1], values["DTEND"][0])[0] - start
+    elif "DURATION" in values:
+        duration = parse_duration(values["DURATION"][1])
+    else:
+        duration = timedelta(days=1) if all_day else timedelta(0)
+    recurrence_id = parse_datetime(values["RECURRENCE-ID"][1], values["RECURRENCE-ID"][0])[0] \
+        if "RECURRENCE-ID" in values else None
+    return CalendarEvent(
+        uid=values.get("UID", ({}, ""))[1],
+        summary=unescape(values.get("SUMMARY", ({}, ""))[1]),
+        start=start,
+        duration=duration,
+        all_day=all_day,
+        location=unescape(values.get("LOCATION", ({}, ""))[1]),
+        rrule=values["RRULE"][1] if "RRULE" in values else None,
+        rdates=rdates,
+        exdates=exdates,
+        recurrence_id=recurrence_id,
+        cancelled=values.get("STATUS", ({}, ""))[1].upper() == "CANCELLED",
+    )
+
+
+def to_local(moment: datetime) -> datetime:
+    """Naive local time of `moment` (floating times are already local)"""
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo is not None else moment
+
+
+def like(moment: datetime, reference: datetime) -> datetime:
+    """`moment` comparable with `reference`: both naive, or both aware"""
+    if reference.tzinfo is None:
+        return to_local(moment)
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=reference.tzinfo)
+    return moment
+
+
+def expand(events: List[CalendarEvent], window_start: datetime, window_end: datetime,
+           calendar: str = "") -> List[Occurrence]:
+    """Sorted occurrences of `events` overlapping the local times [window_start, window_end)"""
+    # occurrences moved or cancelled one by one replace those of the rule
+    overridden: Dict[str, List[datetime]] = {}
+    for event in events:
+        if event.recurrence_id is not None:
+            overridden.setdefault(event.uid, []).append(event.recurrence_id)
+    occurrences = []
+    for event in events:
+        if event.cancelled:
+            continue
+        starts = [event.start]
+        if event.rrule is None and not event.rdates:
+            wall = event.start.replace(tzinfo=None)
+            if wall >= window_end + OFFSET_MARGIN or wall + event.duration <= window_start - OFFSET_MARGIN:
+                continue
+        else:
+            try:
+                starts = _recurrences(event, overridden.get(event.uid, []), window_start, window_end)
+            except (ValueError, TypeError) as e:
+                log.warning("Ignoring the recurrence of %s: %s", event.summary, e)
+        for start in starts:
+            local_start = to_local(start)
+            local_end = to_local(start + event.duration)
+            if local_start < window_end and (local_end > window_start or local_start >= window_start):
+                occurrences.append(Occurrence(local_start, local_end, event.summary, event.location,
+                                              event.all_day, calendar))
+    occurrences.sort()
+    return occurrences
+
+
+def utc_until(rrule: str, start: datetime) -> str:
+    """
+    The rule with a floating UNTIL taken in the zone of a zoned DTSTART and written in UTC (dateutil
+    refuses to mix them, e.g. in Outlook exports). An UNTIL date includes that whole day.
+    """
+    match = UNTIL.search(rrule)
+    if match is None or match[2] or start.tzinfo is None:
+        return rrule
+    until, is_date = parse_datetime(match[1], {})
+    if is_date:
+        until = until.replace(hour=23, minute=59, second=59)
+    until = until.replace(tzinfo=start.tzinfo).astimezone(tz.UTC)
+    return rrule[:match.start()] + f"UNTIL={until:%Y%m%dT%H%M%S}Z" + rrule[match.end():]
+
+
+def _recurrences(event: CalendarEvent, overridden: List[datetime], window_start: datetime,
+                 window_end: datetime) -> List[datetime]:
+    """Starts of the occurrences of a recurring event that may overlap the window"""
+    start = event.start
+    rules = rruleset()
+    if event.rrule is not None:
+        rules.rrule(rrulestr(utc_until(event.rrule, start), dtstart=start, ignoretz=start.tzinfo is None))
+    for moment in event.rdates:
+        rules.rdate(like(moment, start))
+    for moment in event.exdates + overridden:
+        rules.exdate(like(moment, start))
+    # the window in the event's time zone, widened by the duration for the occurrences already started
+    low, high = window_start, window_end
+    if start.tzinfo is not None:
+        low, high = low.astimezone(start.tzinfo), high.astimezone(start.tzinfo)
+    return rules.between(low - max(event.duration, timedelta(0)), high, inc=True)
+
+
+class AgendaIndex:
+    """Occurrences of every calendar sorted by start"""
+    def __init__(self, occurrences: List[Occurrence]):
+        self.occurrences = occurrences
+        self.starts = [occurrence.start for occurrence in occurrences]
+        # how far back an occurrence still in progress may have started
+        self.longest = max((occurrence.end - occurrence.start for occurrence in occurrences), default=timedelta(0))
+
+    def upcoming(self, now: datetime, count: int) -> List[Occurrence]:
+        """The next `count` occurrences not finished at `now`, in progress ones first"""
+        found = []
+        for i in range(bisect.bisect_left(self.starts, now - self.longest), len(self.occurrences)):
+            occurrence = self.occurrences[i]
+            if occurrence.end > now or occurrence.start >= now:
+                found.append(occurrence)
+                if len(found) == count:
+                    break
+        return found
+
+    def first_timed(self, day: date) -> Optional[Occurrence]:
+        """The first occurrence with a time (not all day) starting on `day`"""
+        midnight = datetime.combine(day, time())
+        end = bisect.bisect_left(self.starts, midnight + timedelta(days=1))
+        for i in range(bisect.bisect_left(self.starts, midnight), end):
+            if not self.occurrences[i].all_day:
+                return self.occurrences[i]
+        return None
+
+    def __len__(self) -> int:
+        return len(self.occurrences)
+
+
+class CalendarFile:
+    """Events of one file, parsed when it changes, and their occurrences in the current window"""
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.signature: Optional[Tuple[float, int]] = None
+        self.events: List[CalendarEvent] = []
+        self.window: Optional[Tuple[datetime, datetime]] = None
+        self.occurrences: List[Occurrence] = []
+
+    def update(self, window: Tuple[datetime, datetime]) -> bool:
+        """Parse the file again if it changed and expand its events if needed, True if its occurrences changed"""
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime, stat.st_size)
+        if signature != self.signature:
+            with open(self.path, encoding="utf-8", errors="replace") as f:
+                self.events = parse_ics(f.read())
+            self.signature = signature
+            self.window = None
+        if self.window is not None and self.window[0] <= window[0] and window[1] <= self.window[1]:
+            return False
+        self.window = (window[0], window[1] + EXPANSION_AHEAD)
+        self.occurrences = expand(self.events, self.window[0], self.window[1], self.name)
+        return True
+
+
+class Calendars:
+    """
+    The calendars matching glob patterns. `refresh` runs on a refresh thread and returns a new
+    index when an occurrence changed, the previous one otherwise.
+    """
+    def __init__(self, patterns: List[str], days: int):
+        self.patterns = patterns
+        self.days = days
+        self.files: Dict[str, CalendarFile] = {}
+        self.index = AgendaIndex([])
+
+    def get_window(self, now: datetime) -> Tuple[datetime, datetime]:
+        """From the start of yesterday (events ending today), to `days` days after today"""
+        today = datetime.combine(now.date(), time())
+        return today - timedelta(days=1), today + timedelta(days=self.days + 1)
+
+    def refresh(self, now: Optional[datetime] = None) -> AgendaIndex:
+        window = self.get_window(now or datetime.now())
+        paths = {path for pattern in self.patterns for path in glob.glob(os.path.expanduser(pattern))}
+        changed = paths.symmetric_difference(self.files)
+        for path in changed - paths:
+            del self.files[path]
+        for path in sorted(paths):
+            calendar = self.files.setdefault(path, CalendarFile(path))
+            try:
+                if calendar.update(window):
+                    changed.add(path)
+            except (OSError, ValueError) as e:
+                # a file being synced: its previous events are kept
+                log.warning("Could not read calendar %s: %s", path, e)
+        if changed:
+            self.index = AgendaIndex(list(heapq.merge(*(calendar.occurrences for calendar in self.files.values()))))
+        return self.index
@@ -0,0 +1,154 @@
+"""
+Journeys with changes: each saved journey is a list of legs (origin -> destination). The boards
+of every leg of every journey are fetched concurrently, so several journeys cost the latency of
+the slowest board rather than the sum, and whatever did not answer within the refresh budget is
+left out. Connections are then found leg by leg with a sorted merge of arrival and departure times.
+"""
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from config import SmartClockConfig, Journey
+
+log = logging.getLogger(__name__)
+
+# Boards fetched at the same time, whatever the number of legs
+MAX_PARALLEL_LEGS = 8
+# Options shown per journey
+MAX_OPTIONS = 3
+TIME = re.compile(r"^\d\d:\d\d$")
+
+
+def minutes_from(hhmm: Optional[str], now: datetime) -> Optional[int]:
+    """Minutes between `now` and a HH:MM time of the board, negative for the recent past"""
+    if not hhmm or not TIME.match(hhmm):
+        return None
+    hours, minutes = map(int, hhmm.split(":"))
+    delta = (hours * 60 + minutes - now.hour * 60 - now.minute) % (24 * 60)
+    # boards look a few hours ahead at most, anything "later" than 20 hours has gone
+    return delta - 24 * 60 if delta > 20 * 60 else delta
+
+
+def expected(scheduled: Optional[str], estimate: Optional[str]) -> Optional[str]:
+    """Estimated time if the board gives one ("07:46"), the scheduled one otherwise ("On time", "Delayed")"""
+    return estimate if estimate and TIME.match(estimate) else scheduled
+
+
+class Itinerary:
+    def __init__(self, legs: List[Dict], arrival: int):
+        self.legs = legs
+        self.arrival = arrival
+
+
+def leg_candidates(board: Dict, now: datetime) -> List[Tuple[int, int, Dict]]:
+    """(departure, arrival, service) of the trains of a leg that are still to leave, by departure"""
+    candidates = []
+    for service in board["services"]:
+        if service["is_cancelled"]:
+            continue
+        departure = minutes_from(expected(service["std"], service["etd"]), now)
+        arrival = minutes_from(expected(service["arrival"], service["expected_arrival"]), now)
+        if departure is None or arrival is None or departure < 0:
+            continue
+        # a train arriving after midnight has a smaller clock time than its departure
+        if arrival < departure:
+            arrival += 24 * 60
+        candidates.append((departure, arrival, service))
+    candidates.sort(key=lambda candidate: candidate[0])
+    return candidates
+
+
+def connect(itineraries: List[Itinerary], candidates: List[Tuple[int, int, Dict]], min_connection: int) -> List[Itinerary]:
+    """
+    Extend each itinerary with the train of the next leg arriving first among those leaving at
+    least `min_connection` minutes after it arrives. Both sides are sorted, so one pass is enough.
+    """
+    # earliest[i]: index of the candidate arriving first among candidates[i:]
+    earliest = [0] * len(candidates)
+    for i in range(len(candidates) - 1, -1, -1):
+        later = earliest[i + 1] if i + 1 < len(candidates) else i
+        earliest[i] = i if candidates[i][1] <= candidates[later][1] else later
+
+    connected = []
+    j = 0
+    for itinerary in sorted(itineraries, key=lambda itinerary: itinerary.arrival):
+        while j < len(candidates) and candidates[j][0] < itinerary.arrival + min_connection:
+            j += 1
+        if j == len(candidates):
+            # the itineraries that follow arrive even later
+            break
+        departure, arrival, service = candidates[earliest[j]]
+        connected.append(Itinerary(itinerary.legs + [service], arrival))
+    return connected
+
+
+def plan(journey: Journey, boards: Dict[Tuple[str, str], Dict], now: datetime) -> List[Itinerary]:
+    """Best options of a journey, by arrival time: for each last train, the first train leaving last"""
+    itineraries = None
+    for leg in journey.legs:
+        candidates = leg_candidates(boards[(leg.origin, leg.destination)], now)
+        if itineraries is None:
+            itineraries = [Itinerary([service], arrival) for _, arrival, service in candidates]
+        else:
+            itineraries = connect(itineraries, candidates, leg.min_connection)
+    # several first trains can make the same last one: waiting less at the change is better
+    best: Dict[str, Itinerary] = {}
+    for itinerary in itineraries or []:
+        last = itinerary.legs[-1]["service_id"]
+        if last not in best or minutes_from(best[last].legs[0]["std"], now) < minutes_from(itinerary.legs[0]["std"], now):
+            best[last] = itinerary
+    options = sorted(best.values(), key=lambda itinerary: itinerary.arrival)
+    return options[:MAX_OPTIONS]
+
+
+def normalise_option(journey: Journey, itinerary: Itinerary) -> Dict:
+    legs = []
+    for leg, service in zip(journey.legs, itinerary.legs):
+        legs.append({
+            "origin": leg.origin,
+            "destination": leg.destination,
+            "std": service["std"],
+            "etd": service["etd"],
+            "platform": service["platform"],
+            "arrival": expected(service["arrival"], service["expected_arrival"]),
+        })
+    return {"legs": legs, "arrival": legs[-1]["arrival"]}
+
+
+class JourneyPlanner:
+    """Fetches the boards of all the saved journeys and finds their connections"""
+    def __init__(self, config: SmartClockConfig, getter):
+        self.config = config
+        self.getter = getter
+        self.pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_LEGS, thread_name_prefix="journey")
+        # set by the owner to take a request of the trains quota for each board after the first
+        # (the refresh itself took one), None to fetch every board
+        self.acquire: Optional[Callable[[], bool]] = None
+
+    def fetch(self) -> List[Dict]:
+        """Options of every journey (runs on a refresh thread), legs whose board is missing are listed"""
+        journeys = self.config.get_train_journeys()
+        legs = sorted({(leg.origin, leg.destination) for journey in journeys for leg in journey.legs})
+        allowed = legs[:1] + [leg for leg in legs[1:] if self.acquire is None or self.acquire()]
+        if len(allowed) < len(legs):
+            log.info("Trains quota reached, %d journey boards left out", len(legs) - len(allowed))
+        futures = {self.pool.submit(self.getter.get_leg_board, origin, destination): (origin, destination)
+                   for origin, destination in allowed}
+        done, _ = wait(futures, timeout=self.config.get_train_journey_budget())
+        boards = {}
+        for future in done:
+            try:
+                boards[futures[future]] = future.result()
+            except Exception as e:
+                log.warning("Could not get trains %s to %s: %s", *futures[future], e)
+        if legs and not boards:
+            raise RuntimeError("no journey board could be fetched")
+
+        now = datetime.now()
+        results = []
+        for journey in journeys:
+            missing = [f"{leg.origin}-{leg.destination}" for leg in journey.legs if (leg.origin, leg.destination) not in boards]
+            options = [] if missing else [normalise_option(journey, itinerary) for itinerary in plan(journey, boards, now)]
+            results.append({"name": journey.name, "options": options, "missing": missing})
+        return results
@@ -0,0 +1,77 @@
+"""
+Logging for the whole clock. Loggers only put records on a queue (QueueHandler), a listener
+thread does the writing: size-rotated files on the SD card, and a ring buffer of the last
+records in memory that the remote control serves at /api/logs. Logging from the UI thread
+never waits for the disk.
+"""
+import sys
+import queue
+import logging
+from datetime import datetime
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
+from config import SmartClockConfig
+
+FORMAT = "%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s"
+# Libraries logging every request or connection at INFO
+QUIET_LOGGERS = ("werkzeug", "zeep", "urllib3")
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last `capacity` records, as dictionaries"""
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(sep=" ", timespec="milliseconds"),
+            "level": record.levelname,
+            "levelno": record.levelno,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        # emit is called with the handler's lock held
+        self.records.append(entry)
+
+    def get_records(self, level: int = logging.NOTSET, limit: Optional[int] = None) -> List[Dict]:
+        """Records of at least `level`, oldest first, the last `limit` of them"""
+        with self.lock:
+            records = [entry for entry in self.records if entry["levelno"] >= level]
+        return records[-limit:] if limit else records
+
+
+class ClockLogs:
+    def __init__(self, config: SmartClockConfig):
+        self.ring = RingBufferHandler(config.get_log_buffer_size())
+        handlers: List[logging.Handler] = [self.ring]
+        path = config.get_log_file()
+        if path:
+            handlers.append(RotatingFileHandler(path, maxBytes=config.get_log_max_size() * 1024,
+                                                backupCount=config.get_log_backups(), encoding="utf-8"))
+        else:
+            handlers.append(logging.StreamHandler(sys.stderr))
+        formatter = logging.Formatter(FORMAT)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, *handlers)
+
+        root = logging.getLogger()
+        root.handlers[:] = [QueueHandler(self.queue)]
+        root.setLevel(config.get_log_level())
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
+        self.listener.start()
+        self.running = True
+
+    def get_records(self, level: int = logging.NOTSET, limit: Optional[int] = None) -> List[Dict]:
+        return self.ring.get_records(level, limit)
+
+    def stop(self):
+        """Write what is still queued and stop the listener thread"""
+        if self.running:
+            self.running = False
+            self.listener.stop()
@@ -1,16 +1,41 @@
+from startup import STARTUP
 import sys
+import logging
+import argparse
 from datetime import datetime
-from PyQt5 import QtWidgets, uic
+from PyQt5 import QtWidgets
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QVBoxLayout
 from PyQt5.QtGui import QPalette, QColor
-from radio import RadioManager
-from trains import TrainManager
-from news import NewsManager
-from server import start_server
 from config import SmartClockConfig
-from weather_widget import WeatherWidget
 from alarm import AlarmManager
+from scheduler import RefreshScheduler
+from logs import ClockLogs
+from ui_watchdog import Watchdog, load_state, HEARTBEAT_INTERVAL
+from ui_loader import load_ui
+
+log = logging.getLogger(__name__)
+
+STARTUP.mark("main imports done")
+
+# Pages of the stacked widget
+CLOCK_SCREEN = 0
+NEWS_SCREEN = 1
+RADIO_SCREEN = 2
+ALARM_SCREEN = 3
+TRAINS_SCREEN = 4
+WEATHER_SCREEN = 5
+AGENDA_SCREEN = 6
+
+# Milliseconds without typing before the station search runs
+STATION_SEARCH_DELAY = 300
+
+# The window is created in a few hundred milliseconds, it is sampled more often than a running clock
+STARTUP_SAMPLE_INTERVAL = 0.001
+
+
+class SubsystemUnavailable(Exception):
+    """A subsystem could not be created, the rest of the clock runs without it"""
 
 
 class SmartClock(QtWidgets.QMainWindow):
@@ -22,30 +47,60 @@ class SmartClock(QtWidgets.QMainWindow):
     set_alarm_signal = pyqtSignal()
     set_trains_signal = pyqtSignal()
     set_weather_signal = pyqtSignal()
+    set_agenda_signal = pyqtSignal()
     play_pause_signal = pyqtSignal()
     next_station_signal = pyqtSignal()
+    play_station_signal = pyqtSignal(str)
 
     def __init__(self):
         super().__init__()
 
-        # Load the UI file
-        uic.loadUi('smartclock.ui', self)
+        # Load the UI (pre-compiled module, see ui_loader.py)
+        with STARTUP.phase("load UI"):
+            load_ui(self)
         self.config = SmartClockConfig('config.toml')
-        
-        # Add the weather widget
-        layout = QVBoxLayout()
-        self.weatherWidget = WeatherWidget(self.config)
-        layout.addWidget(self.weatherWidget)
-        self.weatherContainer.setLayout(layout)
-
-        # Initialize various managers
-        self.radio_manager = RadioManager(self.config)
-        self.alarm_manager = AlarmManager(self.config)
-        self.train_manager = TrainManager(self.config, self.trainsHeaderLabel, self.trainsLayout)
-        self.news_manager = NewsManager(self.config, self.newsHeaderLabel, self.newsLayout)
+        self.logs = ClockLogs(self.config)
+        log.info("Clock starting")
+
+        # Subsystems with slow imports or constructors are created on first use,
+        # or one at a time once the clock face is on screen
+        self.subsystems = {}
+        self.subsystem_factories = {
+            "audio": self._create_audio,
+            "trains": self._create_trains,
+            "news": self._create_news,
+            "weather": self._create_weather,
+            "radio": self._create_radio,
+            "agenda": self._create_agenda,
+            "server": self._create_server,
+        }
+        self.pending_subsystems = list(self.subsystem_factories)
+        # subsystems whose creation failed, not tried again
+        self.unavailable_subsystems = set()
+        self.hub_client = None
+        self.first_frame_shown = False
+
+        self.alarm_manager = AlarmManager(self.config, lambda: self.audio_engine if self._is_available("audio") else None)
+
+        # Last data of the providers from before the restart, shown until they refresh
+        self.snapshots = None
+        if self.config.get_snapshot_file():
+            from snapshots import SnapshotStore
+            self.snapshots = SnapshotStore(self.config)
+
+        # All provider refreshes go through the scheduler
+        self.scheduler = RefreshScheduler(self.config, snapshots=self.snapshots)
+
+        # Watches the event loop from another thread, started with the first frame
+        self.watchdog = None
+        self.resume_state = None
+        if self.config.get_watchdog_enabled():
+            self.watchdog = Watchdog(self.config, self.quit, self.logs.stop)
+            self.resume_state = load_state(self.config.get_state_file())
 
         # Initialize UI elements
         self._setup_ui_elements()
+        self.shown_screen = self.stackedWidget.currentIndex()
 
         # Connect signals
         self._connect_signals()
@@ -55,14 +110,224 @@ class SmartClock(QtWidgets.QMainWindow):
         self.timer.timeout.connect(self._update_components)
         self.timer.start(1000)  # Update every second
 
+        # Timer delivering refresh results and starting due refreshes
+        self.refresh_timer = QTimer()
+        self.refresh_timer.timeout.connect(self._run_scheduler)
+        self.refresh_timer.start(200)
+
+        if self.watchdog is not None:
+            self.heartbeat_timer = QTimer()
+            self.heartbeat_timer.timeout.connect(self._heartbeat)
+            self.heartbeat_timer.start(int(HEARTBEAT_INTERVAL * 1000))
+
     def _setup_ui_elements(self):
         """Initialize and setup UI elements"""
-        # Setup radio stations
-        self.radio_manager.update_radio_list(self.radioListWidget, self.volumeSlider)
-        self.volumeLabel.setText(f"{self.volumeSlider.value()}%")
-        
         # Setup alarm
         self.alarm_manager.update_UI(self.alarmWeekDayListWidget, self.alarmWeekEndListWidget, self.alarmCheckBox)
+        # back on the screen the previous process was showing, the rest is restored after the first frame
+        if self.resume_state is not None:
+            self.stackedWidget.setCurrentIndex(self.resume_state.get("screen", CLOCK_SCREEN))
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_frame_shown:
+            self.first_frame_shown = True
+            STARTUP.mark("first frame")
+            if self.watchdog is not None:
+                self.watchdog.start()
+            if self.resume_state is not None:
+                QTimer.singleShot(0, self._resume)
+            QTimer.singleShot(0, self._create_next_subsystem)
+
+    def _resume(self):
+        """Restore the alarms, volume and station saved by the previous process"""
+        state = self.resume_state
+        self.alarmCheckBox.setChecked(state.get("alarm_enabled", self.alarm_manager.enabled))
+        # creating the radio fills the station list and sets the default volume
+        if not self._is_available("radio"):
+            return
+        if "volume" in state:
+            self.volumeSlider.setValue(state["volume"])
+        station = state.get("station")
+        if station and self._select_station(station):
+            self.radio_manager.play_radio(station)
+
+    def _current_state(self):
+        """What a restarted clock resumes from"""
+        radio = self.subsystems.get("radio")
+        return {
+            "screen": self.stackedWidget.currentIndex(),
+            "station": radio.played_station if radio is not None else "",
+            "volume": self.volumeSlider.value(),
+            "alarm_enabled": bool(self.alarm_manager.enabled),
+        }
+
+    def _heartbeat(self):
+        self.watchdog.beat(self._current_state())
+
+    def _create_next_subsystem(self):
+        """Create the pending subsystems one per event loop iteration, so the UI stays responsive"""
+        while self.pending_subsystems:
+            name = self.pending_subsystems.pop(0)
+            if name not in self.subsystems and name not in self.unavailable_subsystems:
+                try:
+                    self._get_subsystem(name)
+                except SubsystemUnavailable:
+                    pass
+                QTimer.singleShot(0, self._create_next_subsystem)
+                return
+        STARTUP.mark("all subsystems ready")
+        if STARTUP.print_when_ready:
+            print(STARTUP.format(), flush=True)
+
+    def _get_subsystem(self, name):
+        """The subsystem `name`, created if needed, raises SubsystemUnavailable if it cannot be"""
+        if name in self.unavailable_subsystems:
+            raise SubsystemUnavailable(name)
+        if name not in self.subsystems:
+            try:
+                with STARTUP.phase(f"create {name}"):
+                    self.subsystem_factories[name]()
+            except Exception as e:
+                log.exception("Could not create the %s subsystem", name)
+                self.unavailable_subsystems.add(name)
+                self.subsystems.pop(name, None)
+                raise SubsystemUnavailable(name) from e
+        return self.subsystems[name]
+
+    def _is_available(self, name):
+        """Whether the subsystem `name` exists or can be created"""
+        try:
+            self._get_subsystem(name)
+            return True
+        except SubsystemUnavailable:
+            return False
+
+    def _get_hub_client(self):
+        """Client of the LAN hub, None unless the clock is configured to read from one"""
+        if self.hub_client is None and self.config.get_hub_mode() == "client":
+            hub = STARTUP.timed_import("hub")
+            self.hub_client = hub.HubClient(self.config)
+        return self.hub_client
+
+    def _watch_hub(self, kind, key, job):
+        """Refresh `job` as soon as the hub pushes new data"""
+        hub_client = self._get_hub_client()
+        if hub_client is not None:
+            hub_client.watch(kind, key, lambda: self.scheduler.request(job))
+
+    def _hydrate(self, job, show):
+        """Show the snapshot of `job` until its first refresh, failed refreshes then mark it stale"""
+        snapshot = self.snapshots.get(job) if self.snapshots is not None else None
+        if snapshot is None:
+            return
+        data, taken = snapshot
+        try:
+            show(data, taken)
+        except Exception as e:
+            log.warning("Could not show the %s snapshot: %s", job, e)
+            return
+        self.scheduler.jobs[job].last_success = taken
+
+    def _create_audio(self):
+        audio_engine = STARTUP.timed_import("audio_engine")
+        self.subsystems["audio"] = audio_engine.AudioEngine(self.config)
+
+    def _create_trains(self):
+        trains = STARTUP.timed_import("trains")
+        self.subsystems["trains"] = manager = trains.TrainManager(self.config, self.trainsHeaderLabel, self.trainsLayout,
+                                                                  self._get_hub_client())
+        self.scheduler.add_job("trains", manager.fetch, manager.render,
+                               interval=60, screen=TRAINS_SCREEN, on_stale=manager.show_stale, snapshot=True)
+        self._hydrate("trains", manager.render)
+        self.scheduler.add_job("train_details", manager.fetch_details, manager.render_details,
+                               provider="trains", screen=TRAINS_SCREEN)
+        manager.request_details = lambda: self.scheduler.request("train_details", force=True)
+        # a refresh of the details or of the journeys calls the provider once per service or leg,
+        # each call counts against the trains quota
+        manager.acquire = lambda: self.scheduler.try_acquire("trains")
+        if manager.journeys is not None:
+            self.scheduler.add_job("journeys", manager.fetch_journeys, manager.render_journeys,
+                                   interval=60, provider="trains", screen=TRAINS_SCREEN, snapshot=True)
+            self._hydrate("journeys", lambda journeys, taken: manager.render_journeys(journeys))
+            manager.journeys.acquire = manager.acquire
+        self._watch_hub("trains", lambda: self.config.get_train_stations()[0], "trains")
+
+    def _create_news(self):
+        news = STARTUP.timed_import("news")
+        self.subsystems["news"] = manager = news.NewsManager(self.config, self.newsHeaderLabel, self.newsLayout,
+                                                             self._get_hub_client())
+        self.scheduler.add_job("news", manager.fetch, manager.render,
+                               interval=self.config.get_news_update_interval() * 60,
+                               provider=manager.news_reader.get_current_type, screen=NEWS_SCREEN,
+                               on_stale=manager.show_stale, snapshot=True)
+        self._hydrate("news", manager.render)
+        self._watch_hub("news", manager.news_reader.get_current_source, "news")
+        if self.shown_screen == NEWS_SCREEN:
+            manager.enter()
+
+    def _create_weather(self):
+        weather_widget = STARTUP.timed_import("weather_widget")
+        layout = QVBoxLayout()
+        self.subsystems["weather"] = widget = weather_widget.WeatherWidget(self.config, self._get_hub_client())
+        layout.addWidget(widget)
+        self.weatherContainer.setLayout(layout)
+        self.scheduler.add_job("weather", widget.fetch, widget.render,
+                               interval=600, screen=WEATHER_SCREEN, on_stale=widget.show_stale,
+                               snapshot=lambda forecast: forecast.weather)
+        self._hydrate("weather", lambda weather, taken: widget.render(weather_widget.Forecast(weather), taken))
+        self._watch_hub("weather", self.config.get_weather_location, "weather")
+
+    def _create_radio(self):
+        radio = STARTUP.timed_import("radio")
+        self.subsystems["radio"] = manager = radio.RadioManager(self.config, self.audio_engine)
+        # Setup radio stations
+        manager.update_radio_list(self.radioListView, self.volumeSlider)
+        self.volumeLabel.setText(f"{self.volumeSlider.value()}%")
+        # playlists are imported off the UI thread, the list shows them once they are in the catalogue
+        self.scheduler.add_job("stations", manager.import_playlists, manager.show_imported)
+        self.scheduler.request("stations")
+
+    def _create_agenda(self):
+        agenda = STARTUP.timed_import("agenda")
+        self.subsystems["agenda"] = manager = agenda.AgendaManager(self.config, self.agendaHeaderLabel, self.agendaLayout,
+                                                                   self.alarm_manager)
+        # refreshed whatever the screen, for the early wake-up
+        self.scheduler.add_job("agenda", manager.fetch, manager.render, interval=60)
+        self.scheduler.request("agenda")
+
+    def _create_server(self):
+        server = STARTUP.timed_import("server")
+        server.start_server(self)
+        self.subsystems["server"] = server
+
+    @property
+    def audio_engine(self):
+        return self._get_subsystem("audio")
+
+    @property
+    def train_manager(self):
+        return self._get_subsystem("trains")
+
+    @property
+    def news_manager(self):
+        return self._get_subsystem("news")
+
+    @property
+    def weatherWidget(self):
+        return self._get_subsystem("weather")
+
+    @property
+    def radio_manager(self):
+        return self._get_subsystem("radio")
+
+    @property
+    def agenda_manager(self):
+        return self._get_subsystem("agenda")
+
+    def _request_refresh(self, name, force=False):
+        if self._is_available(name):
+            self.scheduler.request(name, force)
 
     def _connect_signals(self):
         """Connect all signal handlers"""
@@ -73,18 +338,26 @@ class SmartClock(QtWidgets.QMainWindow):
         self.alarmButton.clicked.connect(self._set_alarm)
         self.trainsButton.clicked.connect(self._set_trains)
         self.weatherButton.clicked.connect(self._set_weather)
+        self.agendaButton.clicked.connect(self._set_agenda)
 
 
         # Radio controls
         self.playButton.clicked.connect(self._play_radio)
         self.stopButton.clicked.connect(self._stop_radio)
         self.volumeSlider.valueChanged.connect(self._set_volume)
+        self.station_search_timer = QTimer()
+        self.station_search_timer.setSingleShot(True)
+        self.station_search_timer.setInterval(STATION_SEARCH_DELAY)
+        self.station_search_timer.timeout.connect(self._search_stations)
+        self.radioSearchEdit.textChanged.connect(self.station_search_timer.start)
         
         # Other connections as before...
-        self.refreshNewsButton.clicked.connect(self.news_manager.update_news)
-        self.nextSourceButton.clicked.connect(self.news_manager.next_source)
-        self.refreshTrainsButton.clicked.connect(self.train_manager.update_train_status)
-        self.refreshWeatherButton.clicked.connect(self.weatherWidget.fetch_weather)
+        self.refreshNewsButton.clicked.connect(lambda: self._request_refresh("news"))
+        self.nextSourceButton.clicked.connect(self._next_news_source)
+        self.refreshTrainsButton.clicked.connect(self._refresh_trains)
+        self.refreshWeatherButton.clicked.connect(lambda: self._request_refresh("weather"))
+        self.refreshAgendaButton.clicked.connect(lambda: self._request_refresh("agenda"))
+        self.stackedWidget.currentChanged.connect(self._screen_changed)
         self.stopAlarmButton.clicked.connect(self._stop_alarm)
         self.alarmCheckBox.stateChanged.connect(self.alarm_manager.update_enabled)
 
@@ -96,8 +369,10 @@ class SmartClock(QtWidgets.QMainWindow):
         self.set_alarm_signal.connect(self._set_alarm)
         self.set_trains_signal.connect(self._set_trains)
         self.set_weather_signal.connect(self._set_weather)
+        self.set_agenda_signal.connect(self._set_agenda)
         self.play_pause_signal.connect(self._play_pause)
         self.next_station_signal.connect(self._next_radio_station)
+        self.play_station_signal.connect(self._play_station)
 
     def set_clock(self):
         self.set_clock_signal.emit()
@@ -117,53 +392,118 @@ class SmartClock(QtWidgets.QMainWindow):
     def set_weather(self):
         self.set_weather_signal.emit()
 
+    def set_agenda(self):
+        self.set_agenda_signal.emit()
+
     def play_pause(self):
         self.play_pause_signal.emit()
 
     def next_radio_station(self):
         self.next_station_signal.emit()
 
+    def play_station(self, name):
+        self.play_station_signal.emit(name)
+
     def _stop_alarm(self):
         if self.stopAlarmButton.text() == "Stop Alarm":
             self.alarm_manager.stop_alarm()
             self.stopAlarmButton.setText("Start Alarm")
         else:
-            self.alarm_manager.start_alarm()
-            self.stopAlarmButton.setText("Stop Alarm")
+            # the audio output may not open, the alarm is then tried again on its own
+            if self.alarm_manager.start_alarm():
+                self.stopAlarmButton.setText("Stop Alarm")
+
+    def _screen_changed(self, screen):
+        """Tell the news when it is shown and left, for its "new" markers"""
+        if self.shown_screen == NEWS_SCREEN and "news" in self.subsystems:
+            self.news_manager.leave()
+        self.shown_screen = screen
+        if screen == NEWS_SCREEN and self._is_available("news"):
+            self.news_manager.enter()
 
     def _set_clock(self):
-        self.stackedWidget.setCurrentIndex(0)
+        self.stackedWidget.setCurrentIndex(CLOCK_SCREEN)
 
     def _set_news(self):
-        self.stackedWidget.setCurrentIndex(1)
-        self.news_manager.update_news()
+        self.stackedWidget.setCurrentIndex(NEWS_SCREEN)
+        self._request_refresh("news")
 
     def _set_radio(self):
-        self.stackedWidget.setCurrentIndex(2)
+        self.stackedWidget.setCurrentIndex(RADIO_SCREEN)
 
     def _set_alarm(self):
-        self.stackedWidget.setCurrentIndex(3)
+        self.stackedWidget.setCurrentIndex(ALARM_SCREEN)
 
     def _set_trains(self):
-        self.stackedWidget.setCurrentIndex(4)
-        self.train_manager.update_train_status()
+        self.stackedWidget.setCurrentIndex(TRAINS_SCREEN)
+        self._refresh_trains()
+
+    def _refresh_trains(self):
+        self._request_refresh("trains")
+        if "journeys" in self.scheduler.jobs:
+            self.scheduler.request("journeys")
 
     def _set_weather(self):
-        self.stackedWidget.setCurrentIndex(5)
-        self.weatherWidget.fetch_weather()
+        self.stackedWidget.setCurrentIndex(WEATHER_SCREEN)
+        self._request_refresh("weather")
+
+    def _set_agenda(self):
+        self.stackedWidget.setCurrentIndex(AGENDA_SCREEN)
+        self._request_refresh("agenda")
+
+    def _next_news_source(self):
+        if not self._is_available("news"):
+            return
+        self.news_manager.next_source()
+        self._request_refresh("news", force=True)
+
+    def _run_scheduler(self):
+        self.scheduler.tick(self.stackedWidget.currentIndex())
+
+    def _search_stations(self):
+        if not self._is_available("radio"):
+            return
+        self.radio_manager.model.set_query(self.radioSearchEdit.text())
+
+    def _select_station(self, name):
+        """Select the station `name` in the list, False if it is not listed"""
+        if not self._is_available("radio"):
+            return False
+        model = self.radio_manager.model
+        row = model.find_row(name)
+        if row < 0:
+            return False
+        self.radioListView.setCurrentIndex(model.index(row))
+        return True
 
     def _next_radio_station(self):
-        selected = self.radioListWidget.currentRow()
-        selected = (selected + 1) % self.radioListWidget.count()
-        self.radioListWidget.setCurrentRow(selected)
+        if not self._is_available("radio"):
+            return
+        model = self.radio_manager.model
+        selected = self.radioListView.currentIndex().row() + 1
+        if selected >= model.rowCount() and model.canFetchMore():
+            model.fetchMore()
+        if model.rowCount():
+            self.radioListView.setCurrentIndex(model.index(selected % model.rowCount()))
 
     def _play_radio(self):
         """Play selected radio station"""
-        selected_items = self.radioListWidget.selectedItems()
-        if selected_items:
-            self.radio_manager.play_radio(selected_items[0].text())
+        if not self._is_available("radio"):
+            return
+        selected = self.radioListView.selectedIndexes()
+        if selected:
+            self.radio_manager.play_radio(self.radio_manager.model.station_name(selected[0].row()))
+
+    def _play_station(self, name):
+        """Play a station chosen on the remote control, whether the list shows it or not"""
+        if not self._is_available("radio"):
+            return
+        self._select_station(name)
+        self.radio_manager.play_radio(name)
 
     def _play_pause(self):
+        if not self._is_available("radio"):
+            return False
         if self.radio_manager.played_station == "":
             self._play_radio()
             return True
@@ -173,11 +513,14 @@ class SmartClock(QtWidgets.QMainWindow):
 
     def _stop_radio(self):
         """Stop radio playback"""
+        if not self._is_available("radio"):
+            return
         self.radio_manager.stop_radio()
 
     def _set_volume(self, value):
         """Set radio volume"""
-        self.radio_manager.set_volume(value)
+        if self._is_available("radio"):
+            self.radio_manager.set_volume(value)
         self.volumeLabel.setText(f"{value}%")
     
     def _update_components(self):
@@ -185,8 +528,8 @@ class SmartClock(QtWidgets.QMainWindow):
         current_date = datetime.now()
         current_time = current_date.time()
 
-        self.train_manager.update(current_date, self.stackedWidget.currentIndex() == 4)
-        radio_status_message = self.radio_manager.get_status_message()
+        radio = self.subsystems.get("radio")
+        radio_status_message = radio.get_status_message() if radio else ""
 
         # update clock screen
         self.timeLabel.setText(current_time.strftime("%H:%M:%S"))
@@ -195,8 +538,6 @@ class SmartClock(QtWidgets.QMainWindow):
         # update status bar with time and radio message
         self.statusbar.showMessage(current_time.strftime("%H:%M:%S") + "  " + radio_status_message)
 
-        self.news_manager.update(current_date,  self.stackedWidget.currentIndex() == 1)
-
         if self.alarm_manager.start_if_necessary(current_date):
             # if alarm was started, change the button text to Stop Alarm, and move to alarm screen
             self.stopAlarmButton.setText("Stop Alarm")
@@ -206,10 +547,42 @@ class SmartClock(QtWidgets.QMainWindow):
         self.quit_signal.emit()
 
     def _quit(self):
+        if self.watchdog is not None:
+            self.watchdog.beat(self._current_state())
+            self.watchdog.stop()
+        log.info("Quitting")
+        self.scheduler.shutdown()
+        if self.snapshots is not None:
+            self.snapshots.close()
+        news = self.subsystems.get("news")
+        if news is not None and news.thumbnails is not None:
+            news.thumbnails.shutdown()
+        if news is not None and news.archive is not None:
+            if self.shown_screen == NEWS_SCREEN:
+                news.leave()
+            news.archive.close()
+        trains = self.subsystems.get("trains")
+        if trains is not None and trains.history is not None:
+            trains.history.close()
+        radio = self.subsystems.get("radio")
+        if radio is not None:
+            radio.radio_player.catalogue.close()
+        audio = self.subsystems.get("audio")
+        if audio is not None:
+            audio.close()
+        self.logs.stop()
         QtWidgets.QApplication.instance().quit()
 
 def main():
-    app = QtWidgets.QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Smart Clock")
+    parser.add_argument("--startup-report", action="store_true", help="print how long each start-up phase took")
+    parser.add_argument("--profile-startup", nargs="?", const="startup.collapsed", metavar="FILE",
+                        help="sample the stacks while the window is created and write them to FILE "
+                             "(collapsed format, for flamegraph.pl or speedscope)")
+    args, qt_args = parser.parse_known_args()
+    STARTUP.print_when_ready = args.startup_report
+
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
 
     # Force the style to be the same on all OSs:
     app.setStyle("Fusion")
@@ -231,8 +604,18 @@ def main():
     palette.setColor(QPalette.HighlightedText, Qt.black)
     app.setPalette(palette)
 
-    window = SmartClock()
-    start_server(window)
+    if args.profile_startup:
+        from profiler import SamplingProfiler
+        startup_profiler = SamplingProfiler(STARTUP_SAMPLE_INTERVAL)
+        startup_profiler.start()
+
+    with STARTUP.phase("create window"):
+        window = SmartClock()
+
+    if args.profile_startup:
+        with open(args.profile_startup, "w") as f:
+            f.write(startup_profiler.stop())
+        log.info("Start-up profile written to %s", args.profile_startup)
 
     window.show()
     window.showFullScreen()
@@ -0,0 +1,135 @@
+"""
+Mixing of the clock's sound sources into the buffers of the output stream: the alarm tone and
+the radio's decoded audio, ducked under the alarm, then the master volume. `mix` runs on the
+audio callback thread, it works in preallocated arrays and only holds a lock to copy frames.
+"""
+import threading
+import numpy as np
+from beeper import Beeper
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+# Radio audio buffered between VLC's decoder and the output (seconds)
+RADIO_BUFFER = 0.5
+# Radio audio gathered before it starts (again, after an underrun) so small hiccups are absorbed
+RADIO_PREBUFFER = 0.1
+# Time taken by the radio to fade down under the alarm, and back up
+DUCK_TIME = 0.3
+
+
+class PcmBuffer:
+    """Ring buffer of float32 frames, written by one thread and read by another"""
+    def __init__(self, capacity: int, channels: int = CHANNELS):
+        self.data = np.zeros((capacity, channels), dtype=np.float32)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        # frames written over before they were played (the writer ran ahead)
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def write(self, frames: np.ndarray):
+        with self.lock:
+            if len(frames) > self.capacity:
+                self.dropped += len(frames) - self.capacity
+                frames = frames[-self.capacity:]
+            count = len(frames)
+            overflow = self.size + count - self.capacity
+            if overflow > 0:
+                self.start = (self.start + overflow) % self.capacity
+                self.size -= overflow
+                self.dropped += overflow
+            end = (self.start + self.size) % self.capacity
+            first = min(count, self.capacity - end)
+            self.data[end:end + first] = frames[:first]
+            self.data[:count - first] = frames[first:]
+            self.size += count
+
+    def read_into(self, out: np.ndarray) -> int:
+        """Move up to len(out) frames into `out`, returns how many"""
+        with self.lock:
+            count = min(len(out), self.size)
+            first = min(count, self.capacity - self.start)
+            out[:first] = self.data[self.start:self.start + first]
+            out[first:count] = self.data[:count - first]
+            self.start = (self.start + count) % self.capacity
+            self.size -= count
+        return count
+
+    def clear(self):
+        with self.lock:
+            self.start = 0
+            self.size = 0
+
+
+class Mixer:
+    """
+    Sum of the alarm tone and the radio, times the master volume. Volumes are fractions (0-1)
+    and can be changed from any thread; the radio is faded rather than cut when ducked.
+    """
+    def __init__(self, alarm_volume: int, master_volume: int, duck_volume: int, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.tone = Beeper(alarm_volume, sample_rate)
+        self.radio = PcmBuffer(int(RADIO_BUFFER * sample_rate))
+        self.master_volume = master_volume / 100.0
+        self.radio_volume = 1.0
+        self.duck_volume = duck_volume / 100.0
+        self.alarm_on = False
+        self.radio_on = False
+        # gain applied to the radio at the end of the last buffer
+        self.radio_gain = 0.0
+        self.radio_started = False
+        # times the radio had fewer frames ready than the output asked for
+        self.radio_underruns = 0
+        self._allocate(0)
+
+    def _allocate(self, frame_count: int):
+        self.out = np.zeros((frame_count, CHANNELS), dtype=np.float32)
+        self.radio_frames = np.zeros((frame_count, CHANNELS), dtype=np.float32)
+        self.gains = np.zeros((frame_count, 1), dtype=np.float32)
+        self.ramp = (np.arange(1, frame_count + 1, dtype=np.float32) / max(frame_count, 1)).reshape(-1, 1)
+
+    def start_radio(self):
+        self.radio.clear()
+        self.radio_started = False
+        self.radio_on = True
+
+    def stop_radio(self):
+        self.radio_on = False
+        self.radio.clear()
+
+    def mix(self, frame_count: int) -> np.ndarray:
+        """Next `frame_count` frames of the output (interleaved float32)"""
+        if len(self.out) != frame_count:
+            self._allocate(frame_count)
+        out = self.out
+        out.fill(0.0)
+        if self.radio_on:
+            self._mix_radio(out, frame_count)
+        else:
+            self.radio_gain = 0.0
+        if self.alarm_on:
+            out += self.tone.generate_samples(frame_count)[:, np.newaxis]
+        out *= self.master_volume
+        np.clip(out, -1.0, 1.0, out=out)
+        return out
+
+    def _mix_radio(self, out: np.ndarray, frame_count: int):
+        if not self.radio_started:
+            if self.radio.size < RADIO_PREBUFFER * self.sample_rate:
+                return
+            self.radio_started = True
+        read = self.radio.read_into(self.radio_frames)
+        if read < frame_count:
+            self.radio_frames[read:] = 0.0
+            self.radio_underruns += 1
+            self.radio_started = False
+        target = self.radio_volume * (self.duck_volume if self.alarm_on else 1.0)
+        step = frame_count / (DUCK_TIME * self.sample_rate)
+        gain = min(max(target, self.radio_gain - step), self.radio_gain + step)
+        # linear ramp from the last gain to the new one over the buffer, a jump would click
+        np.multiply(self.ramp, gain - self.radio_gain, out=self.gains)
+        self.gains += self.radio_gain
+        self.radio_frames *= self.gains
+        out += self.radio_frames
+        self.radio_gain = gain
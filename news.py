@@ -1,23 +1,41 @@
-from typing import List, Dict
+import logging
+from typing import List, Dict, Optional
 from datetime import datetime
 from config import SmartClockConfig
 from api_news_reader import ApiNewsFetcher
 from rss_news_reader import RssNewsFetcher
+from news_archive import HeadlineArchive
+
+from widgets import LabelList, bold_font
+from snapshots import format_as_of
+
+log = logging.getLogger(__name__)
+
+# Put in front of the headlines first seen since the previous visit of the news screen
+NEW_MARKER = "NEW - "
+
+
+def normalise_headline(item: Dict) -> Dict:
+    """Fields of an API article or RSS item that the clock uses"""
+    return {
+        "title": item.get("title"),
+        "url": item.get("url") or item.get("link"),
+        "image": item.get("urlToImage") or item.get("thumbnail"),
+    }
 
-from PyQt5 import QtWidgets
-from PyQt5.QtGui import QFont
 
 class NewsFetcher():
     def __init__(self, config: SmartClockConfig):
         self.sources = []
         self.current_source = 0
         self.news_count = config.get_max_stories()
+        timeout = config.get_network_timeouts()
         for new_config in config.get_news_sources():
             match new_config.type:
                 case "api":
-                   self.sources.append((new_config.name, ApiNewsFetcher(new_config, self.news_count)))
+                   self.sources.append((new_config.name, ApiNewsFetcher(new_config, self.news_count, timeout)))
                 case "rss":
-                   self.sources.append((new_config.name, RssNewsFetcher(new_config)))
+                   self.sources.append((new_config.name, RssNewsFetcher(new_config, timeout)))
     
     def get_current_source(self) -> str:
         if self.current_source < len(self.sources):
@@ -29,51 +47,141 @@ class NewsFetcher():
             return
         self.current_source = (self.current_source + 1) % len(self.sources)
 
+    def get_current_type(self) -> str:
+        return self.get_type(self.get_current_source())
+
+    def get_type(self, source_name: str) -> str:
+        """Provider of a source by name (rate limits are per provider), "rss" if there is no such source"""
+        for name, fetcher in self.sources:
+            if name == source_name:
+                return "newsapi" if isinstance(fetcher, ApiNewsFetcher) else "rss"
+        return "rss"
+
     def get_top_headlines(
         self,
     ) -> List[Dict]:
         if len(self.sources) == 0:
             return []
-        return self.sources[self.current_source][1].get_top_headlines()[0:self.news_count]
+        return self.get_headlines(self.sources[self.current_source][0])
+
+    def get_headlines(self, source_name: str) -> List[Dict]:
+        """Headlines of a source by name, raises KeyError if there is no such source"""
+        for name, fetcher in self.sources:
+            if name == source_name:
+                return [normalise_headline(item) for item in fetcher.get_top_headlines()[0:self.news_count]]
+        raise KeyError(f"Unknown news source: {source_name}")
     
 
 class NewsManager():
-    def __init__(self, config: SmartClockConfig, newsHeaderLabel, newsLayout):
+    def __init__(self, config: SmartClockConfig, newsHeaderLabel, newsLayout, hub=None):
         # setup train/news API
         self.news_reader = NewsFetcher(config)
+        self.hub = hub
         self.newsHeaderLabel = newsHeaderLabel
-        self.newsLayout = newsLayout
-        self.news_labels = []
+        self.header_text = "Latest News"
         self.last_update = datetime.now()
-        self.update_every_minutes = config.get_news_update_interval()
+        if config.get_thumbnails_enabled():
+            from thumbnails import ThumbnailLoader, THUMBNAIL_SIZE
+            self.thumbnails = ThumbnailLoader(config)
+            self.thumbnails.loaded.connect(self.show_thumbnail)
+            self.news_labels = LabelList(newsLayout, bold_font('Times', 15), icon_size=THUMBNAIL_SIZE)
+        else:
+            self.thumbnails = None
+            self.news_labels = LabelList(newsLayout, bold_font('Times', 15))
+        # image URL of each row
+        self.images: List[Optional[str]] = []
+        archive_file = config.get_news_archive_file()
+        self.archive = HeadlineArchive(archive_file, config.get_news_archive_days()) if archive_file else None
+        # headlines first seen after this time are new (end of the previous visit)
+        self.since = 0.0
+        self.headlines: List[Dict] = []
+        self.rows: List[str] = []
+
+    def fetch(self):
+        """Get the headlines of the current source (runs on a refresh thread)"""
+        source = self.news_reader.get_current_source()
+        headlines, fetched_at = None, None
+        if self.hub is not None and source:
+            headlines = self.hub.get("news", source)
+            # headlines the hub could not refresh are shown as of when they were fetched
+            fetched_at = self.hub.stale_since("news", source) if headlines is not None else None
+        if headlines is None:
+            headlines = self.news_reader.get_top_headlines()
+        return source, self.add_archive(source, headlines), fetched_at
+
+    def add_archive(self, source, headlines):
+        """Record the headlines, and add when each was first seen to a copy of them"""
+        if self.archive is None:
+            return headlines
+        try:
+            return self.archive.record(source, headlines)
+        except Exception as e:
+            log.warning("Could not record headlines: %s", e)
+            return headlines
 
     def update_news(self):
         """Update news content"""
-        # Get top headlines
-        headlines = self.news_reader.get_top_headlines()
-        self.last_update = datetime.now()
+        self.render(self.fetch())
+
+    def render(self, result, as_of: Optional[datetime] = None):
+        """Display the headlines of a source, `as_of` when they are old (snapshot, stale hub data)"""
+        source, headlines, fetched_at = result
+        if fetched_at:
+            as_of = datetime.fromtimestamp(fetched_at)
+        # read everything before touching the screen, so bad data leaves the previous headlines
+        rows = self.format_rows(headlines)
+        self.last_update = as_of or datetime.now()
         # Update header
-        self.newsHeaderLabel.setText(f"Latest News : {self.news_reader.get_current_source()} - updated @ {self.last_update.strftime('%H:%M:%S')}")
+        updated = format_as_of(as_of) if as_of else f"updated @ {self.last_update.strftime('%H:%M:%S')}"
+        self.header_text = f"Latest News : {source} - {updated}"
+        self.newsHeaderLabel.setText(self.header_text)
+
+        self.show_headlines(headlines, rows)
 
+    def format_rows(self, headlines) -> List[str]:
+        return [(NEW_MARKER if item.get("first_seen", 0.0) > self.since else "") + item["title"] for item in headlines]
+
+    def show_headlines(self, headlines, rows):
+        self.headlines = headlines
+        images = [item.get("image") for item in headlines] if self.thumbnails is not None else []
+        # the same stories as on screen: nothing to do
+        if rows == self.rows and images == self.images:
+            return
+        self.rows = rows
 
         # Update the list component with data from the news
-        for label in self.news_labels:
-            label.deleteLater()
-        self.news_labels.clear()
-
-        for item in headlines:
-            label = QtWidgets.QLabel(item["title"])
-            font = QFont('Times', 15)
-            font.setBold(True)
-            label.setFont(font)
-            self.newsLayout.addWidget(label)
-            self.news_labels.append(label)
+        self.news_labels.set_texts(rows)
+        if self.thumbnails is not None:
+            self.images = images
+            for row, url in enumerate(self.images):
+                self.news_labels.set_icon(row, self.thumbnails.get(url) if url else None)
+                if url:
+                    self.thumbnails.request(url)
+
+    def enter(self):
+        """The news screen is shown: headlines first seen since the end of the previous visit are new"""
+        if self.archive is None:
+            return
+        self.since = self.archive.last_viewed(self.news_reader.get_current_source())
+        self.show_headlines(self.headlines, self.format_rows(self.headlines))
+
+    def leave(self):
+        """The news screen is left (or shows another source): its headlines have been seen"""
+        if self.archive is not None:
+            self.archive.mark_viewed(self.news_reader.get_current_source())
+
+    def show_thumbnail(self, url):
+        """A thumbnail finished loading"""
+        for row, image in enumerate(self.images):
+            if image == url and row < len(self.news_labels):
+                self.news_labels.set_icon(row, self.thumbnails.get(url))
+
+    def show_stale(self, last_success):
+        """Keep the last headlines on screen, flagged as out of date"""
+        self.newsHeaderLabel.setText(f"{self.header_text} (stale, news unavailable)" if last_success else "Latest News : unavailable")
 
     def next_source(self):
+        self.leave()
         self.news_reader.next_source()
-        self.update_news()
+        self.enter()
 
-    def update(self, current_time, visible):
-        difference_minutes = (current_time - self.last_update).total_seconds() / 60
-        if (difference_minutes > self.update_every_minutes) and visible:
-            self.update_news()
\ No newline at end of file
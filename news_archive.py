@@ -0,0 +1,146 @@
+"""
+Headline archive: every headline fetched, from any source, is kept in a small SQLite database
+with an FTS5 index of the titles, for the search of the remote control. A headline is the same
+story if its URL or its title (case and spaces aside) was seen before, so a story is stored
+once however often it is fetched and whichever source carries it.
+
+The time a story was first seen is what makes it "new": it is new if it was first seen after
+the end of the previous visit of the news screen. Stories not seen for `retention_days` are deleted.
+"""
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+# Pruning runs with a recording at most this often (seconds)
+PRUNE_INTERVAL = 3600
+WORD = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS headlines (
+    id INTEGER PRIMARY KEY,
+    url_hash TEXT,
+    title_hash TEXT NOT NULL,
+    source TEXT NOT NULL,
+    title TEXT NOT NULL,
+    url TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS headlines_url ON headlines (url_hash);
+CREATE INDEX IF NOT EXISTS headlines_title ON headlines (title_hash);
+CREATE INDEX IF NOT EXISTS headlines_last_seen ON headlines (last_seen);
+CREATE VIRTUAL TABLE IF NOT EXISTS headlines_fts USING fts5 (title, content='headlines', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS headlines_insert AFTER INSERT ON headlines BEGIN
+    INSERT INTO headlines_fts (rowid, title) VALUES (new.id, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS headlines_delete AFTER DELETE ON headlines BEGIN
+    INSERT INTO headlines_fts (headlines_fts, rowid, title) VALUES ('delete', old.id, old.title);
+END;
+CREATE TABLE IF NOT EXISTS views (
+    source TEXT PRIMARY KEY,
+    viewed REAL NOT NULL
+);
+"""
+
+
+def digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def title_digest(title: str) -> str:
+    return digest(" ".join(title.lower().split()))
+
+
+def match_query(text: str) -> Optional[str]:
+    """FTS5 query finding titles with every word of `text` (the last one as a prefix), None without words"""
+    words = WORD.findall(text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+class HeadlineArchive:
+    """
+    Headlines seen so far. `record` is called from a refresh thread, `last_viewed` and `mark_viewed`
+    from the UI thread (they do not touch the database), `search` from the remote control's thread.
+    """
+    def __init__(self, path: str, retention_days: float, clock=time.time):
+        self.clock = clock
+        self.retention = retention_days * 24 * 3600
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # only applies to a new database: pruned pages are given back to the file system
+        self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.last_prune = 0.0
+        # source -> end of the last visit of its headlines, saved with the next recording
+        self.views: Dict[str, float] = dict(self.db.execute("SELECT source, viewed FROM views"))
+        self.saved_views: Dict[str, float] = dict(self.views)
+
+    def record(self, source: str, headlines: List[Dict]) -> List[Dict]:
+        """Store headlines (see news.normalise_headline), returns them with the time each was first seen"""
+        now = self.clock()
+        recorded = []
+        with self.lock:
+            with self.db:
+                for headline in headlines:
+                    title = headline.get("title") or ""
+                    url = headline.get("url")
+                    url_hash = digest(url) if url else None
+                    title_hash = title_digest(title)
+                    row = self.db.execute("SELECT id, first_seen FROM headlines WHERE url_hash = ? OR title_hash = ? LIMIT 1",
+                                          (url_hash, title_hash)).fetchone()
+                    if row is None:
+                        self.db.execute("INSERT INTO headlines (url_hash, title_hash, source, title, url, first_seen, last_seen) "
+                                        "VALUES (?, ?, ?, ?, ?, ?, ?)", (url_hash, title_hash, source, title, url, now, now))
+                        first_seen = now
+                    else:
+                        self.db.execute("UPDATE headlines SET last_seen = ? WHERE id = ?", (now, row[0]))
+                        first_seen = row[1]
+                    recorded.append(dict(headline, first_seen=first_seen))
+                self._save_views()
+                pruned = now - self.last_prune >= PRUNE_INTERVAL
+                if pruned:
+                    self.last_prune = now
+                    self.db.execute("DELETE FROM headlines WHERE last_seen < ?", (now - self.retention,))
+            if pruned:
+                # it frees pages one step at a time, fetching the rows runs it to the end
+                self.db.execute("PRAGMA incremental_vacuum").fetchall()
+        return recorded
+
+    def _save_views(self):
+        views = dict(self.views)
+        changed = [(source, viewed) for source, viewed in views.items() if self.saved_views.get(source) != viewed]
+        self.db.executemany("INSERT OR REPLACE INTO views VALUES (?, ?)", changed)
+        self.saved_views = views
+
+    def last_viewed(self, source: str) -> float:
+        """When the headlines of `source` were last left (0 if never shown)"""
+        return self.views.get(source, 0.0)
+
+    def mark_viewed(self, source: str):
+        """The headlines of `source` were on screen until now"""
+        self.views[source] = self.clock()
+
+    def search(self, text: str, limit: int = 50) -> List[Dict]:
+        """Headlines whose title has every word of `text`, the most recent first"""
+        query = match_query(text)
+        if query is None:
+            return []
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT h.source, h.title, h.url, h.first_seen FROM headlines_fts "
+                "JOIN headlines h ON h.id = headlines_fts.rowid "
+                # ids grow with first_seen, and FTS5 reads its matches by descending rowid without sorting them
+                "WHERE headlines_fts MATCH ? ORDER BY headlines_fts.rowid DESC LIMIT ?", (query, limit)).fetchall()
+        return [{"source": source, "title": title, "url": url, "first_seen": first_seen}
+                for source, title, url, first_seen in rows]
+
+    def close(self):
+        with self.lock:
+            with self.db:
+                self._save_views()
+            self.db.close()
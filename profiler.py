@@ -0,0 +1,87 @@
+"""
+Sampling profiler for a clock in the field: a thread looks at the stack of every other thread
+(sys._current_frames) every few milliseconds and counts identical stacks. The result is in the
+"collapsed" format read by flamegraph.pl and speedscope: one line per stack, the thread name then
+the frames from the outermost, separated by ';', followed by the number of samples.
+
+It measures wall-clock time: a thread blocked in C (a socket, VLC, PortAudio) is sampled at
+the Python line that called into C. Threads started outside Python (the PortAudio callback, VLC's)
+only appear while they run Python code.
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from types import CodeType
+from typing import Dict, Tuple
+
+SAMPLE_INTERVAL = 0.005
+MAX_SECONDS = 120
+
+# Only one profile at a time, each one slows every thread down a little
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Another profile is running"""
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        # (thread name, code objects from the outermost frame) -> samples
+        self.samples: Counter = Counter()
+        self.labels: Dict[CodeType, str] = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling, returns the collapsed stacks"""
+        self.stopped.set()
+        self.thread.join()
+        return self.collapsed()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples[(names.get(ident, f"thread-{ident}"), tuple(stack))] += 1
+
+    def _label(self, code: CodeType) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+            self.labels[code] = label
+        return label
+
+    def collapsed(self) -> str:
+        lines = []
+        for (thread, stack), count in self.samples.items():
+            frames: Tuple[str, ...] = (thread.replace(";", ","),) + tuple(self._label(code) for code in stack)
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(sorted(lines)) + "\n"
+
+
+def profile(seconds: float) -> str:
+    """Sample every thread for `seconds`, raises ProfilerBusy when a profile is already running"""
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        profiler = SamplingProfiler()
+        profiler.start()
+        time.sleep(seconds)
+        return profiler.stop()
+    finally:
+        _running.release()
@@ -1,49 +1,66 @@
+import logging
 import vlc
-from typing import Optional, Dict
+from typing import List, Optional
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
 from config import SmartClockConfig
+from station_catalogue import Station, StationCatalogue, name_key
+
+log = logging.getLogger(__name__)
+
+# Stations read from the catalogue each time the list is scrolled to its end
+PAGE_SIZE = 100
+# Stations listed for a search
+SEARCH_LIMIT = 200
+
 
 class RadioPlayer:
-    def __init__(self, config: SmartClockConfig):
+    def __init__(self, config: SmartClockConfig, audio=None):
         # Initialize VLC instance
         self.instance = vlc.Instance('--no-xlib')
         self.player = self.instance.media_player_new()
-        self.player.audio_set_volume(config.get_radio_volume())
+        # played through the clock's audio engine (see audio_engine.py) when there is one
+        self.audio = audio
+        if audio is not None:
+            audio.attach(self.player)
+        self.set_volume(config.get_radio_volume())
         self.current_station: Optional[str] = None
         self.is_playing = False
-        
-        # Dictionary of radio stations and their stream URLs
-        self.stations: Dict[str, str] = {stream.name: stream.uri for stream in config.get_radio_streams()}
+
+        # Radio stations and their stream URLs, the configuration's and the imported playlists'
+        self.catalogue = StationCatalogue(config.get_radio_catalogue_file())
+        self.catalogue.sync_config(config.get_radio_streams())
 
     def add_station(self, name: str, url: str):
         """Add a new radio station"""
-        self.stations[name] = url
-        self.save_stations()
+        self.catalogue.add(Station(name, url))
 
     def remove_station(self, name: str):
         """Remove a radio station"""
-        if name in self.stations:
-            del self.stations[name]
-            self.save_stations()
+        self.catalogue.remove(name)
 
     def play(self, station_name: str) -> bool:
         """Play selected radio station"""
         try:
-            if station_name in self.stations:
+            station = self.catalogue.find(station_name)
+            if station is not None:
                 # Stop current playback if any
                 self.stop()
                 
                 # Create and play new media
-                url = self.stations[station_name]
-                media = self.instance.media_new(url)
+                media = self.instance.media_new(station.url)
                 self.player.set_media(media)
+                # the player holds its own reference
+                media.release()
+                if self.audio is not None:
+                    self.audio.mixer.start_radio()
                 self.player.play()
                 
-                self.current_station = station_name
+                self.current_station = station.name
                 self.is_playing = True
                 return True
             return False
         except Exception as e:
-            print(f"Error playing station: {e}")
+            log.error("Error playing station %s: %s", station_name, e)
             return False
 
     def get_current_track(self):
@@ -55,28 +72,35 @@ class RadioPlayer:
         """
         media = self.player.get_media()
         if media:
-            media.parse_with_options(vlc.MediaParseFlag.local, 0)
-            return media.get_meta(vlc.Meta.NowPlaying)
+            # get_media returns a new reference, called every second it must be released
+            try:
+                media.parse_with_options(vlc.MediaParseFlag.local, 0)
+                return media.get_meta(vlc.Meta.NowPlaying)
+            finally:
+                media.release()
         return None
 
     def stop(self):
         """Stop radio playback"""
         self.player.stop()
+        if self.audio is not None:
+            self.audio.mixer.stop_radio()
         self.is_playing = False
         self.current_station = None
 
     def set_volume(self, volume: int):
         """Set volume (0-100)"""
-        self.player.audio_set_volume(volume)
+        if self.audio is not None:
+            self.audio.mixer.radio_volume = volume / 100.0
+        else:
+            self.player.audio_set_volume(volume)
 
     def get_volume(self) -> int:
         """Get current volume"""
+        if self.audio is not None:
+            return round(self.audio.mixer.radio_volume * 100)
         return self.player.audio_get_volume()
 
-    def get_station_list(self) -> list:
-        """Get list of available stations"""
-        return list(self.stations.keys())
-
     def get_current_station(self) -> Optional[str]:
         """Get currently playing station name"""
         return self.current_station
@@ -86,23 +110,107 @@ class RadioPlayer:
         return self.is_playing
 
 
+class StationListModel(QAbstractListModel):
+    """
+    The stations of the catalogue for a list view, read a page at a time as the list is scrolled
+    (canFetchMore/fetchMore), or the results of a search. The view only asks for the visible rows.
+    """
+    def __init__(self, catalogue: StationCatalogue, page_size: int = PAGE_SIZE):
+        super().__init__()
+        self.catalogue = catalogue
+        self.page_size = page_size
+        self.query = ""
+        self.stations: List[Station] = []
+        # sort key of the last station read, None once the whole catalogue is read
+        self.last_key: Optional[str] = ""
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.stations)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        station = self.stations[index.row()]
+        if role == Qt.DisplayRole:
+            return station.name
+        if role == Qt.ToolTipRole:
+            bitrate = f"{station.bitrate} kbps" if station.bitrate else ""
+            return " - ".join(filter(None, (station.genre, station.country, bitrate))) or None
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.last_key is not None
+
+    def fetchMore(self, parent=QModelIndex()):
+        page = self.catalogue.page(self.last_key, self.page_size)
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.stations), len(self.stations) + len(page) - 1)
+            self.stations.extend(station for _, station in page)
+            self.endInsertRows()
+        self.last_key = page[-1][0] if len(page) == self.page_size else None
+
+    def set_query(self, text: str):
+        """Show the stations found for `text`, or the whole catalogue when it is empty"""
+        self.beginResetModel()
+        self.query = text.strip()
+        if self.query:
+            self.stations = self.catalogue.search(self.query, SEARCH_LIMIT)
+            self.last_key = None
+        else:
+            self.stations = []
+            self.last_key = ""
+        self.endResetModel()
+
+    def reload(self):
+        self.set_query(self.query)
+
+    def station_name(self, row: int) -> Optional[str]:
+        return self.stations[row].name if 0 <= row < len(self.stations) else None
+
+    def find_row(self, name: str) -> int:
+        """Row of the station `name`, reading more of the catalogue if needed, -1 if it is not listed"""
+        key = name_key(name)
+        row = 0
+        while True:
+            for row in range(row, len(self.stations)):
+                if name_key(self.stations[row].name) == key:
+                    return row
+            row = len(self.stations)
+            if not self.canFetchMore():
+                return -1
+            self.fetchMore()
+
+
 class RadioManager():
 
-    def __init__(self, config: SmartClockConfig):
+    def __init__(self, config: SmartClockConfig, audio=None):
         self.config = config
-        self.radio_player = RadioPlayer(config)
+        self.radio_player = RadioPlayer(config, audio)
+        self.model = StationListModel(self.radio_player.catalogue)
         self.status_message = ""
         self.played_station = ""
 
-    def update_radio_list(self, radioListWidget, volumeSlider):
+    def update_radio_list(self, radioListView, volumeSlider):
         """Update the radio stations list"""
-        radioListWidget.clear()
-        radioListWidget.addItems(self.radio_player.get_station_list())
+        radioListView.setModel(self.model)
         volumeSlider.setValue(self.config.get_radio_volume())
 
+    def import_playlists(self) -> int:
+        """Import the configured playlists that changed (on a refresh thread)"""
+        return self.radio_player.catalogue.import_playlists(self.config.get_radio_playlists())
+
+    def show_imported(self, count: int):
+        if count:
+            log.info("%d radio stations imported", count)
+            self.model.reload()
+
+    def search(self, text: str, limit: int = 50) -> List[Station]:
+        return self.radio_player.catalogue.search(text, limit)
+
     def play_radio(self, station):
         """Play radio station"""
         if self.radio_player.play(station):
+            station = self.radio_player.get_current_station()
             self.status_message = f"Playing: {station}"
             self.played_station = station
         else:
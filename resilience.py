@@ -0,0 +1,66 @@
+import logging
+import time
+import threading
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider that keeps failing.
+
+    After `failure_threshold` consecutive failures the breaker opens and no call is allowed for
+    `reset_timeout` seconds. It then lets a single probe through (half-open): success closes the
+    breaker, failure opens it for another `reset_timeout`.
+    """
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Check if a call may be made now"""
+        with self.lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.state == HALF_OPEN:
+                return not self.probing
+            return self.state == CLOSED
+
+    def on_call(self):
+        """Record that a call allowed by `allow` is being made"""
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.probing = True
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    log.warning("Circuit breaker for %s opened after %d failures", self.name, self.failures)
+                self.state = OPEN
+                self.opened_at = self.clock()
+
+    def is_open(self) -> bool:
+        return self.state != CLOSED
@@ -3,10 +3,13 @@ from typing import List, Dict
 from config import NewsSource
 from xml.etree import ElementTree
 
+MEDIA_THUMBNAIL = "{http://search.yahoo.com/mrss/}thumbnail"
+
 class RssNewsFetcher:
-    def __init__(self, config: NewsSource):
+    def __init__(self, config: NewsSource, timeout: tuple[float, float]):
         """Initialize RssNewsFetcher"""
         self.url = config.url
+        self.timeout = timeout
 
     def get_top_headlines(
         self,
@@ -21,7 +24,7 @@ class RssNewsFetcher:
             page_size: Number of results to return (max 100)
         """
             
-        response = requests.get(self.url)
+        response = requests.get(self.url, timeout=self.timeout)
         response.raise_for_status()
         
         tree = ElementTree.fromstring(response.content)
@@ -33,7 +36,10 @@ class RssNewsFetcher:
                     if item.tag == "item":
                         headline = {}
                         for entry in item:
-                            headline[entry.tag] = entry.text
+                            if entry.tag == MEDIA_THUMBNAIL:
+                                headline.setdefault("thumbnail", entry.get("url"))
+                            else:
+                                headline[entry.tag] = entry.text
                         headlines.append(headline)
                     if len(headlines) == 5:
                         break
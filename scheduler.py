@@ -0,0 +1,203 @@
+import logging
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Union
+from datetime import datetime
+from config import SmartClockConfig
+from resilience import CircuitBreaker
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Rate limiter: `burst` requests at once, refilled at `rate` requests per second"""
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.clock = clock
+        self.last_refill = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available"""
+        self._refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def seconds_until_available(self) -> float:
+        self._refill()
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class RefreshJob:
+    """
+    One provider refresh: `fetch` runs on a worker thread, `on_result` and `on_stale` on the UI thread.
+    `on_stale` is told when the last good data was fetched each time a refresh fails. `snapshot` is
+    True to save each result for the next start, or turns a result into the plain data to save.
+    """
+    def __init__(self, name: str, fetch: Callable[[], Any], on_result: Callable[[Any], None],
+                 interval: Optional[float], provider: Union[str, Callable[[], str]], screen: Optional[int],
+                 on_stale: Optional[Callable[[Optional[datetime]], None]] = None,
+                 snapshot: Union[bool, Callable[[Any], Any]] = False):
+        self.name = name
+        self.fetch = fetch
+        self.on_result = on_result
+        self.on_stale = on_stale
+        self.snapshot = snapshot
+        self.interval = interval
+        self.provider = provider
+        self.screen = screen
+        self.next_due: Optional[float] = None
+        self.requested = False
+        self.future: Optional[Future] = None
+        self.fetching_provider: Optional[str] = None
+        self.last_result: Any = None
+        self.last_success: Optional[datetime] = None
+
+    def get_provider(self) -> str:
+        return self.provider() if callable(self.provider) else self.provider
+
+
+class RefreshScheduler:
+    """
+    Owns the refresh of every provider.
+
+    Periodic jobs refresh every `interval` seconds (with jitter, so a fleet of clocks does not hit
+    the upstream APIs at the same second) while their screen is visible. Explicit refresh
+    requests (buttons, screen changes, remote API) are coalesced: any number of requests made
+    before the fetch starts, or while it is running, result in a single fetch. Every fetch takes
+    a token from its provider's bucket, so API quotas are respected whatever the users do.
+    When several jobs are ready, the one of the visible screen goes first.
+
+    Each provider also has a circuit breaker: once it is open, a dead API costs a cheap check per
+    tick instead of a fetch, and the screen keeps showing the last good data marked as stale.
+    """
+    def __init__(self, config: SmartClockConfig, clock: Callable[[], float] = time.monotonic, snapshots=None):
+        self.config = config
+        # SnapshotStore the results of the jobs with a `snapshot` are saved to
+        self.snapshots = snapshots
+        self.clock = clock
+        self.jitter = config.get_refresh_jitter()
+        self.jobs: Dict[str, RefreshJob] = {}
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=config.get_refresh_workers(), thread_name_prefix="refresh")
+
+    def add_job(self, name: str, fetch: Callable[[], Any], on_result: Callable[[Any], None],
+                interval: Optional[float] = None, provider: Union[str, Callable[[], str], None] = None,
+                screen: Optional[int] = None,
+                on_stale: Optional[Callable[[Optional[datetime]], None]] = None,
+                snapshot: Union[bool, Callable[[Any], Any]] = False) -> RefreshJob:
+        """
+        Register a job, `interval` None means it only refreshes on request. A periodic job without
+        a `screen` refreshes whatever the screen shown.
+        """
+        job = RefreshJob(name, fetch, on_result, interval, provider or name, screen, on_stale, snapshot)
+        if interval is not None:
+            # spread the first refresh so clocks restarted together do not stay in sync
+            job.next_due = self.clock() + random.uniform(0, interval * self.jitter)
+        self.jobs[name] = job
+        return job
+
+    def get_bucket(self, provider: str) -> TokenBucket:
+        if provider not in self.buckets:
+            rate, burst = self.config.get_rate_limit(provider)
+            self.buckets[provider] = TokenBucket(rate, burst, self.clock)
+        return self.buckets[provider]
+
+    def get_breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self.breakers:
+            failures, reset = self.config.get_breaker_settings()
+            self.breakers[provider] = CircuitBreaker(provider, failures, reset, self.clock)
+        return self.breakers[provider]
+
+    def try_acquire(self, provider: str) -> bool:
+        """Take a token of `provider` for a call made by a fetch besides its own (thread safe)"""
+        with self.lock:
+            return self.get_bucket(provider).try_acquire()
+
+    def request(self, name: str, force: bool = False):
+        """
+        Ask for a refresh as soon as possible (thread safe, duplicate requests are merged).
+        A request made while the job is fetching is served by that fetch, unless `force`
+        is set because what the job fetches has changed (e.g. new news source).
+        """
+        with self.lock:
+            if force or not self.is_running(name):
+                self.jobs[name].requested = True
+
+    def is_running(self, name: str) -> bool:
+        future = self.jobs[name].future
+        return future is not None and not future.done()
+
+    def _schedule_next(self, job: RefreshJob):
+        if job.interval is not None:
+            job.next_due = self.clock() + job.interval * (1.0 + random.uniform(-self.jitter, self.jitter))
+
+    def _harvest(self):
+        """Deliver finished fetches on the calling (UI) thread"""
+        for job in self.jobs.values():
+            if job.future is None or not job.future.done():
+                continue
+            future, job.future = job.future, None
+            breaker = self.get_breaker(job.fetching_provider)
+            try:
+                result = future.result()
+                job.on_result(result)
+            except Exception as e:
+                breaker.record_failure()
+                self.on_error(job, e)
+                continue
+            breaker.record_success()
+            job.last_result = result
+            job.last_success = datetime.now()
+            if job.snapshot and self.snapshots is not None:
+                self.snapshots.save(job.name, result if job.snapshot is True else job.snapshot(result))
+
+    def on_error(self, job: RefreshJob, error: Exception):
+        log.warning("Error refreshing %s: %s", job.name, error)
+        if job.on_stale is not None:
+            job.on_stale(job.last_success)
+
+    def _ready_jobs(self, visible_screen: Optional[int]) -> List[RefreshJob]:
+        now = self.clock()
+        ready = []
+        for job in self.jobs.values():
+            if job.future is not None:
+                continue
+            due = job.next_due is not None and now >= job.next_due and job.screen in (None, visible_screen)
+            if job.requested or due:
+                ready.append(job)
+        # visible screen first, then explicit requests, then the most overdue
+        ready.sort(key=lambda job: (job.screen != visible_screen, not job.requested, job.next_due or now))
+        return ready
+
+    def tick(self, visible_screen: Optional[int] = None):
+        """Called periodically from the UI thread"""
+        self._harvest()
+        with self.lock:
+            for job in self._ready_jobs(visible_screen):
+                provider = job.get_provider()
+                breaker = self.get_breaker(provider)
+                if not breaker.allow() or not self.get_bucket(provider).try_acquire():
+                    continue
+                breaker.on_call()
+                job.requested = False
+                job.fetching_provider = provider
+                self._schedule_next(job)
+                job.future = self.executor.submit(job.fetch)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,6 +1,9 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
+import logging
 import threading
+from dataclasses import asdict
 from datetime import datetime
+import profiler
 
 # Flask server to handle remote control
 app = Flask(__name__)
@@ -46,6 +49,11 @@ def set_weather():
     app.window.set_weather()
     return jsonify({'result': 'ok'})
 
+@app.route('/api/set_agenda', methods=['POST'])
+def set_agenda():
+    app.window.set_agenda()
+    return jsonify({'result': 'ok'})
+
 @app.route('/api/toggle_running', methods=['POST'])
 def toggle_running():
     is_running = app.window.play_pause()
@@ -60,6 +68,55 @@ def get_status():
         'track': app.window.radio_manager.get_current_track()
     })
 
+@app.route('/api/audio', methods=['GET', 'POST'])
+def audio():
+    engine = app.window.audio_engine
+    if request.method == 'POST':
+        engine.set_master_volume(max(0, min(100, int(request.get_json()['volume']))))
+    return jsonify(engine.stats())
+
+@app.route('/api/watchdog', methods=['GET'])
+def watchdog():
+    if app.window.watchdog is None:
+        return jsonify({'enabled': False})
+    return jsonify(app.window.watchdog.stats())
+
+@app.route('/api/logs', methods=['GET'])
+def logs():
+    level = logging.getLevelName(request.args.get('level', 'NOTSET').upper())
+    if not isinstance(level, int):
+        return jsonify({'error': f"unknown level {request.args['level']}"}), 400
+    limit = request.args.get('limit', type=int)
+    return jsonify(app.window.logs.get_records(level, limit))
+
+@app.route('/api/profile', methods=['GET'])
+def profile_threads():
+    seconds = request.args.get('seconds', 10, type=float)
+    if not 0 < seconds <= profiler.MAX_SECONDS:
+        return jsonify({'error': f"seconds must be between 0 and {profiler.MAX_SECONDS}"}), 400
+    try:
+        stacks = profiler.profile(seconds)
+    except profiler.ProfilerBusy:
+        return jsonify({'error': 'a profile is already running'}), 409
+    return Response(stacks, mimetype='text/plain')
+
+@app.route('/api/news/search', methods=['GET'])
+def search_news():
+    archive = app.window.news_manager.archive
+    if archive is None:
+        return jsonify({'error': 'the news archive is disabled'}), 404
+    return jsonify(archive.search(request.args.get('q', ''), request.args.get('limit', 50, type=int)))
+
+@app.route('/api/radio/stations', methods=['GET'])
+def search_stations():
+    stations = app.window.radio_manager.search(request.args.get('q', ''), request.args.get('limit', 50, type=int))
+    return jsonify([asdict(station) for station in stations])
+
+@app.route('/api/radio/play', methods=['POST'])
+def play_station():
+    app.window.play_station(request.get_json()['station'])
+    return jsonify({'result': 'ok'})
+
 @app.route('/api/restart', methods=['POST'])
 def restart():
     is_running = app.window.quit()
@@ -73,5 +130,13 @@ def run_server():
 def start_server(window):
     # Start Flask server in a separate thread
     app.window = window
+    if window.config.get_hub_mode() == "server":
+        # serve trains/news/weather to the other clocks of the network
+        from hub import HubCache, create_blueprint, create_fetchers
+        fetchers, providers = create_fetchers(window.config)
+        # the quotas of the providers are shared with the clock's own refreshes
+        hub_cache = HubCache(window.config, fetchers, window.scheduler.try_acquire, providers)
+        hub_cache.start()
+        app.register_blueprint(create_blueprint(hub_cache))
     server_thread = threading.Thread(target=run_server, daemon=True)
     server_thread.start()
\ No newline at end of file
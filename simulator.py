@@ -0,0 +1,233 @@
+"""
+Local stand-in for the National Rail (OpenLDBWS), NewsAPI, RSS and OpenWeatherMap endpoints.
+
+Serves recorded responses (benchmarks/fixtures by default) with configurable latency, error rate,
+truncated bodies and hangs, so timeouts and caching can be tuned without hitting the real services.
+Set `enabled = true` in the [simulator] section of config.toml to point every provider at it.
+
+    python3 simulator.py
+    python3 simulator.py --latency-ms 800 --distribution lognormal --error-rate 0.2 --hang-rate 0.05
+"""
+import os
+import re
+import time
+import random
+import argparse
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+from flask import Flask, Response, jsonify, request
+from config import SmartClockConfig
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "fixtures")
+PROVIDERS = ("trains", "news", "weather")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+SOAP_FAULT = b"""<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+  <soap:Body>
+    <soap:Fault>
+      <faultcode>soap:Server</faultcode>
+      <faultstring>Simulated server error</faultstring>
+    </soap:Fault>
+  </soap:Body>
+</soap:Envelope>
+"""
+
+
+class FaultInjector:
+    """
+    Decides, per request, how late and how broken a simulated response is.
+
+    Settings (all optional):
+        distribution: "fixed", "uniform", "exponential" or "lognormal" (default "fixed")
+        latency_ms: fixed latency, mean (exponential) or median (lognormal)
+        spread: +/- range in ms (uniform) or sigma (lognormal)
+        max_latency_ms: upper bound applied to any distribution
+        error_rate: probability of answering with a server error
+        truncate_rate: probability of cutting the body in half
+        hang_rate: probability of not answering for hang_seconds
+        hang_seconds: how long a hang lasts (default 600)
+    """
+    def __init__(self, settings: Dict, rng: Optional[random.Random] = None):
+        self.settings = dict(settings)
+        self.rng = rng or random.Random()
+
+    def latency(self) -> float:
+        """Latency in seconds for the next response"""
+        distribution = self.settings.get("distribution", "fixed")
+        latency_ms = float(self.settings.get("latency_ms", 0))
+        spread = float(self.settings.get("spread", 0))
+        match distribution:
+            case "fixed":
+                value = latency_ms
+            case "uniform":
+                value = self.rng.uniform(latency_ms - spread, latency_ms + spread)
+            case "exponential":
+                value = self.rng.expovariate(1.0 / latency_ms) if latency_ms > 0 else 0.0
+            case "lognormal":
+                value = latency_ms * self.rng.lognormvariate(0.0, spread or 0.5)
+            case _:
+                raise ValueError(f"Unknown latency distribution: {distribution}")
+        value = min(value, float(self.settings.get("max_latency_ms", value)))
+        return max(0.0, value) / 1000.0
+
+    def _happens(self, name: str) -> bool:
+        return self.rng.random() < float(self.settings.get(name, 0.0))
+
+    def should_fail(self) -> bool:
+        return self._happens("error_rate")
+
+    def should_truncate(self) -> bool:
+        return self._happens("truncate_rate")
+
+    def should_hang(self) -> bool:
+        return self._happens("hang_rate")
+
+    def hang_seconds(self) -> float:
+        return float(self.settings.get("hang_seconds", 600))
+
+
+class ProviderSimulator:
+    """Flask application emulating the upstream providers from fixture files"""
+    def __init__(self, fixtures_dir: str, faults: Dict[str, Dict]):
+        self.fixtures_dir = fixtures_dir
+        self.injectors = {provider: FaultInjector(faults.get(provider, {})) for provider in PROVIDERS}
+        self.stats = {provider: {"requests": 0, "errors": 0, "truncated": 0, "hangs": 0} for provider in PROVIDERS}
+        self.lock = threading.Lock()
+        self.app = Flask(__name__)
+        self._add_routes()
+
+    def _read(self, name: str) -> bytes:
+        with open(os.path.join(self.fixtures_dir, name), "rb") as f:
+            return f.read()
+
+    def _count(self, provider: str, what: str):
+        with self.lock:
+            self.stats[provider][what] += 1
+
+    def respond(self, provider: str, body: bytes, content_type: str, error_body: bytes = b"") -> Response:
+        """Answer with `body` after applying the provider's latency and faults"""
+        injector = self.injectors[provider]
+        self._count(provider, "requests")
+        if injector.should_hang():
+            self._count(provider, "hangs")
+            time.sleep(injector.hang_seconds())
+        time.sleep(injector.latency())
+        if injector.should_fail():
+            self._count(provider, "errors")
+            return Response(error_body, status=500 if error_body else 503, content_type=content_type)
+        if injector.should_truncate():
+            self._count(provider, "truncated")
+            body = body[:len(body) // 2]
+        return Response(body, content_type=content_type)
+
+    def set_faults(self, provider: str, settings: Dict):
+        self.injectors[provider] = FaultInjector(settings)
+
+    def _departure_board(self, envelope: bytes, fixture: str = "departure_board") -> bytes:
+        """Station specific board (<fixture>_<CRS>.xml) if recorded, the default one otherwise"""
+        match = re.search(rb"<(?:\w+:)?crs>(\w+)</(?:\w+:)?crs>", envelope)
+        if match:
+            name = f"{fixture}_{match.group(1).decode().upper()}.xml"
+            if os.path.exists(os.path.join(self.fixtures_dir, name)):
+                return self._read(name)
+        return self._read(f"{fixture}.xml")
+
+    def _service_details(self, envelope: bytes) -> bytes:
+        """Recorded details (service_details_<serviceID>.xml, or the default one) of the requested service"""
+        match = re.search(rb"<(?:\w+:)?serviceID>([\w+=-]+)</(?:\w+:)?serviceID>", envelope)
+        if match:
+            name = f"service_details_{match.group(1).decode()}.xml"
+            if os.path.exists(os.path.join(self.fixtures_dir, name)):
+                return self._read(name)
+        return self._read("service_details.xml")
+
+    def _add_routes(self):
+        app = self.app
+
+        @app.route("/OpenLDBWS/wsdl.aspx")
+        def wsdl():
+            location = request.host_url + "OpenLDBWS/ldb12.asmx"
+            body = self._read("openldbws.wsdl").replace(b"{location}", location.encode())
+            return Response(body, content_type="text/xml")
+
+        @app.route("/OpenLDBWS/ldb12.asmx", methods=["POST"])
+        def soap():
+            action = request.headers.get("SOAPAction", "").strip('"').rsplit("/", 1)[-1]
+            if action == "GetDepartureBoard":
+                body = self._departure_board(request.get_data())
+            elif action == "GetDepBoardWithDetails":
+                body = self._departure_board(request.get_data(), "departure_board_details")
+            elif action == "GetServiceDetails":
+                body = self._service_details(request.get_data())
+            else:
+                return Response(SOAP_FAULT, status=500, content_type="text/xml")
+            return self.respond("trains", body, "text/xml; charset=utf-8", SOAP_FAULT)
+
+        @app.route("/v2/top-headlines")
+        def top_headlines():
+            return self.respond("news", self._read("newsapi_top_headlines.json"), "application/json")
+
+        @app.route("/data/2.5/weather")
+        def weather():
+            return self.respond("weather", self._read("owm_weather.json"), "application/json")
+
+        @app.route("/data/2.5/forecast")
+        def forecast():
+            return self.respond("weather", self._read("owm_forecast.json"), "application/json")
+
+        @app.route("/simulator/stats")
+        def stats():
+            with self.lock:
+                return jsonify(self.stats)
+
+        @app.route("/simulator/faults/<provider>", methods=["POST"])
+        def faults(provider):
+            if provider not in PROVIDERS:
+                return jsonify({"error": f"unknown provider {provider}"}), 404
+            self.set_faults(provider, request.get_json(force=True))
+            return jsonify({"result": "ok"})
+
+        # Anything else is treated as an RSS feed, or a news thumbnail
+        @app.route("/<path:path>")
+        def rss(path):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                return self.respond("news", self._read("thumbnail.jpg"), "image/jpeg")
+            return self.respond("news", self._read("bbc_rss.xml"), "application/rss+xml")
+
+    def run(self, host: str, port: int):
+        self.app.run(host=host, port=port, threaded=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the clock's upstream providers")
+    parser.add_argument("--config", default="config.toml", help="clock configuration ([simulator] section)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="defaults to the port of simulator.url")
+    parser.add_argument("--fixtures", help="directory of recorded responses")
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--latency-ms", type=float)
+    parser.add_argument("--spread", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--truncate-rate", type=float)
+    parser.add_argument("--hang-rate", type=float)
+    parser.add_argument("--hang-seconds", type=float)
+    args = parser.parse_args()
+
+    config = SmartClockConfig(args.config) if os.path.exists(args.config) else None
+    overrides = {name: getattr(args, name) for name in
+                 ("distribution", "latency_ms", "spread", "error_rate", "truncate_rate", "hang_rate", "hang_seconds")
+                 if getattr(args, name) is not None}
+    faults = {}
+    for provider in PROVIDERS:
+        faults[provider] = config.get_simulator_faults(provider) if config else {}
+        faults[provider].update(overrides)
+
+    fixtures = args.fixtures or (config and config.get_simulator_fixtures_dir()) or FIXTURES_DIR
+    port = args.port or urlsplit(config.get_simulator_url() if config else "http://127.0.0.1:8089").port or 8089
+    ProviderSimulator(fixtures, faults).run(args.host, port)
+
+
+if __name__ == "__main__":
+    main()
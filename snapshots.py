@@ -0,0 +1,165 @@
+"""
+Last data of each provider, kept across restarts: the screens show it (marked "as of" when it was
+fetched) from their creation instead of staying empty until the first refresh, however long the
+network takes to come back.
+
+The file is an index followed by the payloads (zlib compressed JSON, no pickle):
+
+    header  "SCSN", version (u16), number of entries (u16)
+    entry   name length (u16), time fetched (f64, epoch), payload offset (u32), payload length (u32), name
+    ...     payloads
+
+It is memory-mapped at start, only the index is read until a screen asks for its snapshot. Snapshots
+are saved on a thread of their own after each successful refresh, the file is replaced atomically.
+A snapshot older than the maximum age of its provider is not shown, and dropped at the next save.
+"""
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+from config import SmartClockConfig
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"SCSN"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+ENTRY = struct.Struct("<HdII")
+
+
+def encode(data: Any) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def decode(payload: bytes) -> Any:
+    return json.loads(zlib.decompress(payload))
+
+
+def format_as_of(taken: datetime, now: Optional[datetime] = None) -> str:
+    """"as of 14:05", with the day when it was not today"""
+    now = now or datetime.now()
+    return f"as of {taken:%H:%M}" if taken.date() == now.date() else f"as of {taken:%a %H:%M}"
+
+
+class SnapshotStore:
+    """
+    Snapshots read from the UI thread (`get`) and saved from the snapshot thread (`save` queues it).
+    """
+    def __init__(self, config: SmartClockConfig):
+        self.config = config
+        self.path = config.get_snapshot_file()
+        self.lock = threading.Lock()
+        self.map: Optional[mmap.mmap] = None
+        # name: (time fetched, payload offset, payload length) of the snapshots in the mapped file
+        self.mapped: Dict[str, Tuple[float, int, int]] = {}
+        # name: (time fetched, payload) of the snapshots saved since the start
+        self.saved: Dict[str, Tuple[float, bytes]] = {}
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshots")
+        self.closed = False
+        self._open()
+
+    def _open(self):
+        try:
+            with open(self.path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # no snapshot yet (or an empty file)
+            return
+        try:
+            self.mapped = self._read_index(self.map)
+        except (struct.error, ValueError) as e:
+            log.warning("Ignoring the snapshots in %s: %s", self.path, e)
+            self.mapped = {}
+
+    @staticmethod
+    def _read_index(data) -> Dict[str, Tuple[float, int, int]]:
+        magic, version, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a snapshot file of this version")
+        index, position = {}, HEADER.size
+        for _ in range(count):
+            length, taken, offset, size = ENTRY.unpack_from(data, position)
+            position += ENTRY.size
+            name = bytes(data[position:position + length]).decode("utf-8")
+            position += length
+            if offset + size > len(data):
+                raise ValueError(f"snapshot {name} is truncated")
+            index[name] = (taken, offset, size)
+        return index
+
+    def max_age(self, name: str) -> float:
+        return self.config.get_snapshot_max_age(name) * 60
+
+    def get(self, name: str) -> Optional[Tuple[Any, datetime]]:
+        """The last data of `name` and when it was fetched, None when there is none recent enough"""
+        with self.lock:
+            if name in self.saved:
+                taken, payload = self.saved[name]
+            elif name in self.mapped:
+                taken, offset, size = self.mapped[name]
+                payload = self.map[offset:offset + size]
+            else:
+                return None
+        if time.time() - taken > self.max_age(name):
+            return None
+        try:
+            return decode(payload), datetime.fromtimestamp(taken)
+        except (zlib.error, ValueError) as e:
+            log.warning("Could not read the %s snapshot: %s", name, e)
+            return None
+
+    def save(self, name: str, data: Any):
+        """Save the data just fetched for `name` (thread safe, written on the snapshot thread)"""
+        if self.closed:
+            return
+        self.writer.submit(self._save, name, data, time.time())
+
+    def _save(self, name: str, data: Any, taken: float):
+        try:
+            payload = encode(data)
+            with self.lock:
+                self.saved[name] = (taken, payload)
+                entries = self._current_entries()
+            self._write(entries)
+        except Exception as e:
+            log.warning("Could not save the %s snapshot: %s", name, e)
+
+    def _current_entries(self) -> Dict[str, Tuple[float, bytes]]:
+        """Every snapshot not too old to be shown, the saved ones over those of the file"""
+        entries = {name: (taken, self.map[offset:offset + size])
+                   for name, (taken, offset, size) in self.mapped.items()}
+        entries.update(self.saved)
+        now = time.time()
+        return {name: entry for name, entry in entries.items() if now - entry[0] <= self.max_age(name)}
+
+    def _write(self, entries: Dict[str, Tuple[float, bytes]]):
+        """Write the file atomically, a restart in the middle must not leave half a file"""
+        names = [name.encode("utf-8") for name in entries]
+        offset = HEADER.size + sum(ENTRY.size + len(name) for name in names)
+        index, payloads = [], []
+        for name, (taken, payload) in zip(names, entries.values()):
+            index.append(ENTRY.pack(len(name), taken, offset, len(payload)) + name)
+            payloads.append(payload)
+            offset += len(payload)
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+            f.writelines(index)
+            f.writelines(payloads)
+        os.replace(temporary, self.path)
+
+    def close(self):
+        """Finish the pending saves"""
+        self.closed = True
+        self.writer.shutdown(wait=True)
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map, self.mapped = None, {}
@@ -10,5 +10,6 @@ mkdir -p "$LOG_DIR"
 
 while true
 do
+    # the log records go to the rotated clock.log, this only keeps the output of the current run
     python3 main.py >$LOG_FILE 2>&1
 done
\ No newline at end of file
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import importlib
+from contextlib import contextmanager
+from typing import List, Tuple
+
+
+def process_age() -> float:
+    """Seconds since the process was started (interpreter start-up included), 0 if unknown"""
+    try:
+        with open("/proc/self/stat") as f:
+            # the command name can contain spaces, fields are counted after its closing parenthesis
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class StartupReport:
+    """Records how long each start-up phase and lazy import takes"""
+    def __init__(self):
+        self.origin = time.perf_counter() - process_age()
+        self.phases: List[Tuple[str, float, float]] = []
+        self.print_when_ready = False
+
+    def now(self) -> float:
+        """Seconds since the process started"""
+        return time.perf_counter() - self.origin
+
+    @contextmanager
+    def phase(self, name: str):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start, self.now() - start))
+
+    def mark(self, name: str):
+        """Record an instant (e.g. first frame)"""
+        self.phases.append((name, self.now(), 0.0))
+
+    def timed_import(self, name: str):
+        """Import a module, recording the time if it was not imported yet"""
+        if name in sys.modules:
+            return sys.modules[name]
+        with self.phase(f"import {name}"):
+            return importlib.import_module(name)
+
+    def format(self) -> str:
+        lines = ["Startup report (seconds since process start):"]
+        for name, start, duration in self.phases:
+            lines.append(f"  {start:7.3f}  {duration * 1000:8.1f}ms  {name}")
+        return "\n".join(lines)
+
+
+# Report shared by the whole start-up sequence
+STARTUP = StartupReport()
@@ -0,0 +1,275 @@
+"""
+Radio station catalogue: the stations of the configuration and of M3U/PLS playlists (e.g. curated
+exports of thousands of stations) in a SQLite database, with their genre, country and bitrate when
+the playlist gives them. A station is known by its name (case and spaces aside): importing a station
+again updates it, and the stations of the configuration are never replaced by a playlist's.
+
+The list of the radio screen reads the catalogue a page at a time (see `page`), and both the touch
+screen and the remote control search it: names starting with the text first, then names, genres or
+countries containing it, and when nothing does, names sharing most of its trigrams (typos).
+
+    python3 station_catalogue.py FILE...      # import playlists into the configured catalogue
+"""
+import os
+import re
+import glob
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import RadioStream
+
+# Source of the stations of the configuration
+CONFIG_SOURCE = "config"
+# Source of the stations added from the clock itself
+ADDED_SOURCE = "added"
+# Fuzzy matches must share at least this share of the trigrams of the text
+FUZZY_MIN_SHARED = 0.5
+EXTINF_ATTRIBUTE = re.compile(r'([\w-]+)="([^"]*)"')
+PLS_ENTRY = re.compile(r"(file|title)(\d+)=(.*)", re.IGNORECASE)
+GENRE_ATTRIBUTES = ("genre", "tvg-genre", "group-title")
+COUNTRY_ATTRIBUTES = ("country", "tvg-country")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stations (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL UNIQUE,
+    sort_key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    genre TEXT NOT NULL,
+    country TEXT NOT NULL,
+    bitrate INTEGER,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stations_sort ON stations (sort_key);
+CREATE VIRTUAL TABLE IF NOT EXISTS stations_fts USING fts5 (
+    name, genre, country, content='stations', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS stations_insert AFTER INSERT ON stations BEGIN
+    INSERT INTO stations_fts (rowid, name, genre, country) VALUES (new.id, new.name, new.genre, new.country);
+END;
+CREATE TRIGGER IF NOT EXISTS stations_delete AFTER DELETE ON stations BEGIN
+    INSERT INTO stations_fts (stations_fts, rowid, name, genre, country)
+    VALUES ('delete', old.id, old.name, old.genre, old.country);
+END;
+CREATE TRIGGER IF NOT EXISTS stations_update AFTER UPDATE ON stations BEGIN
+    INSERT INTO stations_fts (stations_fts, rowid, name, genre, country)
+    VALUES ('delete', old.id, old.name, old.genre, old.country);
+    INSERT INTO stations_fts (rowid, name, genre, country) VALUES (new.id, new.name, new.genre, new.country);
+END;
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TEMP TABLE IF NOT EXISTS imported (name_key TEXT PRIMARY KEY);
+"""
+
+COLUMNS = "s.name, s.url, s.genre, s.country, s.bitrate"
+FTS_JOIN = "FROM stations_fts JOIN stations s ON s.id = stations_fts.rowid"
+UPSERT = ("INSERT INTO stations (name, name_key, sort_key, url, genre, country, bitrate, source) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+          "ON CONFLICT (name_key) DO UPDATE SET name = excluded.name, sort_key = excluded.sort_key, url = excluded.url, "
+          "genre = excluded.genre, country = excluded.country, bitrate = excluded.bitrate, source = excluded.source "
+          f"WHERE stations.source <> '{CONFIG_SOURCE}' OR excluded.source = '{CONFIG_SOURCE}'")
+
+
+@dataclass
+class Station:
+    name: str
+    url: str
+    genre: str = ""
+    country: str = ""
+    bitrate: Optional[int] = None
+
+
+def name_key(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def trigrams(text: str) -> List[str]:
+    return sorted({text[i:i + 3] for i in range(len(text) - 2)})
+
+
+def _quote(text: str) -> str:
+    """FTS5 string matching `text` as it is"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _bitrate(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_m3u(text: str) -> List[Station]:
+    """Stations of an (extended) M3U playlist, with the genre, country and bitrate of their #EXTINF attributes"""
+    stations = []
+    title, attributes, group = None, {}, ""
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            info = line[len("#EXTINF:"):]
+            attributes = {key.lower(): value for key, value in EXTINF_ATTRIBUTE.findall(info)}
+            # the title follows the first comma outside the attributes
+            title = EXTINF_ATTRIBUTE.sub("", info).partition(",")[2].strip() or None
+        elif line.startswith("#EXTGRP:"):
+            group = line[len("#EXTGRP:"):].strip()
+        elif line and not line.startswith("#"):
+            if "://" in line:
+                genre = next((attributes[key] for key in GENRE_ATTRIBUTES if attributes.get(key)), group)
+                country = next((attributes[key] for key in COUNTRY_ATTRIBUTES if attributes.get(key)), "")
+                stations.append(Station(title or line, line, genre, country, _bitrate(attributes.get("bitrate"))))
+            title, attributes, group = None, {}, ""
+    return stations
+
+
+def parse_pls(text: str) -> List[Station]:
+    """Stations of a PLS playlist"""
+    entries: Dict[int, Dict[str, str]] = {}
+    for line in text.splitlines():
+        match = PLS_ENTRY.match(line.strip())
+        if match:
+            entries.setdefault(int(match[2]), {})[match[1].lower()] = match[3].strip()
+    return [Station(entry.get("title") or entry["file"], entry["file"])
+            for _, entry in sorted(entries.items()) if "://" in entry.get("file", "")]
+
+
+def parse_playlist(path: str) -> List[Station]:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if path.lower().endswith(".pls") or text.lstrip().lower().startswith("[playlist]"):
+        return parse_pls(text)
+    return parse_m3u(text)
+
+
+class StationCatalogue:
+    """
+    Stations, read from the UI thread (list and search of the radio screen), the remote control's
+    thread and a refresh thread (imports).
+    """
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def _upsert(self, stations: Iterable[Station], source: str, sort_keys: Optional[List[str]] = None) -> int:
+        rows = []
+        for n, station in enumerate(stations):
+            key = name_key(station.name)
+            if not key:
+                continue
+            # the configuration's stations come first, in their order, then the others by name
+            sort_key = sort_keys[n] if sort_keys else "1" + key
+            rows.append((station.name.strip(), key, sort_key, station.url, station.genre or "",
+                         station.country or "", station.bitrate, source))
+        self.db.executemany(UPSERT, rows)
+        return len(rows)
+
+    def sync_config(self, streams: List[RadioStream]):
+        """Make the stations of the configuration those of `streams`"""
+        stations = [Station(stream.name, stream.uri) for stream in streams]
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM stations WHERE source = ?", (CONFIG_SOURCE,))
+            self._upsert(stations, CONFIG_SOURCE, [f"0{n:06d}" for n in range(len(stations))])
+
+    def import_file(self, path: str, force: bool = False) -> int:
+        """
+        Import a playlist unless it did not change since its last import, returns the number of stations
+        imported. The stations of its previous import that it no longer lists are removed.
+        """
+        stat = os.stat(path)
+        with self.lock:
+            imported = self.db.execute("SELECT mtime, size FROM imports WHERE path = ?", (path,)).fetchone()
+        if not force and imported == (stat.st_mtime, stat.st_size):
+            return 0
+        stations = parse_playlist(path)
+        source = os.path.basename(path)
+        with self.lock, self.db:
+            count = self._upsert(stations, source)
+            self.db.execute("DELETE FROM imported")
+            self.db.executemany("INSERT OR IGNORE INTO imported VALUES (?)", ((name_key(s.name),) for s in stations))
+            self.db.execute("DELETE FROM stations WHERE source = ? AND name_key NOT IN (SELECT name_key FROM imported)",
+                            (source,))
+            self.db.execute("INSERT OR REPLACE INTO imports VALUES (?, ?, ?)", (path, stat.st_mtime, stat.st_size))
+        return count
+
+    def import_playlists(self, patterns: List[str]) -> int:
+        """Import the changed playlists matching the glob `patterns`, returns the number of stations imported"""
+        paths = sorted({path for pattern in patterns for path in glob.glob(os.path.expanduser(pattern))})
+        return sum(self.import_file(path) for path in paths)
+
+    def add(self, station: Station):
+        with self.lock, self.db:
+            self._upsert([station], ADDED_SOURCE)
+
+    def remove(self, name: str):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM stations WHERE name_key = ?", (name_key(name),))
+
+    def count(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM stations").fetchone()[0]
+
+    def page(self, after: str = "", limit: int = 100) -> List[Tuple[str, Station]]:
+        """The `limit` stations following sort key `after` in the list order, with their sort key"""
+        with self.lock:
+            rows = self.db.execute(f"SELECT sort_key, {COLUMNS} FROM stations s WHERE sort_key > ? "
+                                   "ORDER BY sort_key LIMIT ?", (after, limit)).fetchall()
+        return [(row[0], Station(*row[1:])) for row in rows]
+
+    def find(self, name: str) -> Optional[Station]:
+        with self.lock:
+            row = self.db.execute(f"SELECT {COLUMNS} FROM stations s WHERE name_key = ?", (name_key(name),)).fetchone()
+        return Station(*row) if row is not None else None
+
+    def search(self, text: str, limit: int = 50) -> List[Station]:
+        """Stations starting with `text`, then containing it, or if none does, close to it"""
+        key = name_key(text)
+        if not key:
+            return []
+        grams = trigrams(key)
+        with self.lock:
+            rows = self.db.execute(f"SELECT {COLUMNS} FROM stations s WHERE name_key >= ? AND name_key < ? "
+                                   "ORDER BY name_key LIMIT ?", (key, key + "\uffff", limit)).fetchall()
+            # shorter than a trigram, the text can only be a prefix
+            if grams and len(rows) < limit:
+                rows += self.db.execute(f"SELECT {COLUMNS} {FTS_JOIN} WHERE stations_fts MATCH ? ORDER BY rank LIMIT ?",
+                                        (_quote(key), limit)).fetchall()
+            # ranking the names sharing a trigram costs most, it is left for texts found nowhere (typos)
+            if len(grams) > 1 and not rows:
+                rows = self._fuzzy(grams, limit * 4)
+        found = {}
+        for row in rows:
+            found.setdefault(row[0], row)
+        return [Station(*row) for row in found.values()][:limit]
+
+    def _fuzzy(self, grams: List[str], limit: int) -> List[Tuple]:
+        """Rows of the stations whose name shares most of `grams`, the closest first"""
+        query = "name : (" + " OR ".join(_quote(gram) for gram in grams) + ")"
+        rows = self.db.execute(f"SELECT {COLUMNS} {FTS_JOIN} WHERE stations_fts MATCH ? ORDER BY rank LIMIT ?",
+                               (query, limit)).fetchall()
+        wanted = set(grams)
+        scored = []
+        for row in rows:
+            shared = len(wanted.intersection(trigrams(name_key(row[0])))) / len(wanted)
+            if shared >= FUZZY_MIN_SHARED:
+                scored.append((shared, row))
+        scored.sort(key=lambda item: -item[0])
+        return [row for _, row in scored]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+if __name__ == "__main__":
+    import sys
+    from config import SmartClockConfig
+    catalogue = StationCatalogue(SmartClockConfig("config.toml").get_radio_catalogue_file())
+    for playlist in sys.argv[1:]:
+        print(f"{playlist}: {catalogue.import_file(playlist, force=True)} stations")
+    print(f"{catalogue.count()} stations in the catalogue")
+    catalogue.close()
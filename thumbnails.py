@@ -0,0 +1,140 @@
+"""
+News thumbnails: images are downloaded on worker threads, scaled once to the size they are shown
+at, and kept in a size-bounded directory (least recently used files are deleted first, files are
+named after a hash of their URL). A small in-memory tier of ready-to-paint QPixmaps sits in front
+of it, so refreshes and source switches neither download nor decode an image again.
+"""
+import logging
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+import requests
+from PyQt5.QtCore import QObject, QSize, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+from config import SmartClockConfig
+from cache import LruCache
+
+log = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = QSize(96, 64)
+# Pixmaps kept in memory, a few screens of headlines
+MEMORY_ENTRIES = 64
+DOWNLOAD_WORKERS = 4
+
+
+class DiskCache:
+    """Files in `directory`, deleted least recently used first once they take more than `max_bytes`"""
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # name -> size, the access time is kept in the files' mtime
+        self.sizes: Dict[str, int] = {entry.name: entry.stat().st_size for entry in os.scandir(directory) if entry.is_file()}
+        self.total = sum(self.sizes.values())
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png")
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the file stored for `key`, None if there is none"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def added(self, path: str):
+        """Account for a file just written at `path`, and evict old files if needed"""
+        name = os.path.basename(path)
+        with self.lock:
+            self.total += os.path.getsize(path) - self.sizes.get(name, 0)
+            self.sizes[name] = os.path.getsize(path)
+            if self.total <= self.max_bytes:
+                return
+            by_age = sorted(self.sizes, key=self._mtime)
+            while by_age and self.total > self.max_bytes:
+                name = by_age.pop(0)
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                self.total -= self.sizes.pop(name)
+
+    def _mtime(self, name: str) -> float:
+        try:
+            return os.path.getmtime(os.path.join(self.directory, name))
+        except OSError:
+            return 0.0
+
+
+class ThumbnailLoader(QObject):
+    """
+    Gives the thumbnail of an image URL: `get` answers from memory, `request` loads it from the
+    disk cache or the network on a worker thread and emits `loaded` (on the UI thread) when done.
+    """
+    loaded = pyqtSignal(str)
+    # emitted by the worker threads, delivered on the UI thread where the QPixmap is made
+    decoded = pyqtSignal(str)
+
+    def __init__(self, config: SmartClockConfig):
+        super().__init__()
+        self.config = config
+        self.timeout = config.get_network_timeouts()
+        self.disk = DiskCache(config.get_thumbnail_cache_dir(), config.get_thumbnail_cache_size() * 2 ** 20)
+        self.memory = LruCache(MEMORY_ENTRIES)
+        self.images = LruCache(MEMORY_ENTRIES)
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="thumbnail")
+        self.decoded.connect(self._to_pixmap)
+
+    def get(self, url: str) -> Optional[QPixmap]:
+        return self.memory.get(url)
+
+    def request(self, url: str):
+        """Load the thumbnail of `url` in the background, unless it is in memory or already loading"""
+        if url in self.memory:
+            return
+        with self.lock:
+            if url in self.pending:
+                return
+            self.pending.add(url)
+        self.pool.submit(self._load, url)
+
+    def _load(self, url: str):
+        """Runs on a worker thread: QImage (unlike QPixmap) can be decoded and scaled off the UI thread"""
+        try:
+            path = self.disk.get(url)
+            if path is not None:
+                image = QImage(path)
+            else:
+                response = requests.get(self.config.get_thumbnail_url(url), timeout=self.timeout)
+                response.raise_for_status()
+                image = QImage.fromData(response.content)
+                if image.isNull():
+                    raise ValueError("not an image")
+                image = image.scaled(THUMBNAIL_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+                path = self.disk.path(url)
+                if image.save(path, "PNG"):
+                    self.disk.added(path)
+            if not image.isNull():
+                self.images.put(url, image)
+                self.decoded.emit(url)
+        except Exception as e:
+            log.info("Could not load thumbnail %s: %s", url, e)
+        finally:
+            with self.lock:
+                self.pending.discard(url)
+
+    def _to_pixmap(self, url: str):
+        image = self.images.pop(url)
+        if image is not None:
+            self.memory.put(url, QPixmap.fromImage(image))
+            self.loaded.emit(url)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
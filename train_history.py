@@ -0,0 +1,165 @@
+"""
+Departure history: every departure board fetched is recorded in a small SQLite database,
+and the delay of each departure is added, once it has left, to a histogram of delays per
+service, weekday and hour. Histograms are NumPy arrays of counts, so the median or p90 of
+a service is read from a few hundred integers whatever the length of the history.
+
+A "service" is the train that runs every day at the same time from the same station to the
+same destination ("CLJ 07:42 London Waterloo"); Darwin's service IDs change every day.
+"""
+import time
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+# Delays are counted per minute, the last bin holds MAX_DELAY minutes and more
+MAX_DELAY = 120
+BINS = MAX_DELAY + 1
+# Departures already counted in the histograms are kept this long (seconds)
+RETENTION = 14 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS departures (
+    crs TEXT NOT NULL,
+    service_id TEXT NOT NULL,
+    scheduled REAL NOT NULL,
+    service TEXT NOT NULL,
+    delay INTEGER,
+    counted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (service_id, scheduled)
+);
+CREATE INDEX IF NOT EXISTS departures_pending ON departures (crs, counted);
+CREATE TABLE IF NOT EXISTS delay_histograms (
+    service TEXT NOT NULL,
+    weekday INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    counts BLOB NOT NULL,
+    PRIMARY KEY (service, weekday, hour)
+);
+"""
+
+
+def service_key(crs: str, std: str, destination: str) -> str:
+    return f"{crs} {std} {destination}"
+
+
+def scheduled_time(std: str, observed: datetime) -> datetime:
+    """Date and time of a departure shown as `std` (HH:MM) on a board read at `observed`"""
+    hours, minutes = map(int, std.split(":"))
+    candidate = observed.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+    # a board read just after midnight still shows the late evening trains, and the other way round
+    return min((candidate + timedelta(days=days) for days in (-1, 0, 1)),
+               key=lambda day: abs((day - observed).total_seconds()))
+
+
+def delay_minutes(std: str, etd: Optional[str]) -> Optional[int]:
+    """Minutes late from the board's estimate, None when unknown ("Delayed", "Cancelled")"""
+    if etd in ("On time", "Starts here"):
+        return 0
+    try:
+        scheduled_h, scheduled_m = map(int, std.split(":"))
+        expected_h, expected_m = map(int, etd.split(":"))
+    except (AttributeError, ValueError):
+        return None
+    delay = (expected_h * 60 + expected_m - scheduled_h * 60 - scheduled_m) % (24 * 60)
+    # more than 12 hours "late" is a train running a little early
+    return 0 if delay > 12 * 60 else min(delay, MAX_DELAY)
+
+
+def percentile(counts: np.ndarray, q: float) -> int:
+    """Delay (minutes) below which a fraction `q` of the counted departures fall"""
+    cumulative = np.cumsum(counts)
+    return int(np.searchsorted(cumulative, q * cumulative[-1]))
+
+
+class DepartureHistory:
+    """
+    Recorded departures and the delay histograms built from them. `record` is called from a
+    refresh thread, `delay_stats` from anywhere.
+    """
+    def __init__(self, path: str, clock=time.time):
+        self.clock = clock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        # service -> (weekday, hour) -> counts per minute of delay
+        self.histograms: Dict[str, Dict[Tuple[int, int], np.ndarray]] = {}
+        for service, weekday, hour, counts in self.db.execute("SELECT service, weekday, hour, counts FROM delay_histograms"):
+            self.histograms.setdefault(service, {})[(weekday, hour)] = np.frombuffer(counts, dtype=np.int32).copy()
+
+    def record(self, board: Dict):
+        """Store the departures of a board (see trains.normalise_board), and count those that left"""
+        now = self.clock()
+        observed = datetime.fromtimestamp(now)
+        crs = board["crs"]
+        on_board = set()
+        rows = []
+        for t in board["services"]:
+            if not t.get("service_id") or not t.get("std"):
+                continue
+            scheduled = scheduled_time(t["std"], observed).timestamp()
+            on_board.add((t["service_id"], scheduled))
+            rows.append((crs, t["service_id"], scheduled, service_key(crs, t["std"], t["destination"]),
+                         delay_minutes(t["std"], t.get("etd"))))
+        with self.lock, self.db:
+            # the last estimate seen before the train leaves is the one that is counted
+            self.db.executemany(
+                "INSERT INTO departures (crs, service_id, scheduled, service, delay) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (service_id, scheduled) DO UPDATE SET delay = COALESCE(excluded.delay, delay)",
+                rows)
+            departed = [row for row in self.db.execute(
+                "SELECT service_id, scheduled, service, delay FROM departures WHERE crs = ? AND counted = 0 AND scheduled < ?",
+                (crs, now)) if (row[0], row[1]) not in on_board]
+            self._count(departed)
+            self.db.execute("DELETE FROM departures WHERE counted = 1 AND scheduled < ?", (now - RETENTION,))
+
+    def _count(self, departed: Iterable[Tuple[str, float, str, Optional[int]]]):
+        """Add departed trains to the histograms (called with the lock held, inside a transaction)"""
+        grouped: Dict[Tuple[str, int, int], List[int]] = {}
+        for service_id, scheduled, service, delay in departed:
+            self.db.execute("UPDATE departures SET counted = 1 WHERE service_id = ? AND scheduled = ?", (service_id, scheduled))
+            if delay is None:
+                continue
+            when = datetime.fromtimestamp(scheduled)
+            grouped.setdefault((service, when.weekday(), when.hour), []).append(delay)
+        for (service, weekday, hour), delays in grouped.items():
+            counts = self.histograms.setdefault(service, {}).setdefault((weekday, hour), np.zeros(BINS, dtype=np.int32))
+            np.add.at(counts, np.asarray(delays), 1)
+            self.db.execute("INSERT OR REPLACE INTO delay_histograms VALUES (?, ?, ?, ?)",
+                            (service, weekday, hour, counts.tobytes()))
+
+    def histogram(self, service: Optional[str] = None, weekday: Optional[int] = None,
+                  hour: Optional[int] = None) -> np.ndarray:
+        """Delay counts of the departures matching every given criterion"""
+        total = np.zeros(BINS, dtype=np.int64)
+        services = [self.histograms.get(service, {})] if service is not None else list(self.histograms.values())
+        for by_time in services:
+            for (key_weekday, key_hour), counts in list(by_time.items()):
+                if (weekday is None or key_weekday == weekday) and (hour is None or key_hour == hour):
+                    total += counts
+        return total
+
+    def delay_stats(self, service: Optional[str] = None, weekday: Optional[int] = None,
+                    hour: Optional[int] = None) -> Optional[Dict]:
+        """Number of departures, median and p90 delay (minutes), None without any departure"""
+        counts = self.histogram(service, weekday, hour)
+        samples = int(counts.sum())
+        if samples == 0:
+            return None
+        return {"samples": samples, "median": percentile(counts, 0.5), "p90": percentile(counts, 0.9)}
+
+    def usual_delay(self, crs: str, std: str, destination: str, min_samples: int,
+                    day: Optional[datetime] = None) -> Optional[int]:
+        """Median delay of a service on the same weekday, or on any day if that is not known enough"""
+        service = service_key(crs, std, destination)
+        weekday = (day or datetime.now()).weekday()
+        for stats in (self.delay_stats(service, weekday), self.delay_stats(service)):
+            if stats is not None and stats["samples"] >= min_samples:
+                return stats["median"]
+        return None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -16,22 +16,108 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
+import logging
+import threading
 from zeep import Client, Settings, xsd
-from zeep.plugins import HistoryPlugin
+from zeep.transports import Transport
 from config import SmartClockConfig
-from PyQt5 import QtWidgets
-from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import QVBoxLayout
+from widgets import LabelList, bold_font
+from snapshots import format_as_of
+from train_history import DepartureHistory
+from journeys import JourneyPlanner
+from cache import LruCache
 from datetime import datetime
+from typing import Callable, Dict, List, Optional
 
-WSDL = 'http://lite.realtime.nationalrail.co.uk/OpenLDBWS/wsdl.aspx?ver=2021-11-01'
+log = logging.getLogger(__name__)
+
+# Service details kept in memory, the most recently used first
+DETAILS_CACHE_SIZE = 64
+
+def normalise_board(res) -> Dict:
+    """Plain (JSON serialisable) version of a zeep departure board"""
+    services = []
+    for t in res.trainServices.service if res.trainServices else []:
+        services.append({
+            "std": t.std,
+            "etd": t.etd,
+            "platform": getattr(t, "platform", None),
+            "service_id": getattr(t, "serviceID", None),
+            "destination": t.destination.location[0].locationName,
+        })
+    return {"location": res.locationName, "crs": res.crs, "services": services}
+
+
+def normalise_leg_board(res, destination: str) -> Dict:
+    """Plain version of a zeep GetDepBoardWithDetails result, with the arrival time at `destination`"""
+    services = []
+    for t in res.trainServices.service if res.trainServices else []:
+        arrival = None
+        subsequent = getattr(t, "subsequentCallingPoints", None)
+        for calling_point_list in subsequent.callingPointList if subsequent else []:
+            for point in calling_point_list.callingPoint:
+                if point.crs == destination:
+                    arrival = point
+        if arrival is None:
+            continue
+        services.append({
+            "std": t.std,
+            "etd": t.etd,
+            "platform": getattr(t, "platform", None),
+            "service_id": getattr(t, "serviceID", None),
+            "is_cancelled": bool(getattr(t, "isCancelled", False)) or t.etd == "Cancelled",
+            "arrival": getattr(arrival, "st", None),
+            "expected_arrival": getattr(arrival, "et", None),
+        })
+    return {"origin": res.crs, "destination": destination, "services": services}
+
+
+def normalise_service_details(service_id: str, res) -> Dict:
+    """Plain version of a zeep GetServiceDetails result, with the calling points after this station"""
+    calling_points = []
+    subsequent = getattr(res, "subsequentCallingPoints", None)
+    for calling_point_list in subsequent.callingPointList if subsequent else []:
+        for point in calling_point_list.callingPoint:
+            calling_points.append({
+                "name": point.locationName,
+                "st": getattr(point, "st", None),
+                "et": getattr(point, "et", None) or getattr(point, "at", None),
+                "is_cancelled": bool(getattr(point, "isCancelled", False)),
+            })
+    return {
+        "service_id": service_id,
+        "platform": getattr(res, "platform", None),
+        "operator": getattr(res, "operator", None),
+        "is_cancelled": bool(getattr(res, "isCancelled", False)),
+        "cancel_reason": getattr(res, "cancelReason", None),
+        "delay_reason": getattr(res, "delayReason", None),
+        "calling_points": calling_points,
+    }
 
-class TrainGetter:
-    def __init__(self, config: SmartClockConfig):
-        settings = Settings(strict=False)
 
-        history = HistoryPlugin()
+def format_service_details(details: Dict) -> str:
+    """Lines shown under a departure when it is tapped"""
+    lines = []
+    if details["platform"]:
+        lines.append(f"Platform {details['platform']}" + (f" - {details['operator']}" if details["operator"] else ""))
+    if details["is_cancelled"]:
+        lines.append(details["cancel_reason"] or "Cancelled")
+    elif details["delay_reason"]:
+        lines.append(details["delay_reason"])
+    stops = [f"{point['name']} {point['et'] if point['et'] not in (None, 'On time') else point['st'] or ''}".strip()
+             + (" (cancelled)" if point["is_cancelled"] else "")
+             for point in details["calling_points"]]
+    if stops:
+        lines.append("Calling at " + ", ".join(stops))
+    return "\n".join("    " + line for line in lines)
 
-        self.client = Client(wsdl=WSDL, settings=settings, plugins=[history])
+
+class TrainGetter:
+    def __init__(self, config: SmartClockConfig):
+        # The WSDL is only downloaded by the first request, so a dead service cannot block startup
+        self.client = None
+        self.client_lock = threading.Lock()
 
         header = xsd.Element(
             '{http://thalesgroup.com/RTTI/2013-11-28/Token/types}AccessToken',
@@ -44,44 +130,199 @@ class TrainGetter:
         self.header_value = header(TokenValue=config.get_train_api_key())
         self.config = config
 
+    def get_client(self) -> Client:
+        with self.client_lock:
+            if self.client is None:
+                settings = Settings(strict=False)
+
+                timeout = self.config.get_network_timeouts()
+                transport = Transport(timeout=timeout, operation_timeout=timeout)
+                self.client = Client(wsdl=self.config.get_train_wsdl(), settings=settings, transport=transport)
+            return self.client
+
+    def get_trains(self, crs: Optional[str] = None):
+        crs = crs or self.config.get_train_stations()[0]
+        return self.get_client().service.GetDepartureBoard(numRows=20, crs=crs, _soapheaders=[self.header_value])
+
+    def get_board(self, crs: Optional[str] = None) -> Dict:
+        """Departure board as plain data (see normalise_board)"""
+        return normalise_board(self.get_trains(crs))
+
+    def get_leg_board(self, origin: str, destination: str) -> Dict:
+        """Trains from `origin` calling at `destination`, with their arrival times (see normalise_leg_board)"""
+        res = self.get_client().service.GetDepBoardWithDetails(numRows=10, crs=origin, filterCrs=destination,
+                                                               filterType="to", _soapheaders=[self.header_value])
+        return normalise_leg_board(res, destination)
 
-    def get_trains(self):
-        return self.client.service.GetDepartureBoard(numRows=20, crs=self.config.get_train_stations()[0], _soapheaders=[self.header_value])
+    def get_service_details(self, service_id: str) -> Dict:
+        """Calling points, platform and delay or cancellation reason of a service (see normalise_service_details)"""
+        res = self.get_client().service.GetServiceDetails(serviceID=service_id, _soapheaders=[self.header_value])
+        return normalise_service_details(service_id, res)
 
 
 class TrainManager():
-    def __init__(self, config: SmartClockConfig, trainsHeaderLabel, trainsLayout):
+    def __init__(self, config: SmartClockConfig, trainsHeaderLabel, trainsLayout, hub=None):
         self.client = TrainGetter(config)
+        self.hub = hub
         self.trainsHeaderLabel = trainsHeaderLabel
-        self.train_labels = []
+        self.header_text = "Trains"
+        # journeys with changes above the departures from the home station
+        journeysLayout, boardLayout = QVBoxLayout(), QVBoxLayout()
+        trainsLayout.addLayout(journeysLayout)
+        trainsLayout.addLayout(boardLayout)
+        self.journey_labels = LabelList(journeysLayout, bold_font('Times', 20))
+        self.train_labels = LabelList(boardLayout, bold_font('Times', 20), self.toggle_details)
         self.config = config
-        self.trainsLayout = trainsLayout
+        self.journeys = JourneyPlanner(config, self.client) if config.get_train_journeys() else None
+        history_file = config.get_train_history_file()
+        self.history = DepartureHistory(history_file) if history_file else None
 
-    def update(self, current_time, is_visible):
-        if current_time.time().second == 0 and is_visible:
-            self.update_train_status()
+        # Calling points etc. of the tapped departure, fetched on a refresh thread by fetch_details
+        self.details = LruCache(DETAILS_CACHE_SIZE, ttl=config.get_train_details_ttl())
+        self.wanted_details: List[str] = []
+        self.details_lock = threading.Lock()
+        self.expanded: Optional[str] = None
+        self.board = None
+        self.rows: List[Dict] = []
+        # set by the owner to have fetch_details run (e.g. by the refresh scheduler)
+        self.request_details: Optional[Callable[[], None]] = None
+        # set by the owner to take a request of the trains quota for each call of a refresh after
+        # the first (the refresh itself took one), None to make every call
+        self.acquire: Optional[Callable[[], bool]] = None
+
+    def fetch(self):
+        """Get the departure board (runs on a refresh thread)"""
+        crs = self.config.get_train_stations()[0]
+        board = self.hub.get("trains", crs) if self.hub is not None else None
+        if board is None:
+            return self.add_history(self.client.get_board(crs))
+        # a board the hub could not refresh is shown as of when it was fetched
+        fetched_at = self.hub.stale_since("trains", crs)
+        board = self.add_history(board)
+        return dict(board, fetched_at=fetched_at) if fetched_at else board
+
+    def add_history(self, board):
+        """Record the board, and add the usual delay of each service to a copy of it"""
+        if self.history is None:
+            return board
+        try:
+            self.history.record(board)
+        except Exception as e:
+            log.warning("Could not record departures: %s", e)
+        min_samples = self.config.get_train_history_min_samples()
+        services = [dict(t, usual_delay=self.history.usual_delay(board["crs"], t["std"], t["destination"], min_samples))
+                    for t in board["services"]]
+        return dict(board, services=services)
 
     def update_train_status(self):
         """Update train status"""
-        # Get trains
-        res = self.client.get_trains()
+        self.render(self.fetch())
+
+    def render(self, board, as_of: Optional[datetime] = None):
+        """Display a departure board, `as_of` when it is old (snapshot, stale hub data)"""
+        if board.get("fetched_at"):
+            as_of = datetime.fromtimestamp(board["fetched_at"])
+        # read the whole board before touching the screen, so bad data leaves the previous board
+        destination = self.config.get_train_stations()[1]
+        rows = [t for t in board["services"] if t["destination"] == destination]
+        statuses = [self.format_row(t) for t in rows]
+
         # Update header 
-        self.trainsHeaderLabel.setText("Trains at " + res.locationName + " -- Updated at " + datetime.now().strftime("%H:%M:%S"))
-
-        # Clear existing status
-        for label in self.train_labels:
-            label.deleteLater()
-        self.train_labels.clear()
-
-        for t in res.trainServices.service:
-            if t.destination.location[0].locationName == self.config.get_train_stations()[1]:
-                status = t.std + " to " + t.destination.location[0].locationName + " - " + t.etd
-                label = QtWidgets.QLabel(status)
-                font = QFont('Times', 20)
-                font.setBold(True)
-                label.setFont(font)
-                self.trainsLayout.addWidget(label)
-                self.train_labels.append(label)
+        updated = format_as_of(as_of) if as_of else "Updated at " + datetime.now().strftime("%H:%M:%S")
+        self.header_text = "Trains at " + board["location"] + " -- " + updated
+        self.trainsHeaderLabel.setText(self.header_text)
+
+        # Update the statuses in place
+        self.train_labels.set_texts(statuses)
+        self.board, self.rows = board, rows
+
+        # details of the first departures are fetched now, so tapping them is instant
+        # (not those of a snapshot, its services may have gone)
+        if as_of is None:
+            self.want_details([t["service_id"] for t in rows[:self.config.get_train_details_prefetch()]])
+
+    def format_row(self, t: Dict) -> str:
+        status = f"{t['std']} to {t['destination']} - {t['etd'] or ''}"
+        if t.get("usual_delay"):
+            status += f" (usually {t['usual_delay']} min late)"
+        if t["service_id"] is not None and t["service_id"] == self.expanded:
+            details = self.details.get(t["service_id"])
+            status += "\n" + (format_service_details(details) if details else "    Loading details...")
+        return status
+
+    def toggle_details(self, row: int):
+        """Show (or hide if shown) the details of the departure on `row`"""
+        if row >= len(self.rows):
+            return
+        service_id = self.rows[row]["service_id"]
+        self.expanded = None if service_id == self.expanded else service_id
+        if self.expanded is not None:
+            self.want_details([self.expanded], first=True)
+        self.train_labels.set_texts([self.format_row(t) for t in self.rows])
+
+    def want_details(self, service_ids: List[Optional[str]], first: bool = False):
+        """Queue the details of services that are not cached, `first` to fetch them before the others"""
+        missing = [service_id for service_id in service_ids if service_id and service_id not in self.details]
+        if not missing:
+            return
+        with self.details_lock:
+            queued = [service_id for service_id in self.wanted_details if service_id not in missing]
+            self.wanted_details = (missing + queued if first else queued + missing)[:DETAILS_CACHE_SIZE]
+        if self.request_details is not None:
+            self.request_details()
+
+    def fetch_details(self) -> List[str]:
+        """Fetch the queued service details in one batch (runs on a refresh thread)"""
+        with self.details_lock:
+            wanted, self.wanted_details = self.wanted_details, []
+        fetched = []
+        calls = 0
+        try:
+            for service_id in wanted:
+                if service_id not in self.details:
+                    # the refresh took the token of the first call, without one for the next the rest waits
+                    if calls and self.acquire is not None and not self.acquire():
+                        break
+                    calls += 1
+                    self.details.put(service_id, self.client.get_service_details(service_id))
+                fetched.append(service_id)
+        finally:
+            # whatever failed is tried again with the next batch
+            with self.details_lock:
+                self.wanted_details += [service_id for service_id in wanted if service_id not in fetched]
+        return fetched
+
+    def render_details(self, fetched: List[str]):
+        """Show the details of the expanded departure once they arrive"""
+        if self.expanded in fetched:
+            self.train_labels.set_texts([self.format_row(t) for t in self.rows])
+        # services left for lack of quota are fetched when the scheduler has tokens again
+        with self.details_lock:
+            left = bool(self.wanted_details)
+        if left and self.request_details is not None:
+            self.request_details()
+
+    def fetch_journeys(self):
+        """Connections of the saved journeys (runs on a refresh thread)"""
+        return self.journeys.fetch()
+
+    def render_journeys(self, journeys):
+        """Display the next options of each journey"""
+        lines = []
+        for journey in journeys:
+            if journey["missing"]:
+                lines.append(f"{journey['name']}: unavailable ({', '.join(journey['missing'])})")
+            elif not journey["options"]:
+                lines.append(f"{journey['name']}: no connection")
+            for option in journey["options"]:
+                legs = ", ".join(f"{leg['std']}{'' if leg['etd'] == 'On time' else ' (' + leg['etd'] + ')'} "
+                                 f"{leg['origin']}>{leg['destination']}" for leg in option["legs"])
+                lines.append(f"{journey['name']}: {legs} - arrive {option['arrival']}")
+        self.journey_labels.set_texts(lines)
+
+    def show_stale(self, last_success):
+        """Keep the last board on screen, flagged as out of date"""
+        self.trainsHeaderLabel.setText(f"{self.header_text} (stale, trains unavailable)" if last_success else "Trains : unavailable")
 
 def main():
     client = TrainGetter(SmartClockConfig('config.toml'))
@@ -0,0 +1,78 @@
+"""
+Loads smartclock.ui through a module compiled by pyuic (smartclock_ui.py), which is much faster
+than parsing the XML with uic.loadUi at every start. The compiled module records a hash of the
+.ui file it was generated from, and is regenerated when the .ui file changes.
+
+    python3 ui_loader.py      # (re)generate smartclock_ui.py, e.g. when deploying
+"""
+import os
+import sys
+import hashlib
+import logging
+import importlib
+
+log = logging.getLogger(__name__)
+
+UI_FILE = "smartclock.ui"
+COMPILED_MODULE = "smartclock_ui"
+
+
+def ui_hash(ui_file: str) -> str:
+    with open(ui_file, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def compile_ui(ui_file: str = UI_FILE, module: str = COMPILED_MODULE) -> str:
+    """Generate the python module for `ui_file`, returns its path"""
+    from PyQt5 import uic
+    path = os.path.join(os.path.dirname(os.path.abspath(ui_file)), module + ".py")
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            uic.compileUi(ui_file, f)
+            f.write(f"\nUI_SOURCE_HASH = '{ui_hash(ui_file)}'\n")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def _import_fresh(ui_file: str, module: str):
+    """The compiled module if it matches `ui_file`, None otherwise"""
+    try:
+        compiled = importlib.import_module(module)
+    except ImportError:
+        return None
+    if getattr(compiled, "UI_SOURCE_HASH", None) != ui_hash(ui_file):
+        return None
+    return compiled
+
+
+def load_ui(window, ui_file: str = UI_FILE, module: str = COMPILED_MODULE):
+    """Build the UI described by `ui_file` into `window`, like uic.loadUi(ui_file, window)"""
+    compiled = _import_fresh(ui_file, module)
+    if compiled is None:
+        try:
+            compile_ui(ui_file, module)
+            sys.modules.pop(module, None)
+            importlib.invalidate_caches()
+            compiled = _import_fresh(ui_file, module)
+        except Exception as e:
+            # pyuic raises its own errors (and the XML parser's) on a .ui file it cannot read
+            log.warning("Could not compile %s, loading it with uic.loadUi: %s", ui_file, e)
+            compiled = None
+    if compiled is None:
+        from PyQt5 import uic
+        uic.loadUi(ui_file, window)
+        return
+
+    ui = compiled.Ui_MainWindow()
+    ui.setupUi(window)
+    # expose the widgets as attributes of the window, as uic.loadUi does
+    for name, value in vars(ui).items():
+        setattr(window, name, value)
+
+
+if __name__ == "__main__":
+    print(f"Generated {compile_ui()}")
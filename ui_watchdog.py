@@ -0,0 +1,146 @@
+"""
+UI watchdog: the Qt event loop beats a heartbeat, a thread watches it. When the loop has been
+silent for `stall_seconds` (blocked in a SOAP call, a VLC parse...), the stacks of all threads
+are logged (dumped with faulthandler) and the stall is counted. Only when it lasts
+`restart_seconds` is the clock restarted: SmartClock.quit first, the process is ended if that
+cannot get through either, and start.sh starts it again.
+
+With every beat the UI thread hands over the state a new process should resume from (screen,
+station, volume, alarms armed); the watchdog thread writes it to a small JSON file when it changes.
+"""
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import faulthandler
+from collections import deque
+from typing import Callable, Dict, Optional
+from config import SmartClockConfig
+
+log = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 0.5
+# Time given to SmartClock.quit to close the clock before the process is ended
+QUIT_GRACE = 10
+RESTART_EXIT_CODE = 3
+# Stalls kept for the metrics
+RECENT_STALLS = 20
+
+
+def load_state(path: str) -> Optional[Dict]:
+    """State saved by the previous process, None if there is none"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def all_stacks() -> str:
+    """Stacks of all threads, as faulthandler prints them (it works even with the GIL held by a C call)"""
+    with tempfile.TemporaryFile("w+") as f:
+        faulthandler.dump_traceback(file=f, all_threads=True)
+        f.seek(0)
+        return f.read()
+
+
+def save_state(path: str, state: Dict):
+    """Write the state atomically, a restart in the middle must not leave half a file"""
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(state, f)
+    os.replace(temporary, path)
+
+
+class Watchdog:
+    def __init__(self, config: SmartClockConfig, quit: Callable[[], None], flush_logs: Callable[[], None]):
+        self.stall_seconds = config.get_watchdog_stall_seconds()
+        self.restart_seconds = config.get_watchdog_restart_seconds()
+        self.state_file = config.get_state_file()
+        self.quit = quit
+        self.flush_logs = flush_logs
+        self.last_beat = time.monotonic()
+        self.state: Optional[Dict] = None
+        self.saved_state: Optional[Dict] = None
+        # beat the current stall started after, None while the loop is alive
+        self.stalled_since: Optional[float] = None
+        self.stalls = 0
+        self.longest_stall = 0.0
+        self.restarts = 0
+        # (time.time() at the start, duration) of the last stalls
+        self.recent = deque(maxlen=RECENT_STALLS)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+
+    def start(self):
+        self.last_beat = time.monotonic()
+        self.thread.start()
+
+    def stop(self):
+        """Stop watching and save the last state (the clock is quitting)"""
+        self.stopped.set()
+        self._save_state()
+
+    def beat(self, state: Dict):
+        """Called from the UI thread: the event loop is alive, and this is what to resume from"""
+        self.last_beat = time.monotonic()
+        self.state = state
+
+    def _run(self):
+        while not self.stopped.wait(HEARTBEAT_INTERVAL):
+            last_beat = self.last_beat
+            silence = time.monotonic() - last_beat
+            if self.stalled_since is not None and last_beat > self.stalled_since:
+                self._stall_ended(last_beat)
+            if silence < self.stall_seconds:
+                self._save_state()
+            elif self.stalled_since is None:
+                self._stall_began(last_beat, silence)
+            elif silence >= self.restart_seconds:
+                self._restart(silence)
+
+    def _stall_began(self, last_beat: float, silence: float):
+        self.stalled_since = last_beat
+        self.stalls += 1
+        log.warning("UI thread stalled for %.1fs, stacks of all threads:\n%s", silence, all_stacks())
+
+    def _stall_ended(self, last_beat: float):
+        duration = last_beat - self.stalled_since
+        self.longest_stall = max(self.longest_stall, duration)
+        self.recent.append((time.time() - (time.monotonic() - self.stalled_since), duration))
+        log.warning("UI thread responsive again after %.1fs", duration)
+        self.stalled_since = None
+
+    def _restart(self, silence: float):
+        self.restarts += 1
+        log.error("UI thread stalled for %.0fs, restarting the clock", silence)
+        self._save_state()
+        self.quit()
+        if not self.stopped.wait(QUIT_GRACE):
+            log.critical("The clock did not quit, ending the process")
+            self.flush_logs()
+            os._exit(RESTART_EXIT_CODE)
+
+    def _save_state(self):
+        state = self.state
+        if state is None or state == self.saved_state:
+            return
+        try:
+            save_state(self.state_file, state)
+            self.saved_state = state
+        except OSError as e:
+            log.warning("Could not save the clock state: %s", e)
+
+    def stats(self) -> Dict:
+        silence = time.monotonic() - self.last_beat
+        return {
+            "stalled": self.stalled_since is not None,
+            "silence_s": round(silence, 3),
+            "stalls": self.stalls,
+            "longest_stall_s": round(self.longest_stall, 3),
+            "restarts": self.restarts,
+            "recent": [{"at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(at)), "duration_s": round(duration, 3)}
+                       for at, duration in self.recent],
+        }
@@ -1,22 +1,138 @@
 import requests
 import json
-import datetime
+import numpy as np
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QSizePolicy
-from PyQt5.QtGui import QPixmap
 from PyQt5.QtCore import Qt
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from config import SmartClockConfig
+from widgets import load_pixmap
+from snapshots import format_as_of
 
-class WeatherWidget(QWidget):
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+SECONDS_PER_DAY = 86400
+
+
+class Forecast:
+    """
+    The whole 3-hourly forecast as NumPy arrays, parsed once per refresh. The hourly strip and
+    the daily summary (grouped by local date of the forecast location) are both read from it.
+    """
+    def __init__(self, weather: Dict):
+        # the plain data, kept for the snapshot
+        self.weather = weather
+        self.current = weather["current"]
+        entries = weather["forecast"]
+        self.timezone = weather.get("timezone", 0)
+        self.dt = np.array([entry["dt"] for entry in entries], dtype=np.int64)
+        self.temp = np.array([entry["temp"] for entry in entries], dtype=np.float64)
+        self.rain = np.array([entry.get("rain", 0.0) for entry in entries], dtype=np.float64)
+        self.pop = np.array([entry.get("pop", 0.0) for entry in entries], dtype=np.float64)
+        self.icons = np.array([entry["icon"] for entry in entries])
+        self.local = self.dt + self.timezone
+        self.daily = self._summarise_days()
+
+    def hourly(self, count: int) -> List[Tuple[str, str]]:
+        """(icon, "HH:MM\nT°C") of the first `count` forecasts"""
+        minutes = (self.local[:count] % SECONDS_PER_DAY) // 60
+        temps = np.floor(self.temp[:count] + 0.5).astype(int)
+        return [(icon, f"{m // 60:02d}:{m % 60:02d}\n{t}°C") for icon, m, t in zip(self.icons[:count], minutes, temps)]
+
+    def _summarise_days(self) -> Dict[str, np.ndarray]:
+        """Min/max/mean temperature, total rain, highest chance of rain and dominant icon per local date"""
+        if len(self.dt) == 0:
+            return {"day": np.array([], dtype=np.int64)}
+        days = self.local // SECONDS_PER_DAY
+        # forecasts are in time order, so each day is a contiguous run starting at `starts`
+        day, starts, day_index = np.unique(days, return_index=True, return_inverse=True)
+        counts = np.diff(np.append(starts, len(days)))
+
+        # dominant icon: the most frequent of the day, ties going to the worse weather (higher code)
+        conditions = np.char.replace(self.icons, "n", "d")
+        codes, condition_index = np.unique(conditions, return_inverse=True)
+        occurrences = np.zeros((len(day), len(codes)), dtype=np.int64)
+        np.add.at(occurrences, (day_index, condition_index), 1)
+        severity = np.array([int(code[:2]) for code in codes])
+        dominant = codes[np.argmax(occurrences * 100 + severity, axis=1)]
+
+        return {
+            "day": day,
+            "weekday": (day + 3) % 7,  # 1970-01-01 was a Thursday
+            "min": np.minimum.reduceat(self.temp, starts),
+            "max": np.maximum.reduceat(self.temp, starts),
+            "mean": np.add.reduceat(self.temp, starts) / counts,
+            "rain": np.add.reduceat(self.rain, starts),
+            "pop": np.maximum.reduceat(self.pop, starts),
+            "icon": dominant,
+        }
+
+    def days(self, count: int) -> List[Tuple[str, str, str]]:
+        """(icon, day name, "max° / min°\nrain") of the first `count` days"""
+        daily = self.daily
+        rows = []
+        for i in range(min(count, len(daily["day"]))):
+            rain = f"{daily['rain'][i]:.1f} mm" if daily["rain"][i] >= 0.1 else f"{int(daily['pop'][i] * 100)}%"
+            rows.append((daily["icon"][i], DAY_NAMES[daily["weekday"][i]],
+                         f"{int(np.floor(daily['max'][i] + 0.5))}° / {int(np.floor(daily['min'][i] + 0.5))}°\n{rain}"))
+        return rows
+
+
+class WeatherFetcher:
     def __init__(self, config: SmartClockConfig):
+        self.location = config.get_weather_location()
+        self.api_key = config.get_weather_api_key()
+        self.url = config.get_weather_url()
+        self.timeout = config.get_network_timeouts()
+
+    def _get(self, endpoint: str, location: str) -> Dict:
+        url = f"{self.url}/{endpoint}?q={location}&appid={self.api_key}&units=metric"
+        response = requests.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return json.loads(response.text)
+
+    def fetch(self, location: Optional[str] = None) -> Dict:
+        """Current weather and forecast as plain data, with only the fields the clock uses"""
+        location = location or self.location
+        weather_data = self._get("weather", location)
+        forecast_data = self._get("forecast", location)
+        return {
+            "current": {
+                "icon": weather_data["weather"][0]["icon"],
+                "temp": weather_data["main"]["temp"],
+                "description": weather_data["weather"][0]["description"],
+            },
+            "forecast": [
+                {
+                    "dt": forecast["dt"],
+                    "icon": forecast["weather"][0]["icon"],
+                    "temp": forecast["main"]["temp"],
+                    "rain": forecast.get("rain", {}).get("3h", 0.0) + forecast.get("snow", {}).get("3h", 0.0),
+                    "pop": forecast.get("pop", 0.0),
+                }
+                for forecast in forecast_data["list"]
+            ],
+            # offset (seconds) of the location from UTC, the forecast is grouped by its local days
+            "timezone": forecast_data.get("city", {}).get("timezone", 0),
+        }
+
+
+class WeatherWidget(QWidget):
+    def __init__(self, config: SmartClockConfig, hub=None):
         super().__init__()
         self.count = 10
+        self.day_count = 5
         self.location = config.get_weather_location()
-        self.api_key = config.get_weather_api_key()
+        self.fetcher = WeatherFetcher(config)
+        self.hub = hub
         self.setup_ui()
 
     def setup_ui(self):
         layout = QVBoxLayout()
 
+        # Shown when the weather could not be refreshed
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
         # Current weather
         current_layout = QHBoxLayout()
         self.current_icon = QLabel()
@@ -38,26 +154,64 @@ class WeatherWidget(QWidget):
             forecast_layout.addLayout(day_layout)
         layout.addLayout(forecast_layout)
 
+        # Daily summary
+        daily_layout = QHBoxLayout()
+        self.day_names = [QLabel() for _ in range(self.day_count)]
+        self.day_icons = [QLabel() for _ in range(self.day_count)]
+        self.day_temps = [QLabel() for _ in range(self.day_count)]
+        for name, icon, temp in zip(self.day_names, self.day_icons, self.day_temps):
+            day_layout = QVBoxLayout()
+            day_layout.addWidget(name)
+            day_layout.addWidget(icon)
+            day_layout.addWidget(temp)
+            daily_layout.addLayout(day_layout)
+        layout.addLayout(daily_layout)
+
         self.setLayout(layout)
 
+    def fetch(self) -> Forecast:
+        """Get current weather and forecast (runs on a refresh thread)"""
+        weather = self.hub.get("weather", self.location) if self.hub is not None else None
+        if weather is None:
+            return Forecast(self.fetcher.fetch())
+        # weather the hub could not refresh is shown as of when it was fetched
+        fetched_at = self.hub.stale_since("weather", self.location)
+        return Forecast(dict(weather, fetched_at=fetched_at) if fetched_at else weather)
+
     def fetch_weather(self):
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={self.location}&appid={self.api_key}&units=metric"
-        response = requests.get(url)
-        weather_data = json.loads(response.text)
+        self.render(self.fetch())
+
+    def render(self, forecast: Forecast, as_of: Optional[datetime] = None):
+        """Display current weather, forecast and daily summary, `as_of` when they are old (snapshot, stale hub data)"""
+        if forecast.weather.get("fetched_at"):
+            as_of = datetime.fromtimestamp(forecast.weather["fetched_at"])
+        # read everything before touching the screen, so bad data leaves the previous weather
+        current_icon = forecast.current["icon"]
+        current_temp = int(forecast.current["temp"] + 0.5)
+        description = forecast.current["description"]
+        forecasts = forecast.hourly(self.count)
+        days = forecast.days(self.day_count)
 
         # Current weather
-        icon_code = weather_data["weather"][0]["icon"]
-        self.current_icon.setPixmap(QPixmap(f"icons/{icon_code}@2x.png"))
-        self.current_temp.setText(f"{int(weather_data['main']['temp'] + 0.5)}°C")
-        self.current_description.setText(weather_data["weather"][0]["description"])
+        self.status_label.setText(f"Weather {format_as_of(as_of)}" if as_of else "")
+        self.current_icon.setPixmap(load_pixmap(f"icons/{current_icon}@2x.png"))
+        self.current_temp.setText(f"{current_temp}°C")
+        self.current_description.setText(description)
 
         # Forecast
-        forecast_url = f"http://api.openweathermap.org/data/2.5/forecast?q={self.location}&appid={self.api_key}&units=metric"
-        forecast_response = requests.get(forecast_url)
-        forecast_data = json.loads(forecast_response.text)
-        #print(forecast_data)
-        for i, forecast in enumerate(forecast_data["list"][:self.count]):
-            icon_code = forecast["weather"][0]["icon"]
-            self.forecast_icons[i].setPixmap(QPixmap(f"icons/{icon_code}.png"))
-            time = datetime.datetime.fromtimestamp(forecast['dt']).strftime("%H:%M")
-            self.forecast_temps[i].setText(f"{time}\n{int(forecast['main']['temp'] + 0.5)}°C")
\ No newline at end of file
+        for i, (icon_code, text) in enumerate(forecasts):
+            self.forecast_icons[i].setPixmap(load_pixmap(f"icons/{icon_code}.png"))
+            self.forecast_temps[i].setText(text)
+
+        # Daily summary
+        for i, (icon_code, name, text) in enumerate(days):
+            self.day_names[i].setText(name)
+            self.day_icons[i].setPixmap(load_pixmap(f"icons/{icon_code}.png"))
+            self.day_temps[i].setText(text)
+
+    def show_stale(self, last_success):
+        """Keep the last weather on screen, flagged as out of date"""
+        if last_success:
+            self.status_label.setText(f"Weather unavailable, showing data from {last_success.strftime('%H:%M')}")
+        else:
+            self.status_label.setText("Weather unavailable")
@@ -0,0 +1,91 @@
+from typing import Callable, List, Optional
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QSize, pyqtSignal
+from PyQt5.QtGui import QFont, QPixmap, QPixmapCache
+
+
+class ClickableLabel(QtWidgets.QLabel):
+    """Label emitting `clicked` when tapped"""
+    clicked = pyqtSignal()
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        self.clicked.emit()
+
+
+class LabelList:
+    """
+    Column of labels in a layout, updated in place: labels are reused from one refresh to the
+    next instead of being deleted and created again, so a refresh allocates nothing in steady state.
+    With `on_click`, tapping a label calls it with the label's row. With `icon_size`, each row
+    starts with an icon (see set_icon).
+    """
+    def __init__(self, layout, font: QFont, on_click: Optional[Callable[[int], None]] = None,
+                 icon_size: Optional[QSize] = None):
+        self.layout = layout
+        self.font = font
+        self.on_click = on_click
+        self.icon_size = icon_size
+        self.labels: List[QtWidgets.QLabel] = []
+        self.icons: List[QtWidgets.QLabel] = []
+        # widgets added to the layout: the labels, or the rows holding icon and label
+        self.rows: List[QtWidgets.QWidget] = []
+
+    def set_texts(self, texts: List[str]):
+        for label, text in zip(self.labels, texts):
+            if label.text() != text:
+                label.setText(text)
+        while len(self.labels) < len(texts):
+            row = len(self.labels)
+            label = ClickableLabel(texts[row])
+            label.setFont(self.font)
+            if self.on_click is not None:
+                label.clicked.connect(lambda row=row: self.on_click(row))
+            self.labels.append(label)
+            if self.icon_size is None:
+                self.rows.append(label)
+            else:
+                self.rows.append(self._icon_row(label))
+            self.layout.addWidget(self.rows[-1])
+        while len(self.labels) > len(texts):
+            self.labels.pop()
+            if self.icons:
+                self.icons.pop()
+            self.rows.pop().deleteLater()
+
+    def _icon_row(self, label: QtWidgets.QLabel) -> QtWidgets.QWidget:
+        row = QtWidgets.QWidget()
+        layout = QtWidgets.QHBoxLayout(row)
+        layout.setContentsMargins(0, 0, 0, 0)
+        icon = QtWidgets.QLabel()
+        icon.setFixedSize(self.icon_size)
+        layout.addWidget(icon)
+        label.setWordWrap(True)
+        layout.addWidget(label, 1)
+        self.icons.append(icon)
+        return row
+
+    def set_icon(self, row: int, pixmap: Optional[QPixmap]):
+        """Icon of a row, None to leave it blank"""
+        if pixmap is None:
+            self.icons[row].clear()
+        else:
+            self.icons[row].setPixmap(pixmap)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+
+def bold_font(family: str, size: int) -> QFont:
+    font = QFont(family, size)
+    font.setBold(True)
+    return font
+
+
+def load_pixmap(path: str) -> QPixmap:
+    """Image file as a QPixmap, decoded once and kept in Qt's size-bounded pixmap cache"""
+    pixmap = QPixmapCache.find(path)
+    if pixmap is None:
+        pixmap = QPixmap(path)
+        QPixmapCache.insert(path, pixmap)
+    return pixmap